@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+'''
+Usage:
+    python3 benchmarks.py [name ...]
+
+        Run the named benchmarks (default all) and print one result line each.
+'''
+
+import os
+import sys
+import time
+import string
+import tempfile
+import subprocess
+
+from xdplayer import *
+
+
+class FakeColors(dict):
+    'Hand out a distinct int attr for every color string, like ColorMaker but without a terminal.'
+    def __missing__(self, k):
+        self[k] = len(self) << 8
+        return self[k]
+
+    def __hash__(self):
+        return id(self)
+
+
+class FakeScreen:
+    'Just enough of a curses window to draw on in memory and count the calls.'
+    def __init__(self, h=25, w=80):
+        self.h, self.w = h, w
+        self.colors = FakeColors()
+        self.getkeystroke = lambda: ''
+        self.naddstr = 0
+        self.erase()
+
+    def getmaxyx(self):
+        return self.h, self.w
+
+    def erase(self):
+        self.lines = [[(' ', 0)]*self.w for y in range(self.h)]
+        self.y = self.x = 0
+
+    clear = erase
+
+    def move(self, y, x):
+        self.y, self.x = y, x
+
+    def clrtoeol(self):
+        self.lines[self.y][self.x:] = [(' ', 0)]*(self.w-self.x)
+
+    def addstr(self, y, x, s, attr=0):
+        self.naddstr += 1
+        for i, ch in enumerate(s):
+            if 0 <= y < self.h and 0 <= x+i < self.w:
+                self.lines[y][x+i] = (ch, attr)
+
+    def __getattr__(self, k):
+        return lambda *args: None
+
+
+def fake_player(fn='samples/wsj110624.xd', h=25, w=80):
+    os.environ['TEAMDIR'] = tempfile.mkdtemp()
+    scr = FakeScreen(h, w)
+    opt.scr = scr
+    return CrosswordPlayer([fn]), scr
+
+
+def bench_idle_cpu(secs=3):
+    'Let the player event loop sit idle (no keys, no new guesses) and report the CPU it burns.'
+    plyr, scr = fake_player()
+    r, w = os.pipe()  # stands in for a quiet terminal
+    events = EventLoop(r)
+
+    wakeups = 0
+    wall0, cpu0 = time.time(), time.process_time()
+    while time.time() - wall0 < secs:
+        events.watch(*plyr.xd.watched)
+        events.wait(min(plyr.next_deadline(), wall0+secs))
+        plyr.xd.replay_guesses()
+        wakeups += 1
+    wall, cpu = time.time()-wall0, time.process_time()-cpu0
+
+    print(f'idle_cpu: {cpu*100/wall:.2f}% of a core, {wakeups/wall:.1f} wakeups/s over {wall:.1f}s')
+
+
+def bench_sync_latency(n=20):
+    'Append a guess every 50ms as a teammate would, and report how long until the event loop wakes for it.'
+    import threading
+    from xdplayer.events import InotifyWatcher, StatWatcher
+
+    for watcher in (InotifyWatcher(), StatWatcher()):
+        path = os.path.join(tempfile.mkdtemp(), 'guesses.jsonl')
+        open(path, 'w').close()
+        r, w = os.pipe()
+        events = EventLoop(r, watcher)
+        written = []
+
+        def teammate():
+            for i in range(n):
+                time.sleep(0.05)
+                written.append(time.time())
+                with open(path, 'a') as fp:
+                    fp.write('{}\n')
+        threading.Thread(target=teammate).start()
+
+        delays = []  # from each write to the wakeup that saw it
+        size = 0
+        while len(delays) < n:
+            events.watch(path, size)
+            if events.wait(time.time()+2) == 'guesses':
+                t = time.time()
+                delays.extend(t-written[i] for i in range(len(delays), len(written)))
+                size = os.stat(path).st_size
+        print(f'sync_latency: {type(watcher).__name__} median {sorted(delays)[n//2]*1000:.1f}ms, max {max(delays)*1000:.1f}ms')
+
+
+def bench_syncd(nclients=300, npuzzles=10, nrows=20):
+    'Have *nclients* simulated players each make *nrows* guesses through xdsyncd, and report how fast every teammate sees them.'
+    import json
+    import asyncio
+
+    teamdir = tempfile.mkdtemp()
+    addr = os.path.join(teamdir, '.xdsync.sock')
+    env = dict(os.environ, TEAMDIR=teamdir)
+    cpu0 = os.times()
+    daemon = subprocess.Popen([sys.executable, '-c', 'import asyncio; from xdplayer.syncd import SyncServer; asyncio.run(SyncServer().serve())'], env=env, stderr=subprocess.PIPE)
+    daemon.stderr.readline()  # "serving ..."
+
+    ready = []  # set once every player has subscribed
+    delays = []  # from each guess until a subscriber got it
+    nexpected = (nclients//npuzzles) * nrows  # rows each subscriber should get
+
+    async def player(i):
+        xdid = f'puzzle{i % npuzzles}'
+        reader, writer = await asyncio.open_unix_connection(addr, limit=1 << 20)
+        writer.write(json.dumps(dict(sub=xdid, pos=0, ino=None)).encode() + b'\n')
+        await ready[0].wait()
+
+        async def guess():
+            for j in range(nrows):
+                await asyncio.sleep(0.02 + (i*7 + j) % 10 / 250)
+                row = dict(xdid=xdid, x=j, y=i, ch='A', user=f'user{i}', t=time.time())
+                writer.write(json.dumps(dict(xdid=xdid, rows=[row])).encode() + b'\n')
+        task = asyncio.ensure_future(guess())
+
+        n = 0
+        while n < nexpected:
+            msg = json.loads(await reader.readline())
+            t = time.time()
+            for row in msg.get('rows', []):
+                delays.append(t - row['t'])
+                n += 1
+        await task
+        writer.close()
+
+    async def run():
+        ready.append(asyncio.Event())
+        players = [asyncio.ensure_future(player(i)) for i in range(nclients)]
+        await asyncio.sleep(0.5)  # all connected and subscribed
+        ready[0].set()
+        await asyncio.wait_for(asyncio.gather(*players), 120)
+
+    try:
+        t0 = time.time()
+        asyncio.run(run())
+        wall = time.time()-t0
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    cpu1 = os.times()  # the daemon is counted once it has exited
+    daemon_cpu = cpu1.children_user + cpu1.children_system - cpu0.children_user - cpu0.children_system
+
+    nlogged = sum(1 for fn in os.listdir(teamdir) if fn.endswith('.jsonl') for line in open(os.path.join(teamdir, fn)))
+    delays.sort()
+    print(f'syncd: {nclients} clients, {nlogged}/{nclients*nrows} rows logged, {len(delays)/wall:.0f} deliveries/s,'
+          f' latency median {delays[len(delays)//2]*1000:.1f}ms p99 {delays[len(delays)*99//100]*1000:.1f}ms,'
+          f' daemon {daemon_cpu:.1f}s CPU')
+
+
+def bench_keystroke_render(n=500):
+    'Type letters and move around, and report the draw cost per keystroke.'
+    plyr, scr = fake_player()
+    keys = list('ABCDEFGHIJ') + ['KEY_DOWN', 'KEY_LEFT', '^I']
+    plyr.play_one(scr, plyr.xd)
+
+    scr.naddstr = 0
+    t0 = time.process_time()
+    for i in range(n):
+        scr.getkeystroke = lambda k=keys[i % len(keys)]: k
+        plyr.play_one(scr, plyr.xd)
+    t = time.process_time()-t0
+
+    print(f'keystroke_render: {n/t:.0f} keystrokes/s, {scr.naddstr/n:.0f} addstr/keystroke')
+
+
+def bench_grid_fps(n=300):
+    'Repaint the whole 21x21 grid on a screen big enough to show it all, as after a resize or ^L.'
+    plyr, scr = fake_player(h=50, w=120)
+    xd = plyr.xd
+    for y in range(xd.nrows):  # some guesses by two solvers, so not every cell looks the same
+        for x in range(0, xd.ncols, 3):
+            if xd.grid[y][x] != '#':
+                xd.replay_guess(dict(x=x, y=y, ch='E', user='ab' if y % 2 else 'cd'))
+    plyr.play_one(scr, xd)
+
+    scr.naddstr = 0
+    t0 = time.process_time()
+    for i in range(n):
+        xd.redraw()
+        xd.draw(scr)
+    t = time.process_time()-t0
+    print(f'grid_fps: {n/t:.0f} full frames/s, {scr.naddstr/n:.0f} addstr/frame')
+
+
+def bench_tty_bytes(size=(40, 120)):
+    'Run the player in a pseudo-terminal and count the bytes it sends for each kind of keystroke, as over ssh.'
+    from statistics import median
+    from xdplayer.ttymeter import TtyMeter
+    env = dict(TERM='xterm-256color', TEAMDIR=tempfile.mkdtemp(), PYTHONPATH=os.getcwd())
+    meter = TtyMeter([sys.executable, 'bin/xdplayer', 'samples/wsj110624.xd', 'samples/saulpw-008.xd'], size, env)
+    try:
+        startup = meter.quiet(1.0)
+        meter.send(b'Z'); meter.quiet()  # the first guess adds the solver list
+        nframes = len(meter.frames)
+        sent = {}
+        for name, keys in [('letter', b'ABCDEFGHIJ'), ('arrow', b'\x1b[B\x1b[A'*5), ('tab', b'\t'*4), ('^N', b'\x0e'*2), ('^L', b'\x0c')]:
+            for i in range(0, len(keys), 3 if keys.startswith(b'\x1b') else 1):
+                meter.send(keys[i:i+3] if keys.startswith(b'\x1b') else keys[i:i+1])
+                sent.setdefault(name, []).append(meter.quiet())
+        frames = meter.frames[nframes:]
+        meter.send(b'\x11')
+        meter.quiet()
+    finally:
+        meter.close()
+    print(f'tty_bytes: {startup} bytes to start, then per keystroke ' + ', '.join(f'{name} {median(n):.0f}' for name, n in sent.items()) +
+          f'; {len(frames)} frames, {sum(n == 0 for n in frames)} of them empty, largest {max(frames)} bytes')
+
+
+def bench_animation(ntriggers=20, secs=2):
+    'Draw the completion animation, *ntriggers* of it at once, frame after frame for *secs* of animation time.'
+    from xdplayer.ddwplay import AnimationMgr, Animation, load_animation
+    os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp()
+    t0 = time.perf_counter()
+    for i in range(100):
+        Animation(open('xdplayer/ddw/completed.ddw'))
+    t1 = time.perf_counter()
+    load_animation('xdplayer/ddw/completed.ddw')  # compiles and caches it
+    t2 = time.perf_counter()
+    for i in range(100):
+        load_animation('xdplayer/ddw/completed.ddw')
+    t3 = time.perf_counter()
+    print(f'animation: completed.ddw loads in {(t1-t0)*10:.2f}ms from json, {(t3-t2)*10:.2f}ms from its cache')
+
+    scr = FakeScreen()
+    mgr = AnimationMgr()
+    mgr.load('completed', open('xdplayer/ddw/completed.ddw'))
+    for ntrig in (1, ntriggers):
+        mgr.active = []
+        for i in range(ntrig):
+            mgr.trigger('completed', loop=True, x=1, y=22)
+        startt = mgr.active[0][0]
+        scr.naddstr = 0
+        nframes = 0
+        t0 = time.perf_counter()
+        for i in range(secs*1000):
+            mgr.draw(scr, startt + i/1000)
+            nframes += 1
+        t = time.perf_counter()-t0
+        print(f'animation: {ntrig} at once, {t*1e6/nframes:.1f}us and {scr.naddstr/nframes:.1f} addstr per frame')
+
+
+def bench_startup(n=1000):
+    'Start a player on *n* distinct puzzle files, as xdlauncher does for the whole corpus.'
+    d = tempfile.mkdtemp()
+    contents = open('samples/wsj110624.xd').read()
+    paths = []
+    for i in range(n):
+        paths.append(os.path.join(d, f'puzzle{i}.xd'))
+        with open(paths[-1], 'w') as fp:
+            fp.write(contents)
+
+    plyr, scr = fake_player()
+    t0 = time.process_time()
+    plyr = CrosswordPlayer(paths)
+    t1 = time.process_time()
+    plyr.prefetch()
+    t2 = time.process_time()
+    plyr.next_crossword()
+    t3 = time.process_time()
+
+    print(f'startup: {(t1-t0)*1000:.1f}ms for {n} puzzles, prefetch {(t2-t1)*1000:.1f}ms, ^N {(t3-t2)*1000:.1f}ms')
+
+
+def bench_import(budget_ms=50):
+    'Time a fresh "from xdplayer import Crossword", as cron scripts do, against *budget_ms*.'
+    def import_us(stmt):
+        r = subprocess.run([sys.executable, '-X', 'importtime', '-c', stmt], capture_output=True, text=True)
+        return sum(int(line.split('|')[1]) for line in r.stderr.splitlines() if line.split('|')[-1].strip() == 'xdplayer' or line.endswith('| xdplayer.player'))
+
+    model = min(import_us('from xdplayer import Crossword') for i in range(5))
+    player = min(import_us('from xdplayer import main_player') for i in range(3))
+    verdict = 'ok' if model < budget_ms*1000 else 'OVER BUDGET'
+    print(f'import: model {model/1000:.1f}ms ({verdict}, budget {budget_ms}ms), player {player/1000:.1f}ms')
+
+
+def bench_hints(nwords=300000, nqueries=2000):
+    'Look up patterns with half their letters known in a word list the size of a large corpus, as the hint key does.'
+    import re
+    import random
+    from xdplayer.wordlist import WordList, write_wordlist
+    rng = random.Random(0)
+    freqs = [12, 2, 3, 4, 13, 2, 2, 6, 7, 1, 1, 4, 2, 7, 8, 2, 1, 6, 6, 9, 3, 1, 2, 1, 2, 1]  # of A-Z in English, roughly
+    counts = {}
+    while len(counts) < nwords:
+        word = ''.join(rng.choices(string.ascii_uppercase, freqs, k=rng.choice([3, 4, 4, 5, 5, 5, 6, 6, 7, 7, 8, 9, 10, 11, 12, 15])))
+        counts[word] = rng.randrange(1, 100)
+
+    fn = os.path.join(tempfile.mkdtemp(), 'xd.words')
+    t0 = time.perf_counter()
+    write_wordlist(fn, counts)
+    t1 = time.perf_counter()
+    words = WordList(fn)
+    t2 = time.perf_counter()
+
+    patterns = []
+    for word in rng.sample(sorted(counts), nqueries):
+        patterns.append(''.join(ch if rng.random() < .5 else '?' for ch in word))
+    t3 = time.perf_counter()
+    nfound = sum(len(words.match(pattern)) for pattern in patterns)
+    t4 = time.perf_counter()
+
+    # scanning the words of the same length instead, for comparison
+    bylen = {}
+    for word in sorted(counts, key=counts.get, reverse=True):
+        bylen[len(word)] = bylen.get(len(word), '') + word + '\n'
+    t5 = time.perf_counter()
+    for pattern in patterns[:200]:
+        re.findall('^' + pattern.replace('?', '.') + '$', bylen[len(pattern)], re.M)[:20]
+    t6 = time.perf_counter()
+
+    print(f'hints: {nqueries/(t4-t3):.0f} queries/s ({nfound/nqueries:.1f} words each) vs {200/(t6-t5):.0f}/s by scanning,'
+          f' {nwords} words in {os.path.getsize(fn)/1e6:.1f}MB, written in {t1-t0:.1f}s, mapped in {(t2-t1)*1000:.2f}ms')
+
+
+def bench_autofill(nwords=100000):
+    'Fill an empty 15x15 from a word list of its answers and *nwords* others.'
+    import random
+    from xdplayer.wordlist import WordList, write_wordlist
+    from xdplayer.autofill import Autofill
+    xd = Crossword('samples/saulpw-008.xd')
+    rng = random.Random(0)
+    freqs = [12, 2, 3, 4, 13, 2, 2, 6, 7, 1, 1, 4, 2, 7, 8, 2, 1, 6, 6, 9, 3, 1, 2, 1, 2, 1]
+    counts = {xd.answer(dirnum): 1 for dirnum in xd.clues}
+    while len(counts) < nwords:
+        counts[''.join(rng.choices(string.ascii_uppercase, freqs, k=rng.randrange(3, 16)))] = rng.randrange(1, 100)
+    fn = os.path.join(tempfile.mkdtemp(), 'xd.words')
+    write_wordlist(fn, counts)
+    blank = [''.join('#' if ch == '#' else '.' for ch in row) for row in xd.solution]
+
+    t0 = time.perf_counter()
+    fill = next(Autofill(blank, WordList(fn)).fills(), None)
+    t1 = time.perf_counter()
+    print(f'autofill: 15x15 from {nwords} words {"filled" if fill else "not filled"} in {(t1-t0)*1000:.0f}ms')
+
+
+def bench_puz_load(n=2000):
+    'Parse a .puz over and over, with and without checksum validation.'
+    from xdplayer import puz
+    data = open('samples/saulpw-008.puz', 'rb').read()
+    for validate in (True, False):
+        t0 = time.process_time()
+        for i in range(n):
+            puz.load(data, validate=validate)
+        t = time.process_time()-t0
+        print(f'puz_load: {n/t:.0f} loads/s (validate={validate})')
+
+
+def bench_puz_scan(n=2000):
+    'Pull titles and authors out of a directory of *n* .puz files, by scan() and by reading each whole.'
+    from xdplayer import puz
+    d = tempfile.mkdtemp()
+    data = open('samples/saulpw-008.puz', 'rb').read()
+    for i in range(n):
+        with open(os.path.join(d, f'puzzle{i}.puz'), 'wb') as fp:
+            fp.write(data)
+    paths = sorted(os.path.join(d, fn) for fn in os.listdir(d))
+
+    t0 = time.process_time()
+    for fn in paths:
+        p = puz.read(fn, validate=False)
+        p.title, p.author
+    t1 = time.process_time()
+    for fn, meta, err in puz.scan(d):
+        pass
+    t2 = time.process_time()
+    print(f'puz_scan: {n/(t1-t0):.0f} files/s by read(), {n/(t2-t1):.0f} files/s by scan()')
+
+
+def bench_puz_unlock():
+    'Recover the key of a locked 15x15 .puz by trying all of them.'
+    from xdplayer import puz
+    p = puz.read('samples/saulpw-008.puz')
+    p.lock_solution(4321)
+    t0 = time.perf_counter()
+    key = p.recover_key()
+    t = time.perf_counter()-t0
+    print(f'puz_unlock: found {key} in {t*1000:.0f}ms')
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or [k[6:] for k in list(globals()) if k.startswith('bench_')]
+    for name in names:
+        globals()['bench_'+name]()
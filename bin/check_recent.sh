@@ -4,11 +4,5 @@ BINDIR=/opt/xdplayer/bin
 
 TEAMDIR=/opt/teams
 
-for TEAMID in $TEAMDIR/* ; do
-  for guesspath in $(find $TEAMID -name \*.jsonl -mmin -60) ; do
-    guessfn=$(basename -- "$guesspath")
-    xdid=${guessfn%%.xd-guesses.jsonl}
-    xdpath="$($BINDIR/xdid2path.py $xdid)"
-    TEAMDIR="$TEAMID" $BINDIR/xdiff.py $xdpath
-  done
-done
+# grade the new guesses of every team at once; see xdgrade.py
+$BINDIR/xdgrade.py $TEAMDIR
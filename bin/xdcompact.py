@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+'''
+    Usage:  xdcompact.py <golden.xd> ...
+
+        Rewrite $TEAMDIR/<xdid>.xd-guesses.jsonl for each puzzle as a single snapshot of its current state,
+        so it replays instantly.  Safe to run while the puzzle is being played.
+        $TEAMDIR must be set.  With $XDSTORE=sqlite, replaces the puzzle's entries in $TEAMDIR/guesses.db instead.
+'''
+
+import os
+import sys
+
+from xdplayer import Crossword
+
+
+def main_compact(fn):
+    xd = Crossword(fn)
+    if xd.store.name != 'jsonl':
+        xd.compact_guesses()
+        print(f'{xd.xdid}: compacted')
+        return
+    if not os.path.exists(xd.guessfn):
+        return
+    before = os.stat(xd.guessfn).st_size
+    xd.compact_guesses()
+    print(f'{xd.guessfn}: {before} -> {os.stat(xd.guessfn).st_size} bytes')
+
+
+if __name__ == '__main__':
+    if not sys.argv[1:]:
+        print(__doc__)
+    for fn in sys.argv[1:]:
+        main_compact(fn)
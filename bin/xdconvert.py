@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+'''
+    Usage:  xdconvert.py [-j N] [--hash] [--clear] [--no-validate] <outdir> <file.puz|dir|glob> ...
+
+        Convert many .puz files to .xd in <outdir>, across N processes (default one per core).
+        A directory converts every .puz under it, keeping its subdirectories.
+        Outputs newer than their .puz are skipped, or with --hash, those whose .puz
+        has the same sha1 as when it was last converted (kept in <outdir>/.xdconvert-sha1.json).
+        --clear writes unsolved grids; --no-validate skips the .puz checksums.
+        Files that fail to convert are listed and the run carries on.
+'''
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+from xdplayer.puz2xd import convert_all
+
+
+def find_puz(outdir, args):
+    'Generate (puzfn, xdfn) for every .puz named by *args*.'
+    for arg in args:
+        if os.path.isdir(arg):
+            for dirpath, dirnames, filenames in os.walk(arg):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    if fn.endswith('.puz'):
+                        relpath = os.path.relpath(os.path.join(dirpath, fn), arg)
+                        yield os.path.join(dirpath, fn), os.path.join(outdir, relpath[:-4] + '.xd')
+        else:
+            for fn in sorted(glob.glob(arg, recursive=True)) if glob.has_magic(arg) else [arg]:
+                yield fn, os.path.join(outdir, os.path.splitext(os.path.basename(fn))[0] + '.xd')
+
+
+def main_convert():
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('--hash', action='store_true')
+    parser.add_argument('--clear', action='store_true')
+    parser.add_argument('--no-validate', action='store_true')
+    parser.add_argument('outdir')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    hashfn = os.path.join(args.outdir, '.xdconvert-sha1.json')
+    hashes = {}
+    if args.hash and os.path.exists(hashfn):
+        with open(hashfn) as fp:
+            hashes = json.load(fp)
+
+    jobs = []
+    outputs = {}
+    nfailed = 0
+    for puzfn, xdfn in find_puz(args.outdir, args.paths):
+        if xdfn in outputs:
+            print(f'{puzfn}: skipped, {xdfn} is already the output for {outputs[xdfn]}', file=sys.stderr)
+            nfailed += 1
+            continue
+        outputs[xdfn] = puzfn
+        os.makedirs(os.path.dirname(xdfn) or '.', exist_ok=True)
+        kwargs = dict(clear=args.clear, validate=not args.no_validate,
+                      mode='hash' if args.hash else 'mtime', known_hash=hashes.get(xdfn))
+        jobs.append((puzfn, xdfn, kwargs))
+
+    counts = dict(converted=0, skipped=0, failed=nfailed)
+    t0 = time.time()
+    try:
+        for puzfn, xdfn, status, result in convert_all(jobs, args.jobs):
+            counts[status] += 1
+            if status == 'failed':
+                print(f'{puzfn}: {result}', file=sys.stderr)
+            elif result:
+                hashes[xdfn] = result
+    finally:
+        if args.hash:
+            with open(hashfn, 'w') as fp:
+                json.dump(hashes, fp, indent=0, sort_keys=True)
+
+    secs = time.time() - t0
+    print(f'{counts["converted"]} converted, {counts["skipped"]} up to date, {counts["failed"]} failed'
+          f' in {secs:.1f}s ({len(jobs)/max(secs, 1e-6):.0f} files/s)')
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_convert())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+'''
+    Usage:  xdfill.py [--unique] <file.xd|file.puz> ...
+
+        Fill the grid of each puzzle, keeping only its blocks, with answers from the
+        word list written by xdimport.py ($XDWORDS, default xd.words next to $XDDB),
+        and print the fill.  With --unique, instead report whether the puzzle's own
+        solution is the only fill of its grid.
+'''
+
+import sys
+import time
+import argparse
+import itertools
+
+from xdplayer.crossword import Crossword
+from xdplayer.wordlist import WordList, wordlist_path
+from xdplayer.autofill import Autofill
+
+
+def main_fill():
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument('--unique', action='store_true')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    words = WordList(wordlist_path())
+    nfailed = 0
+    for fn in args.paths:
+        t0 = time.time()
+        xd = Crossword(fn)
+        grid = [''.join('#' if ch == '#' else '.' for ch in row) for row in xd.grid]
+        if args.unique:
+            fills = list(itertools.islice(Autofill(grid, words).fills(), 2))
+            solution = [''.join(ch if len(ch) == 1 else '.' for ch in row) for row in xd.solution]  # a rebus matches any letter
+            if len(fills) != 1:
+                result = ['no fill', '', 'not unique'][len(fills)]
+            elif all(a == b or b == '.' for fillrow, solnrow in zip(fills[0], solution) for a, b in zip(fillrow, solnrow)):
+                result = 'unique'
+            else:
+                result = 'unique, but not its solution'
+            print(f'{fn}: {result} ({time.time()-t0:.2f}s)')
+            nfailed += result != 'unique'
+        else:
+            fill = next(Autofill(grid, words).fills(), None)
+            print(f'{fn}: {"filled" if fill else "no fill"} in {time.time()-t0:.2f}s')
+            for row in fill or []:
+                print(row)
+            nfailed += not fill
+    return 1 if nfailed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_fill())
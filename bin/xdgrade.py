@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+'''
+    Usage:  xdgrade.py [-j N] [--all] <teamsdir> ...
+
+        Grade the guesses of every team (each subdirectory of <teamsdir>) into the
+        solvings table of $XDDB, across N processes (default one per core).
+        Only puzzles with new guesses since the last run are graded, replaying just
+        those guesses; --all regrades every puzzle from its last checkpoint.
+        Guesses are read from the store given by $XDSTORE, as the players do.
+'''
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+from xdplayer.grading import find_jobs, grade_all, save_results
+
+
+def main_grade():
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('--all', action='store_true')
+    parser.add_argument('teamsdirs', nargs='+')
+    args = parser.parse_args()
+
+    teamdirs = sorted(os.path.join(d, fn) for d in args.teamsdirs for fn in os.listdir(d) if os.path.isdir(os.path.join(d, fn)))
+
+    t0 = time.time()
+    conn = sqlite3.connect(os.getenv('XDDB', 'xd.db'))
+    jobs = list(find_jobs(conn, teamdirs, everything=args.all))
+
+    results = []
+    nfailed = nreplayed = 0
+    for teamid, xdid, progress, result, err in grade_all(jobs, args.jobs):
+        if err:
+            print(f'{teamid}/{xdid}: {err}', file=sys.stderr)
+            nfailed += 1
+        else:
+            results.append((teamid, xdid, progress, result))
+            nreplayed += result['nreplayed']
+    save_results(conn, results)
+
+    print(f'{len(results)} graded ({nreplayed} new guesses replayed), {nfailed} failed,'
+          f' across {len(teamdirs)} teams in {time.time()-t0:.1f}s')
+    return 1 if nfailed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_grade())
@@ -9,31 +9,29 @@
 
 import os
 import sys
-import stat
 import sqlite3
 import time
 from pathlib import Path
 
 from xdplayer import Crossword
 
-def is_submitted(fn):
-    'Return True if exists and is readonly.'
-    g = Path(fn).stat()
-    if g and not (g.st_mode & stat.S_IWUSR):
-        return 1
-    return 0
+def is_submitted(xd):
+    'Return 1 if the guesses for *xd* were submitted.'
+    progress = xd.store.progress([xd.xdid]).get(xd.xdid)
+    return 1 if progress and progress.submitted else 0
 
 def main_diff(fn):
     xd = Crossword(fn)
+    xd.replay_guesses()
     correct = xd.grade()
-    teamid = str(xd.guessfn).split('/')[-2]
+    teamid = Path(os.getenv('TEAMDIR', '.')).resolve().name
 
     conn = sqlite3.connect(os.getenv('XDDB', 'xd.db'))
     curs = conn.cursor()
 
     curs.execute('''INSERT OR REPLACE INTO solvings (xdid, teamid, date_checked, correct, nonblocks, submitted) VALUES (?, ?, ?, ?, ?, ?)''', (Path(fn).stem, teamid,
                 time.strftime("%Y-%m-%d %H:%M:%S"),
-                correct, xd.ncells, is_submitted(xd.guessfn)))
+                correct, xd.ncells, is_submitted(xd)))
 
     conn.commit()
 
@@ -1,73 +1,112 @@
 #!/usr/bin/env python3
 
-# Usage: ./xdimport.py <output_folder> <file.xd/puz ...>
+'''
+    Usage:  xdimport.py [-j N] <file.xd|file.puz|dir> ...
 
-# Record metadata for one or more puzzles to sqlite db 'xdmeta' table.
-# Save unsolved versions into <output_folder>.
+        Record metadata for puzzles in the xdmeta table of $XDDB (default xd.db), parsing
+        across N processes (default one per core).  A directory imports every .xd and .puz
+        under it.  Files imported before are skipped unless their mtime and sha1 have
+        changed, and then their row is updated.  A puzzle whose xdid was imported from
+        another file is reported and skipped.  Clues and answers are indexed too, for
+        xdsearch.py, and the answers written to the word list for the players' hints
+        ($XDWORDS, default xd.words next to $XDDB).
+'''
 
 import os
 import sys
-import stat
+import time
 import sqlite3
+import argparse
 from pathlib import Path
+from collections import Counter
 
-from xdplayer import Crossword
+from xdplayer.catalog import SCHEMA, VERSION, import_all, save_rows, answer_counts
+from xdplayer.wordlist import wordlist_path, write_wordlist
+
+
+BATCH = 1000  # rows per transaction
+
+
+def find_files(args):
+    for arg in args:
+        if os.path.isdir(arg):
+            for dirpath, dirnames, filenames in os.walk(arg):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    if fn.endswith(('.xd', '.puz')):
+                        yield os.path.join(dirpath, fn)
+        else:
+            yield arg
 
 
 def main_import():
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
     conn = sqlite3.connect(os.getenv('XDDB', 'xd.db'))
-    curs = conn.cursor()
-    curs.execute('''CREATE TABLE IF NOT EXISTS xdmeta (
-                    xdid TEXT NOT NULL PRIMARY KEY,
-                    path TEXT,
-                    size TEXT,
-                    title TEXT,
-                    author TEXT,
-                    editor TEXT,
-                    copyright TEXT,
-                    date_published TEXT,
-                    A1 TEXT,
-                    D1 TEXT
-                    )''')
-
-    curs.execute('''CREATE TABLE IF NOT EXISTS solvings (
-                    xdid TEXT NOT NULL,
-                    teamid TEXT NOT NULL,
-                    date_checked TEXT,
-                    correct INT,
-                    nonblocks INT,
-                    submitted INT,
-                    PRIMARY KEY (xdid, teamid))''')
-
-
-    for fn in sys.argv[1:]:
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.executescript(SCHEMA)
+    if version < VERSION:  # read everything again, to fill in what an older xdimport left out
+        known = {}
+    else:
+        known = {path: (mtime, sha1) for path, mtime, sha1 in conn.execute('SELECT path, mtime, sha1 FROM xdfiles')}
+    answers = {a for a, in conn.execute('SELECT answer FROM answers')}
+    owners = dict(conn.execute('SELECT xdid, path FROM xdmeta'))  # xdid -> path imported from
+
+    t0 = time.time()
+    counts = Counter()
+    jobs = []
+    for fn in find_files(args.paths):
         try:
-            xd = Crossword(fn)
-        except Exception:
-            print(f'Skipped {fn}, was not imported')
+            mtime = os.stat(fn).st_mtime
+        except OSError as e:
+            print(f'Skipped {fn}, was not imported: {e}', file=sys.stderr)
+            counts['failed'] += 1
             continue
-        xdid = Path(fn).stem
-        for dir, num, answer, r, c in xd.iteranswers_full():
-            if dir == 'A' and num == 1:
-                a1 = answer
-            elif dir == 'D' and num == 1:
-                d1 = answer
+        old = known.get(str(Path(fn).absolute()))
+        if old and old[0] == mtime:
+            counts['unchanged'] += 1
+        else:
+            jobs.append((fn, mtime, old and old[1]))
 
-        try:
-            curs.execute('''INSERT INTO xdmeta (xdid, path, size, title, author, editor, copyright, date_published, A1, D1) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (xdid, str(Path(fn).absolute()),
-                    f'{xd.ncols}x{xd.nrows}',
-                    xd.meta.get('Title', ''),
-                    xd.meta.get('Author', ''),
-                    xd.meta.get('Editor', ''),
-                    xd.meta.get('Copyright', ''),
-                    xd.meta.get('Date', ''),
-                    a1, d1))
-        except sqlite3.IntegrityError:
-            print(f"Failed to insert {fn}, already in database")
+    rows, clues, files = [], [], []
+    lastt = time.time()
+    for i, (fn, mtime, sha1, puzzle, err) in enumerate(import_all(jobs, args.jobs), 1):
+        path, xdid = str(Path(fn).absolute()), Path(fn).stem
+        if err:
+            print(f'Skipped {fn}, was not imported: {err}', file=sys.stderr)
+            counts['failed'] += 1
+            continue
+        if puzzle is None:
+            counts['unchanged'] += 1  # touched, but the same
+        elif owners.get(xdid, path) != path:
+            print(f'Failed to insert {fn}, already in database from {owners[xdid]}', file=sys.stderr)
+            counts['failed'] += 1
             continue
+        else:
+            counts['updated' if xdid in owners else 'imported'] += 1
+            owners[xdid] = path
+            rows.append(puzzle[0])
+            clues.extend(puzzle[1])
+        files.append((path, xdid, mtime, sha1))
 
+        if len(files) >= BATCH:
+            save_rows(conn, rows, clues, files, answers)
+            rows, clues, files = [], [], []
+        if time.time() - lastt >= 1:
+            lastt = time.time()
+            print(f'{i}/{len(jobs)} files read, {i/(lastt-t0):.0f} files/s', file=sys.stderr)
+    save_rows(conn, rows, clues, files, answers)
+    conn.execute(f'PRAGMA user_version={VERSION}')
+    if counts['imported'] or counts['updated'] or not os.path.exists(wordlist_path()):
+        write_wordlist(wordlist_path(), answer_counts(conn))
 
-    conn.commit()
+    secs = time.time() - t0
+    n = sum(counts.values())
+    print(f'{counts["imported"]} imported, {counts["updated"]} updated, {counts["unchanged"]} unchanged, {counts["failed"]} failed'
+          f' in {secs:.1f}s ({n/max(secs, 1e-6):.0f} files/s)')
 
 
 if __name__ == '__main__':
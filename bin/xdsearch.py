@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+'''
+    Usage:  xdsearch.py [-n N] <words> ...
+            xdsearch.py [-n N] -a <pattern>
+
+        Search the clues imported into $XDDB (default xd.db) by xdimport.py, for those
+        containing <words> in order, or with -a, for those whose answers match <pattern>,
+        like A?P?E ("?" or "." for any letter).  Prints up to N (default 100) matches
+        as xdid, clue number, answer and clue, tab-separated.
+'''
+
+import os
+import sys
+import sqlite3
+import argparse
+
+from xdplayer.catalog import search_clues, search_answers
+
+
+def main_search():
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument('-n', '--limit', type=int, default=100)
+    parser.add_argument('-a', '--answer', action='store_true')
+    parser.add_argument('words', nargs='+')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(os.getenv('XDDB', 'xd.db'))
+    text = ' '.join(args.words)
+    try:
+        results = search_answers(conn, text, args.limit) if args.answer else search_clues(conn, text, args.limit)
+    except (ValueError, sqlite3.Error) as e:
+        print(f'xdsearch: {e}', file=sys.stderr)
+        return 2
+
+    for xdid, dirnum, clue, answer in results:
+        print(xdid, dirnum, answer, clue, sep='\t')
+    return 0 if results else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main_search())
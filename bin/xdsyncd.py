@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+
+'''
+    Usage:  xdsyncd.py [<socket path>|<host>:<port>]
+
+        Relay guesses between the players of $TEAMDIR on this machine, so each sees
+        the others' as soon as they are made, and append them to the guess logs.
+        Listens on $XDSYNC, else $TEAMDIR/.xdsync.sock; players look for it there
+        and use the guess logs directly when it is not running.
+'''
+
+import sys
+import asyncio
+
+from xdplayer.syncd import SyncServer
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(SyncServer().serve(sys.argv[1] if sys.argv[1:] else None))
+    except KeyboardInterrupt:
+        pass
@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import errno
+import string
+import tempfile
+import subprocess
 from xdplayer import *
 from unittest.mock import Mock
 
@@ -78,5 +84,774 @@ def test_moves():
     t.report()
 
 
+def guess_state(xd):
+    xd.replay_guesses()
+    return (xd.grid, {k:v for k, v in xd.guesser.items() if v}, dict(xd.guessercolors), xd.rebus, dict(xd.notes))
+
+
+def test_guess_log():
+    os.environ['TEAMDIR'] = tempfile.mkdtemp()
+    xd = Crossword('samples/wsj110624.xd')
+    xd.snapshot_every = 5
+    for i, ch in enumerate('ABCDEFGHIJ'):
+        xd.setAt(i % 5, 0, ch, user=f'user{i % 3}')
+        xd.journal.flush()
+        xd.replay_guesses()
+    xd.setAt(2, 1, 'HEART')
+    xd.writeEntry(dirnum='A1', note='hmm', time=0)
+    assert not os.path.exists(xd.guessfn) or 'HEART' not in open(xd.guessfn).read()  # still in the journal
+    xd.journal.flush()
+    state = guess_state(xd)
+
+    with open(xd.guessfn) as fp:
+        assert sum(1 for line in fp if line.startswith('{"snapshot"')) == 2
+    assert guess_state(Crossword('samples/wsj110624.xd')) == state
+
+    # compacted while another player has it open
+    other = Crossword('samples/wsj110624.xd')
+    other.replay_guesses()
+    xd.compact_guesses()
+    with open(xd.guessfn) as fp:
+        assert len(fp.readlines()) == 1
+    assert guess_state(Crossword('samples/wsj110624.xd')) == state
+
+    xd.setAt(3, 1, 'Z', user='user9')
+    xd.journal.flush()
+    assert guess_state(other) == guess_state(xd)
+
+    def disk_full(path, rows, sync=False):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+    xd.setAt(4, 1, 'Y', user='user9')
+    xd.journal.append = disk_full
+    try:
+        xd.journal.flush()
+        assert False, 'append did not fail'
+    except OSError:
+        pass
+    xd.journal.append = xd.append_rows
+    xd.journal.flush()  # the row is still waiting
+    assert guess_state(Crossword('samples/wsj110624.xd')) == guess_state(xd)
+
+    # replaying our own flushed rows doesn't revert a newer one still waiting
+    xd.setAt(0, 2, 'P', user='user9')
+    xd.journal.flush()
+    xd.setAt(0, 2, 'Q', user='user9')
+    xd.replay_guesses()
+    assert xd.grid[2][0] == 'Q'
+    xd.reset_guesses()  # as when the log was compacted
+    xd.replay_guesses()
+    assert xd.grid[2][0] == 'Q'
+    xd.journal.flush()
+    assert guess_state(Crossword('samples/wsj110624.xd')) == guess_state(xd)
+
+    # two players replaying the same rows: only one of them appends a snapshot
+    os.environ['TEAMDIR'] = tempfile.mkdtemp()
+    a, b = Crossword('samples/wsj110624.xd'), Crossword('samples/wsj110624.xd')
+    a.snapshot_every = b.snapshot_every = 5
+    for i, ch in enumerate('ABCDE'):
+        a.setAt(i, 0, ch, user='a')
+        a.journal.flush()
+        a.replay_guesses()  # appends a snapshot after E
+        b.replay_guesses()  # and then reaches 5 rows too, just past a's snapshot
+    with open(a.guessfn) as fp:
+        assert sum(1 for line in fp if line.startswith('{"snapshot"')) == 1
+    assert guess_state(Crossword('samples/wsj110624.xd')) == guess_state(a) == guess_state(b)
+    print('guess log tests passed')
+
+
+def test_counts():
+    import random
+    os.environ['TEAMDIR'] = tempfile.mkdtemp()
+    xd = Crossword('samples/saulpw-008.xd')
+    cells = [(x, y) for y in range(xd.nrows) for x in range(xd.ncols) if xd.grid[y][x] != '#']
+
+    def check():
+        filled = [(x, y) for x, y in cells if xd.grid[y][x] != UNFILLED]
+        assert xd.nsolved == len(filled)
+        assert xd.grade() == sum(1 for x, y in filled if xd.grid[y][x] == xd.solution[y][x])
+        for user in ['user0', 'user1', 'user2']:
+            assert xd.user_nfilled[user] == sum(1 for x, y in filled if xd.guesser[(x, y)].get('user') == user)
+        for wid, clue in enumerate(xd.words):
+            assert xd.word_nfilled[wid] == sum(1 for x, y in clue.coords if xd.grid[y][x] != UNFILLED)
+            assert xd.is_word_complete(clue.dir+str(clue.num)) == all(xd.grid[y][x] != UNFILLED for x, y in clue.coords)
+
+    for i in range(300):
+        x, y = random.choice(cells)
+        ch = random.choice([xd.solution[y][x], 'Q', UNFILLED])
+        xd.setAt(x, y, ch, user=f'user{i % 3}')
+        if i % 50 == 0:
+            xd.journal.flush()
+            xd.replay_guesses()
+        check()
+
+    xd.journal.flush()
+    snap = xd.snapshot()
+    xd.reset_guesses()
+    assert xd.nsolved == 0
+    xd.restore(snap)
+    check()
+    xd.solve()
+    assert xd.nsolved == xd.ncells
+    check()
+    print('count tests passed')
+
+def test_stores():
+    for kind in ('jsonl', 'sqlite'):
+        os.environ['TEAMDIR'] = tempfile.mkdtemp()
+        os.environ['XDSTORE'] = kind
+        try:
+            a, b = Crossword('samples/wsj110624.xd'), Crossword('samples/wsj110624.xd')
+            assert a.store is b.store and a.store.name == kind
+            a.snapshot_every = 3
+            for i, ch in enumerate('ABCDE'):
+                a.setAt(i, 0, ch, user='a')
+                a.journal.flush()
+                a.replay_guesses()
+            a.writeEntry(note='hmm', dirnum='A1')
+            a.journal.flush()
+            assert guess_state(a) == guess_state(b)
+            assert b.nfilled == 5 and b.notes['A1']
+
+            path, size, poll = b.watched
+            a.setAt(0, 1, 'F', user='a')
+            a.journal.flush()
+            assert os.stat(path).st_size != size
+            if kind == 'sqlite':  # a commit by another process, which the WAL size might not show
+                assert not poll()
+                type(a.store)(os.environ['TEAMDIR']).append(a.xdid, [dict(x=2, y=1, ch='H', user='c')])
+                assert poll()
+
+            progress = a.store.progress()
+            assert list(progress) == [a.xdid] and not progress[a.xdid].submitted
+
+            a.compact_guesses()
+            a.setAt(1, 1, 'G', user='a')
+            a.journal.flush()
+            assert guess_state(a) == guess_state(b) == guess_state(Crossword('samples/wsj110624.xd'))
+
+            a.mark_done()
+            assert a.store.progress([a.xdid, 'nonesuch'])[a.xdid].submitted
+            if kind == 'sqlite' and hasattr(a.store.conn, 'setlimit'):  # as some builds have it
+                import sqlite3
+                a.store.conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+            many = [f'nonesuch{i}' for i in range(40000)]  # more than SQLITE_MAX_VARIABLE_NUMBER
+            assert list(a.store.progress(many[:20000] + [a.xdid] + many[20000:])) == [a.xdid]
+            b.replay_guesses()
+            assert b.readonly
+            if kind == 'sqlite':  # root can still write to a read-only file
+                try:
+                    a.store.append(a.xdid, [dict(xdid=a.xdid, x=0, y=0, ch='Z', user='a')])
+                    assert False, 'appended after submitting'
+                except PermissionError:
+                    pass
+        finally:
+            del os.environ['XDSTORE']
+    print('store tests passed')
+
+def test_grading():
+    import sqlite3
+    from xdplayer import grading
+
+    teamsdir = tempfile.mkdtemp()
+    conn = sqlite3.connect(os.path.join(teamsdir, 'xd.db'))
+    conn.execute('CREATE TABLE xdmeta (xdid TEXT NOT NULL PRIMARY KEY, path TEXT)')
+    conn.execute('CREATE TABLE solvings (xdid TEXT NOT NULL, teamid TEXT NOT NULL, date_checked TEXT, correct INT, nonblocks INT, submitted INT, PRIMARY KEY (xdid, teamid))')
+    conn.execute('INSERT INTO xdmeta VALUES (?, ?)', ('saulpw-008', os.path.abspath('samples/saulpw-008.xd')))
+
+    teams = {}
+    for teamid, word in [('team1', 'BEG'), ('team2', 'BEX')]:
+        os.mkdir(os.path.join(teamsdir, teamid))
+        os.environ['TEAMDIR'] = os.path.join(teamsdir, teamid)
+        teams[teamid] = xd = Crossword('samples/saulpw-008.xd')
+        for x, ch in enumerate(word):
+            xd.setAt(x, 0, ch, user=teamid)
+        xd.journal.flush()
+    teamdirs = [os.path.join(teamsdir, t) for t in teams]
+
+    def grade(processes=1):
+        results = [r for r in grading.grade_all(grading.find_jobs(conn, teamdirs), processes)]
+        assert all(err is None for *_, err in results), results
+        grading.save_results(conn, [r[:4] for r in results])
+        return sorted((teamid, r['nreplayed']) for teamid, xdid, progress, r, err in results)
+
+    def solvings():
+        return sorted(conn.execute('SELECT teamid, correct, nonblocks, submitted FROM solvings'))
+
+    ncells = teams['team1'].ncells
+    assert grade(2) == [('team1', 3), ('team2', 3)]
+    assert solvings() == [('team1', 3, ncells, 0), ('team2', 2, ncells, 0)]
+    assert grade() == []  # nothing new
+
+    xd = teams['team2']
+    xd.setAt(2, 0, 'G', user='team2')
+    xd.journal.flush()
+    xd.mark_done()
+    assert grade() == [('team2', 1)]  # from the checkpoint
+    assert solvings() == [('team1', 3, ncells, 0), ('team2', 3, ncells, 1)]
+
+    xd.compact_guesses()  # which makes it replay from the start
+    assert grade() == [('team2', 0)] and solvings()[1] == ('team2', 3, ncells, 1)
+    print('grading tests passed')
+
+def test_events():
+    import time
+    import threading
+    from xdplayer.events import EventLoop, InotifyWatcher, StatWatcher
+
+    for watcher in (InotifyWatcher(), StatWatcher(interval=0.05)):
+        r, w = os.pipe()
+        events = EventLoop(r, watcher)
+        path = os.path.join(tempfile.mkdtemp(), 'guesses.jsonl')
+        open(path, 'w').close()
+        events.watch(path, 0)
+        assert events.wait(time.time()+0.05) == 'timer'
+
+        def append_later(path=path):
+            time.sleep(0.05)
+            with open(path, 'a') as fp:
+                fp.write('{}\n')
+        threading.Thread(target=append_later).start()
+        t0 = time.time()
+        assert events.wait(time.time()+2) == 'guesses'
+        assert time.time()-t0 < 0.5
+        events.watch(path, 3)
+
+        # replaced, as by compaction, then written again
+        with open(path+'.new', 'w') as fp:
+            fp.write('{}\n')
+        os.replace(path+'.new', path)
+        events.changed()
+        events.watch(path, 3)
+        append_later()
+        assert events.wait(time.time()+2) == 'guesses'
+
+        os.write(w, b'x')
+        assert events.wait(time.time()+2) == 'key'
+    print('event tests passed')
+
+def test_sync_daemon():
+    import time
+    from xdplayer import guesslog
+    from xdplayer.syncd import SyncClient
+
+    def wait_for(xd, cond):
+        t0 = time.time()
+        while not cond() and time.time()-t0 < 2:
+            if xd.sync is None or xd.sync.changed():
+                xd.replay_guesses()
+        assert cond()
+
+    os.environ['TEAMDIR'] = teamdir = tempfile.mkdtemp()
+    addr = os.path.join(teamdir, '.xdsync.sock')
+    daemon = subprocess.Popen([sys.executable, '-c', 'import asyncio; from xdplayer.syncd import SyncServer; asyncio.run(SyncServer().serve())'], stderr=subprocess.PIPE)
+    try:
+        assert daemon.stderr.readline().startswith(b'serving')
+        a, b = Crossword('samples/wsj110624.xd'), Crossword('samples/wsj110624.xd')
+        guesslog.append(a.guessfn, [dict(xdid=a.xdid, x=2, y=0, ch='Z', user='c')])  # from before the daemon
+        for xd in (a, b):
+            xd.reset_guesses()
+            xd.replay_guesses()
+            xd.attach(SyncClient.connect(addr))
+        assert b.grid[0][2] == 'Z'
+
+        a.setAt(0, 0, 'X', user='a')
+        a.journal.flush()
+        wait_for(b, lambda: b.grid[0][0] == 'X')
+        assert b.lastpos == os.stat(b.guessfn).st_size  # and the daemon wrote it to the log
+
+        guesslog.append(a.guessfn, [dict(xdid=a.xdid, note='hmm', dirnum='A1', user='c')])  # by someone without the daemon
+        wait_for(b, lambda: b.notes['A1'])
+
+        a.compact_guesses()
+        a.setAt(1, 0, 'Y', user='a')
+        a.journal.flush()
+        wait_for(b, lambda: b.grid[0][1] == 'Y')
+        assert len(b.notes['A1']) == 1
+    finally:
+        daemon.kill()
+        daemon.wait()
+
+    # both go back to the guess log
+    a.setAt(3, 0, 'W', user='a')
+    a.journal.flush()
+    wait_for(b, lambda: b.sync is None and b.grid[0][3] == 'W')
+    a.replay_guesses()
+    assert a.sync is None and a.grid[0][3] == 'W'
+    assert SyncClient.connect(addr) is None
+
+    # in one process: topics go once unused, and a bad line in one log stops nothing
+    import asyncio, threading
+    from xdplayer.syncd import SyncServer, tail_end
+    path = os.path.join(teamdir, 'long.jsonl')
+    with open(path, 'wb') as fp:
+        fp.write(b'{"a": 1}\n' + b'x'*(guesslog.CHUNK+10))
+    with open(path, 'rb') as fp:
+        assert tail_end(fp, os.path.getsize(path)) == 9  # not somewhere in the unfinished line
+
+    server = SyncServer(teamdir, poll=0.01)
+    addr = os.path.join(teamdir, 'inprocess.sock')
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(server.serve(addr))
+    thread = threading.Thread(target=loop.run_until_complete, args=(asyncio.wait([task]),))
+    thread.start()
+    try:
+        t0 = time.time()
+        c = None
+        while not c and time.time()-t0 < 2:
+            c = SyncClient.connect(addr)
+        assert c.append('p1', [dict(x=0, y=0, ch='A')], sync=True)
+        assert c.subscribe('p2', 0, None) and c.subscribe('p3', 0, None)
+        assert c.append('p3', [dict(x=0, y=0, ch='B')], sync=True)
+        assert list(server.topics) == ['p3']  # p1 was only appended to, and p2 left
+
+        with open(os.path.join(teamdir, 'p3.xd-guesses.jsonl'), 'ab') as fp:
+            fp.write(b'{"x": 0, "y"\n')
+        guesslog.append(os.path.join(teamdir, 'p3.xd-guesses.jsonl'), [dict(x=1, y=0, ch='C')])
+        rows = []
+        while time.time()-t0 < 5 and not any(r.get('ch') == 'C' for r in rows):
+            c.read(0.1)
+            rows.extend(r for m in c.receive('p3') for r in m.get('rows', []))
+        assert [r['ch'] for r in rows] == ['B', 'C']
+
+        # a topic stuck writing (as on a slow fsync) doesn't hold up polling the others
+        c2 = SyncClient.connect(addr)
+        assert c2.subscribe('p4', 0, None)
+        while 'p4' not in server.topics and time.time()-t0 < 5:
+            time.sleep(0.01)
+        stuck = server.topics['p4'].lock
+        asyncio.run_coroutine_threadsafe(stuck.acquire(), loop).result(2)
+        guesslog.append(os.path.join(teamdir, 'p3.xd-guesses.jsonl'), [dict(x=2, y=0, ch='D')])
+        rows = []
+        t1 = time.time()
+        while time.time()-t1 < 2 and not rows:
+            c.read(0.1)
+            rows.extend(r for m in c.receive('p3') for r in m.get('rows', []))
+        loop.call_soon_threadsafe(stuck.release)
+        assert [r['ch'] for r in rows] == ['D']
+        c2.sock.close()
+        c.sock.close()
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+    print('sync daemon tests passed')
+
+def test_headless_import():
+    'The model must not pull in the player, so cron scripts start fast.'
+    r = subprocess.run([sys.executable, '-c', 'import sys; from xdplayer import Crossword; Crossword("samples/wsj110624.xd").grade(); print(sorted(set(sys.modules) & {"curses", "visidata", "pkg_resources", "unittest.mock", "xdplayer.player"}))'], capture_output=True, text=True)
+    assert r.stdout.strip() == '[]', r.stdout + r.stderr
+    print('headless import tests passed')
+
+
+def test_catalog():
+    import shutil
+    import sqlite3
+    from pathlib import Path
+    from xdplayer.catalog import read_puzzle, read_xd
+
+    for fn in ('samples/wsj110624.xd', 'samples/saulpw-008.xd', 'samples/saulpw-008.puz'):
+        xd = Crossword(fn)  # the way xdimport used to
+        row = (Path(fn).stem, str(Path(fn).absolute()), f'{xd.ncols}x{xd.nrows}', xd.meta.get('Title', ''), xd.meta.get('Author', ''),
+               xd.meta.get('Editor', ''), xd.meta.get('Copyright', ''), xd.meta.get('Date', ''), xd.answer('A1') or '', xd.answer('D1') or '')
+        assert read_puzzle(fn, read_xd(fn)[1])[0] == row, (read_puzzle(fn, read_xd(fn)[1])[0], row)
+
+    d = tempfile.mkdtemp()
+    os.mkdir(os.path.join(d, 'corpus'))
+    for fn in ('wsj110624.xd', 'saulpw-008.xd'):
+        shutil.copy(os.path.join('samples', fn), os.path.join(d, 'corpus', fn))
+    env = dict(os.environ, XDDB=os.path.join(d, 'xd.db'), PYTHONPATH=os.getcwd())
+    def xdimport():
+        r = subprocess.run([sys.executable, 'bin/xdimport.py', '-j', '2', os.path.join(d, 'corpus')], env=env, capture_output=True, text=True)
+        assert r.returncode == 0, r.stderr
+        return r.stdout.split(' in ')[0]
+
+    assert xdimport() == '2 imported, 0 updated, 0 unchanged, 0 failed'
+    assert xdimport() == '0 imported, 0 updated, 2 unchanged, 0 failed'
+    fn = os.path.join(d, 'corpus', 'saulpw-008.xd')
+    with open(fn) as fp:
+        contents = fp.read()
+    with open(fn, 'w') as fp:
+        fp.write(contents.replace('Title: ', 'Title: New '))
+    assert xdimport() == '0 imported, 1 updated, 1 unchanged, 0 failed'
+    conn = sqlite3.connect(env['XDDB'])
+    assert conn.execute('SELECT title FROM xdmeta WHERE xdid=?', ('saulpw-008',)).fetchone()[0].startswith('New ')
+
+    from xdplayer.catalog import search_clues, match_answers, search_answers
+    assert conn.execute('SELECT COUNT(*) FROM clues WHERE xdid=?', ('saulpw-008',)).fetchone()[0] == len(Crossword(fn).clues)  # not twice
+    assert search_clues(conn, 'defensive ditch') == [('saulpw-008', 'A10', 'Defensive ditch', 'MOAT')]
+    assert search_clues(conn, 'ditch defensive') == []
+    assert search_answers(conn, 'm?a?') == [('saulpw-008', 'A10', 'Defensive ditch', 'MOAT')]
+    assert 'PASSED' in match_answers(conn, 'P.S..D') and all(len(a) == 6 for a in match_answers(conn, '??????'))
+    r = subprocess.run([sys.executable, 'bin/xdsearch.py', '-a', 'MO?T'], env=env, capture_output=True, text=True)
+    assert r.stdout == 'saulpw-008\tA10\tMOAT\tDefensive ditch\n', r
+    print('catalog tests passed')
+
+    from xdplayer.wordlist import WordList
+    words = WordList(os.path.join(d, 'xd.words'))  # written by xdimport
+    assert 'MOAT' in words.match('MO?T') and 'PASSED' in words.match('P.S..D')
+
+def test_word_list():
+    from xdplayer.wordlist import WordList, write_wordlist
+
+    fn = os.path.join(tempfile.mkdtemp(), 'xd.words')
+    write_wordlist(fn, {'APPLE': 1, 'AMPLE': 5, 'ANGLE': 2, 'OREO': 9, 'ERA': 3, 'A-OK': 7, 'X': 1})
+    words = WordList(fn)
+    assert len(words) == 6  # not A-OK
+    assert words.match('A?P?E') == ['AMPLE', 'APPLE']  # commonest first
+    assert words.match('A.P.E', limit=1) == ['AMPLE']
+    assert words.match('?????') == ['AMPLE', 'ANGLE', 'APPLE']
+    assert words.match(['A', '.', '1', 'L', 'E']) == ['AMPLE', 'ANGLE', 'APPLE']  # rebus cells match anything
+    assert words.match('Q????') == [] and words.match('??????????') == [] and words.match('') == []
+    assert words.match('X') == ['X']
+
+    many = {f'{a}{b}{c}': i for i, (a, b, c) in enumerate(zip(string.ascii_uppercase*40, string.ascii_uppercase[3:]*40, string.ascii_uppercase[7:]*40))}
+    write_wordlist(fn, many)
+    words = WordList(fn)
+    assert sorted(words.match('A??', 1000)) == sorted(w for w in many if w[0] == 'A')
+
+    os.environ['TEAMDIR'] = tempfile.mkdtemp()
+    os.environ['XDWORDS'] = fn
+    try:
+        write_wordlist(fn, {'BEG': 2, 'BAG': 1, 'MOAT': 1})
+        plyr = CrosswordPlayer(['samples/saulpw-008.xd'])
+        xd = plyr.xd
+        xd.cursor_x, xd.cursor_y, xd.filldir = 0, 0, 'A'
+        xd.setAtCursor('B')
+        plyr.hint(xd)
+        assert plyr.statuses[-1] == 'A1 B??: BEG BAG', plyr.statuses
+    finally:
+        del os.environ['XDWORDS']
+    print('word list tests passed')
+
+def test_autofill():
+    from xdplayer.wordindex import WordIndex
+    from xdplayer.wordlist import WordList, write_wordlist
+    from xdplayer.autofill import Autofill, count_fills
+
+    fn = os.path.join(tempfile.mkdtemp(), 'xd.words')
+    write_wordlist(fn, {'CAT': 1, 'ORE': 1, 'WED': 1, 'COW': 1, 'ARE': 1, 'TED': 1, 'CAR': 5, 'ZOO': 5})
+    words = WordList(fn)
+    square, transposed = ['CAT', 'ORE', 'WED'], ['COW', 'ARE', 'TED']
+    assert sorted(Autofill(['...', '...', '...'], words).fills()) == [square, transposed]
+    assert list(Autofill(['..T', '...', '...'], words).fills()) == [square]  # keeps letters
+    assert list(Autofill(['...', '...', '..X'], words).fills()) == []
+    assert list(Autofill(['#..', '...', '...'], words).fills()) == []  # no 2-letter words
+    assert count_fills(['...', '...', '...'], words) == 2 and count_fills(['..T', '...', '...'], words) == 1
+
+    xd = Crossword('samples/saulpw-008.xd')
+    solution = [''.join(row) for row in xd.solution]
+    blank = [''.join('#' if ch == '#' else '.' for ch in row) for row in solution]
+    write_wordlist(fn, {xd.answer(dirnum): 1 for dirnum in xd.clues})
+    assert count_fills(blank, WordList(fn)) == 1
+    assert next(Autofill(blank, WordList(fn)).fills()) == solution
+    out = subprocess.run([sys.executable, 'bin/xdfill.py', '--unique', 'samples/saulpw-008.xd'], env=dict(os.environ, XDWORDS=fn, PYTHONPATH=os.getcwd()),
+                         capture_output=True, text=True)
+    assert out.returncode == 0 and ': unique (' in out.stdout, out
+
+    # slots longer than any word have no fills, rather than no bitsets
+    write_wordlist(fn, {'CAT': 3, 'DOG': 2, 'ACE': 1, 'TEA': 1, 'AT': 1})
+    assert count_fills(['...##', '#.###', '#.###', '#.###', '#.###'], WordList(fn)) == 0
+
+    # with other words too, any fill has listed words in every slot, none twice
+    counts = {xd.answer(dirnum): 1 for dirnum in xd.clues}
+    counts.update((a+b, 2) for a in ('AL', 'ER', 'RE', 'ST', 'ON') for b in ('E', 'A', 'ES', 'ED', 'ERS'))
+    write_wordlist(fn, counts)
+    fill = next(Autofill(blank, WordList(fn)).fills())
+    idx = WordIndex(fill)
+    answers = [''.join(''.join(fill)[i] for i in idx.cells(w)) for w in range(len(idx))]
+    assert all(a in counts for a in answers) and len(set(answers)) == len(answers)
+    print('autofill tests passed')
+
+def test_word_index():
+    from xdplayer.wordindex import WordIndex
+
+    idx = WordIndex(['AB#', 'C#D', 'EFG'])
+    assert [idx.dirnum(w) for w in range(len(idx))] == ['A1', 'D1', 'D2', 'A3']
+    assert idx.nopen == 7
+    assert idx.coords(1) == [(0, 0), (0, 1), (0, 2)]
+    assert idx.word_at(2, 2, 'A') == 3 and idx.word_at(2, 2, 'D') == 2
+    assert idx.word_at(1, 0, 'D') == -1  # B is in no down word
+    assert idx.word_at(3, 0, 'A') == -1
+
+    xd = Crossword('samples/saulpw-008.xd')
+    assert len(xd.words) == len(xd.clues)
+    for wid, clue in enumerate(xd.words):
+        assert xd.answer(f'{clue.dir}{clue.num}') == clue.answer
+        for x, y in clue.coords:
+            assert xd.words_at(x, y)[clue.dir != 'A'] is clue
+    print('word index tests passed')
+
+
+def test_animation():
+    import io, json
+    from xdplayer.ddwplay import AnimationMgr
+
+    rows = [dict(id='1', type='frame', duration_ms=100), dict(id='2', type='frame', duration_ms=0), dict(id='3', type='frame', duration_ms=50),
+            dict(frame='1', x=0, y=0, text='ab', color='red'), dict(frame='3', x=2, y=1, text='c', color='blue')]
+    mgr = AnimationMgr()
+    mgr.load('t', io.StringIO('\n'.join(json.dumps(r) for r in rows)))
+    anim = mgr.library['t']
+    assert anim.ends[-3:] == [100, 100, 150] and anim.total_ms == 150
+    assert anim.frame_at(0.05)[0] == anim.frame_at(0)[0]
+    assert anim.frame_at(0.1)[0] == len(anim.ends)-1  # the 0ms frame is never shown
+    assert anim.frame_at(0.2) == (None, None)
+    assert anim.frame_at(0.2, loop=True)[0] == anim.frame_at(0.05)[0]
+
+    scr = Mock()
+    scr.colors = {'red': 1, 'blue': 2}
+    mgr.active = [(10, anim, (), dict(x=5, y=7))]*3 + [(10, anim, (), dict(x=5, y=8))]
+    assert mgr.draw(scr, 10.125) == 10.025  # when the last frame ends
+    assert [c.args for c in scr.addstr.call_args_list] == [(8, 7, 'c', 2), (9, 7, 'c', 2)]  # the same thrice, drawn once
+    assert mgr.draw(scr, 10.2) is None and not mgr.active
+
+    # registered animations load when first triggered, and from their cache after that
+    from xdplayer.ddwplay import load_animation, cache_path
+    os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp()
+    path = os.path.join(tempfile.mkdtemp(), 'blink.ddw')
+    with open(path, 'w') as fp:
+        fp.write('\n'.join(json.dumps(r) for r in rows))
+    mgr.register('blink', path)
+    assert 'blink' not in mgr.library and not os.path.exists(cache_path(path))
+    mgr.trigger('blink')
+    assert os.path.exists(cache_path(path))
+    cached = load_animation(path)
+    assert not cached.frames  # not parsed again
+    assert (cached.ends, cached.timeline, cached.total_ms) == (anim.ends, anim.timeline, anim.total_ms)
+
+    rows[-1]['text'] = 'd'
+    with open(path, 'w') as fp:
+        fp.write('\n'.join(json.dumps(r) for r in rows))
+    os.utime(path, ns=(0, 12345))
+    assert load_animation(path).timeline[-1] == [(1, 2, 'd', 'blue')]
+
+    # still plays, uncached, if its JSON has an int where a string should be
+    rows[-1].update(text=5, color=7)
+    with open(path, 'w') as fp:
+        fp.write('\n'.join(json.dumps(r) for r in rows))
+    os.utime(path, ns=(0, 23456))
+    assert load_animation(path).timeline[-1] == [(1, 2, 5, 7)]
+    assert not os.path.exists(f'{cache_path(path)}.tmp{os.getpid()}')
+    print('animation tests passed')
+
+
+def test_color_pairs():
+    import curses
+    from unittest import mock
+    from xdplayer.tui import ColorMaker
+
+    inited = {}
+    def init_pair(n, fg, bg):
+        if fg == 99:
+            raise ValueError('Color number is greater than COLORS-1 (7).')
+        inited[n] = (fg, bg)
+
+    with mock.patch('curses.init_pair', init_pair), mock.patch('curses.color_pair', lambda n: n << 8), mock.patch('curses.pair_number', lambda a: (a >> 8) & 0xff):
+        colors = ColorMaker(None, npairs=3)
+        assert colors[''] == 0
+        red = colors['red on black']
+        assert colors['red on black bold'] == red | curses.A_BOLD
+        assert colors.to_name(red) == (curses.COLOR_RED, curses.COLOR_BLACK) and colors.to_name(0) == ''
+        blue, green = colors['blue'], colors['green']
+        assert len({red, blue, green}) == 3
+
+        colors['red']  # red is used, so blue, the least recently used, goes for 235
+        assert colors.generation == 0
+        c235 = colors['235']
+        assert c235 == blue and inited[blue >> 8] == (235, 0) and colors.generation == 1
+        assert colors['blue'] == green  # and now green is the oldest
+        assert colors['red'] == red
+
+        assert colors['99 bold'] == curses.A_BOLD  # can't be had, so in the default colors
+        assert colors['99 bold'] == curses.A_BOLD and colors.counts['failed'] == 1
+        stats = colors.stats()
+        assert (stats['pairs'], stats['npairs'], stats['evicted'], stats['generation']) == (2, 3, 3, 3), stats  # the pair let go for 99 is free
+        colors['white']
+        assert colors.stats()['evicted'] == 3 and not colors.free
+    print('color pair tests passed')
+
+
+def test_completion_animation():
+    import time
+    from unittest import mock
+    from benchmarks import fake_player
+
+    plyr, scr = fake_player('samples/saulpw-008.xd', 25, 80)
+    plyr.xd.solve()
+    now = [time.time()]
+    with mock.patch('time.time', lambda: now[0]):
+        for i in range(40):
+            plyr.play_one(scr, plyr.xd)
+            now[0] += 0.2
+    status = ''.join(ch for ch, attr in scr.lines[23][:30]).strip()
+    assert 0 < len(status) <= 2, status  # only this frame's letters, not a trail of the earlier ones
+    print('completion animation tests passed')
+
+
+def test_crossword_cache():
+    from unittest import mock
+    from xdplayer import player
+
+    fn = os.path.join(tempfile.mkdtemp(), 'bad.xd')
+    with open(fn, 'w') as fp:
+        fp.write('not a puzzle')
+    cache = player.CrosswordCache()
+    with mock.patch.object(player, 'CrosswordView', side_effect=ValueError) as view:
+        cache.prefetch(fn)
+        cache.prefetch(fn)
+        assert view.call_count == 1  # not parsed again while unchanged
+        os.utime(fn, (0, 0))
+        cache.prefetch(fn)
+        assert view.call_count == 2
+
+    # in the background, while the event loop keeps waiting for keys
+    import time
+    from xdplayer.events import EventLoop
+    r, w = os.pipe()
+    events = EventLoop(r)
+    cache.prefetch('samples/saulpw-008.xd', events)
+    assert 'samples/saulpw-008.xd' in cache.pending
+    cache.prefetch('samples/saulpw-008.xd', events)  # not submitted twice
+    assert events.wait(time.time()+5) == 'timer'
+    assert not cache.pending
+    xd = cache.crosswords['samples/saulpw-008.xd']
+    assert xd.grid_left == 3 and cache.get('samples/saulpw-008.xd') is xd
+    cache.prefetch(fn, events)
+    events.wait(time.time()+1)
+    assert fn in cache.failed and fn not in cache.crosswords
+    print('crossword cache tests passed')
+
+
+def test_puz_cksum():
+    from xdplayer import puz
+
+    def slow_cksum(data, cksum=0):  # the original, one branchy step per byte
+        for b in data:
+            lowbit = (cksum & 0x0001)
+            cksum = (cksum >> 1)
+            if lowbit:
+                cksum = (cksum | 0x8000)
+            cksum = (cksum + b) & 0xffff
+        return cksum
+
+    data = open('samples/saulpw-008.puz', 'rb').read()
+    for seed in (0, 1, 0x8000, 0xffff, 12345):
+        for n in (0, 1, 2, 17, len(data)):
+            assert puz.data_cksum(data[:n], seed) == slow_cksum(data[:n], seed)
+    chunks = [data[:5], bytearray(data[5:300]), memoryview(data)[300:]]
+    assert puz.data_cksum(chunks, 3) == puz.data_cksum(iter(data), 3) == slow_cksum(data, 3)
+
+    # the rotate table is only built by the first cksum
+    r = subprocess.run([sys.executable, '-c', 'from xdplayer import puz; print(puz._ror16)'], capture_output=True, text=True)
+    assert r.stdout.strip() == 'None', r.stdout + r.stderr
+
+    p = puz.load(data)
+    assert p.tobytes() == data
+
+    bad = data.replace(b'MOAT', b'MOAN')
+    try:
+        puz.load(bad)
+        assert False, 'corrupt .puz loaded'
+    except puz.PuzzleFormatError:
+        pass
+    p = puz.load(bad, validate=False)
+    try:
+        p.validate()
+        assert False, 'corrupt .puz validated'
+    except puz.PuzzleFormatError:
+        pass
+    print('puz tests passed')
+
+
+def test_puz_scan():
+    from xdplayer import puz
+
+    whole = puz.read('samples/saulpw-008.puz')
+    mapped = puz.read('samples/saulpw-008.puz', validate=False, mapped=True)
+    assert isinstance(mapped.__dict__['_raw_title'], memoryview)  # not copied out of the map until used
+    for k in ('title', 'author', 'copyright', 'solution', 'fill', 'clues', 'notes'):
+        assert getattr(mapped, k) == getattr(whole, k), k
+    assert mapped.tobytes() == whole.tobytes()
+
+    d = tempfile.mkdtemp()
+    data = open('samples/saulpw-008.puz', 'rb').read()
+    for i, contents in enumerate([data, b'junk', b'']):
+        with open(os.path.join(d, f'p{i}.puz'), 'wb') as fp:
+            fp.write(contents)
+
+    results = list(puz.scan(d))
+    assert [os.path.basename(fn) for fn, meta, err in results] == ['p0.puz', 'p1.puz', 'p2.puz']
+    assert results[0][1] == dict(width=whole.width, height=whole.height, title=whole.title, author=whole.author,
+                                 copyright=whole.copyright, locked=False)
+    assert results[1][1] is None and isinstance(results[1][2], puz.PuzzleFormatError)
+    assert results[2][1] is None and isinstance(results[2][2], puz.PuzzleFormatError)  # empty
+    print('puz scan tests passed')
+
+
+def test_puz_convert():
+    from xdplayer.puz2xd import convert_all, gen_xd
+
+    d = tempfile.mkdtemp()
+    jobs = []
+    for i, contents in enumerate([open('samples/saulpw-008.puz', 'rb').read()]*3 + [b'junk']):
+        puzfn = os.path.join(d, f'p{i}.puz')
+        with open(puzfn, 'wb') as fp:
+            fp.write(contents)
+        jobs.append((puzfn, puzfn[:-4] + '.xd', dict(mode='hash')))
+
+    results = sorted(convert_all(jobs, processes=2))
+    assert [r[2] for r in results] == ['converted']*3 + ['failed'], results
+    assert 'PuzzleFormatError' in results[3][3]
+    assert open(jobs[0][1]).read() == '\n'.join(gen_xd(jobs[0][0], clear=False)) + '\n'
+
+    jobs = [(puzfn, xdfn, dict(mode='hash', known_hash=r[3])) for (puzfn, xdfn, _), r in zip(jobs, results)]
+    assert [r[2] for r in sorted(convert_all(jobs[:3], processes=1))] == ['skipped']*3
+    print('puz convert tests passed')
+
+
+def test_puz_unlock():
+    import random
+    from xdplayer import puz
+    from xdplayer.puz2xd import gen_xd
+
+    for i in range(20):  # against unscramble_solution, on small grids and a sample of keys
+        w, h = random.randint(2, 8), random.randint(2, 8)
+        solution = ''.join(random.choice(string.ascii_uppercase + '...') for i in range(w*h))
+        if len(solution.replace('.', '')) < 2:
+            continue
+        key = random.randint(1000, 9999)
+        scrambled = puz.scramble_solution(solution, w, h, key)
+        cksum = puz.scrambled_cksum(solution, w, h)
+        keys = random.sample(range(1000, 10000), 100) + [key]
+        assert puz.find_keys(scrambled, w, h, cksum, keys) == sorted(set(k for k in keys
+            if puz.scrambled_cksum(puz.unscramble_solution(scrambled, w, h, k), w, h) == cksum))
+
+    p = puz.read('samples/saulpw-008.puz')
+    p.lock_solution(4321)
+    assert p.recover_key() == 4321
+    lockedfn = os.path.join(tempfile.mkdtemp(), 'locked.puz')
+    p.save(lockedfn)
+    assert list(gen_xd(lockedfn, clear=False)) == list(gen_xd('samples/saulpw-008.puz', clear=False))
+    print('puz unlock tests passed')
+
+
 if __name__ == '__main__':
     test_moves()
+    test_guess_log()
+    test_counts()
+    test_stores()
+    test_grading()
+    test_events()
+    test_sync_daemon()
+    test_headless_import()
+    test_catalog()
+    test_word_list()
+    test_autofill()
+    test_word_index()
+    test_animation()
+    test_color_pairs()
+    test_completion_animation()
+    test_crossword_cache()
+    test_puz_cksum()
+    test_puz_scan()
+    test_puz_convert()
+    test_puz_unlock()
@@ -0,0 +1,149 @@
+'''
+Fill a grid with words from a WordList, by constraint propagation and search.
+
+Every slot (word of the WordIndex) has a domain: a bitset of the words of its
+length that still fit, starting from the WordList bitsets of the letters
+already in the grid.  Every cell has the set of letters (26 bits) that both of
+its slots still allow.  Narrowing a slot narrows the letters of its cells,
+which narrows the crossing slots, until nothing changes (arc consistency); a
+slot down to one word also takes that word from the others of its length, so
+no word is used twice.  Then the slot with the fewest words left is tried with
+each of them in turn, commonest first, and so on until every slot has one.
+'''
+
+from .wordindex import WordIndex
+from .wordlist import LETTERS
+
+
+def popcount(m):
+    return bin(m).count('1')
+
+
+def iterbits(m):
+    'Generate the positions of the bits set in int *m*, lowest first.'
+    while m:
+        low = m & -m
+        yield low.bit_length()-1
+        m ^= low
+
+
+class Autofill:
+    'Fills of *grid* (rows of cells: "#" a block, A-Z a letter to keep, anything else open) with words from *words*, a WordList.'
+    def __init__(self, grid, words):
+        self.grid = [list(row) for row in grid]
+        self.words = words
+        self.index = idx = WordIndex(self.grid)
+        self.slots = range(len(idx))
+        self.cells = [list(idx.cells(s)) for s in self.slots]
+        self.crossing = {}  # (slot, pos) -> (crossing slot, its pos)
+        for s in self.slots:
+            other = idx.down if idx.dirs[s] == 'A' else idx.across
+            for p, cell in enumerate(self.cells[s]):
+                t = other[cell]
+                if t >= 0:
+                    self.crossing[(s, p)] = (t, self.cells[t].index(cell))
+        self.samelength = {s: [t for t in self.slots if t != s and idx.lengths[t] == idx.lengths[s]] for s in self.slots}
+        self.bitsets = {}  # (length, pos, letter) -> WordList.bitset()
+
+    def bitset(self, length, pos, letter):
+        k = (length, pos, letter)
+        if k not in self.bitsets:
+            self.bitsets[k] = self.words.bitset(length, pos, letter)
+        return self.bitsets[k]
+
+    def start(self):
+        'Return the (domains, cell letters) of the grid as given, before any propagation.'
+        flat = [ch for row in self.grid for ch in row]
+        letters = [(1 << (ord(ch)-65)) if ch in LETTERS else (1 << 26)-1 for ch in flat]
+        domains = []
+        for s in self.slots:
+            length = self.index.lengths[s]
+            d = (1 << self.words.count(length))-1
+            for p, cell in enumerate(self.cells[s]):
+                if flat[cell] in LETTERS:
+                    d &= self.bitset(length, p, ord(flat[cell])-65)
+            domains.append(d)
+        return domains, letters
+
+    def propagate(self, domains, letters, queue):
+        'Narrow *domains* and *letters* in place until consistent, starting from the slots in *queue*.  Return False if some slot has no words left.'
+        queue = set(queue)
+        while queue:
+            s = queue.pop()
+            d = domains[s]
+            if not d:
+                return False
+            length = self.index.lengths[s]
+
+            if d & (d-1) == 0:  # one word left, which no other slot may use
+                for t in self.samelength[s]:
+                    if domains[t] & d:
+                        domains[t] &= ~d
+                        if not domains[t]:
+                            return False
+                        queue.add(t)
+
+            for p, cell in enumerate(self.cells[s]):
+                old = letters[cell]
+                new = 0
+                for ch in iterbits(old):
+                    if d & self.bitset(length, p, ch):
+                        new |= 1 << ch
+                if new == old:
+                    continue
+                if not new:
+                    return False
+                letters[cell] = new
+                if (s, p) in self.crossing:
+                    t, q = self.crossing[(s, p)]
+                    tlength = self.index.lengths[t]
+                    allowed = 0
+                    for ch in iterbits(new):
+                        allowed |= self.bitset(tlength, q, ch)
+                    if domains[t] & allowed != domains[t]:
+                        domains[t] &= allowed
+                        if not domains[t]:
+                            return False
+                        queue.add(t)
+        return True
+
+    def search(self, domains, letters):
+        'Generate the fills consistent with *domains* and *letters*, already propagated, as lists of word numbers by slot.'
+        open_ = [s for s in self.slots if domains[s] & (domains[s]-1)]
+        if not open_:
+            yield [d.bit_length()-1 for d in domains]
+            return
+
+        s = min(open_, key=lambda s: popcount(domains[s]))
+        for i in iterbits(domains[s]):
+            trial, trial_letters = list(domains), list(letters)
+            trial[s] = 1 << i
+            if self.propagate(trial, trial_letters, [s]):
+                yield from self.search(trial, trial_letters)
+
+    def fills(self):
+        'Generate every fill of the grid, commonest words first, as lists of row strings.'
+        start, letters = self.start()
+        if not self.propagate(start, letters, self.slots):
+            return
+        for fill in self.search(start, letters):
+            yield self.grid_of(fill)
+
+    def grid_of(self, fill):
+        'Return the grid with the words of *fill* (word number by slot) in their slots, as row strings.'
+        flat = [ch for row in self.grid for ch in row]
+        for s, i in enumerate(fill):
+            for cell, ch in zip(self.cells[s], self.words.word(self.index.lengths[s], i)):
+                flat[cell] = ch
+        ncols = self.index.ncols
+        return [''.join(flat[y*ncols:(y+1)*ncols]) for y in range(self.index.nrows)]
+
+
+def count_fills(grid, words, limit=2):
+    'Return the number of fills of *grid* from *words*, counting up to *limit*; 1 if its fill is unique.'
+    n = 0
+    for fill in Autofill(grid, words).fills():
+        n += 1
+        if n >= limit:
+            break
+    return n
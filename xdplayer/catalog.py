@@ -0,0 +1,196 @@
+'''
+The catalog of puzzles in $XDDB: the xdmeta table that the launchers list, and
+the xdfiles table that remembers which file each row came from, its mtime and
+its sha1, so importing a corpus again only reads files that changed.
+
+Every clue is in the clues table too, with a full-text index (clues_fts) for
+search_clues(), and every distinct answer in the answers table, with an index
+of its letters by length and position (answer_letters) for match_answers().
+'''
+
+import re
+import hashlib
+from pathlib import Path
+
+from .crossword import parse_xd
+from .pool import run_pool
+from .wordindex import WordIndex
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS xdmeta (
+    xdid TEXT NOT NULL PRIMARY KEY,
+    path TEXT,
+    size TEXT,
+    title TEXT,
+    author TEXT,
+    editor TEXT,
+    copyright TEXT,
+    date_published TEXT,
+    A1 TEXT,
+    D1 TEXT
+);
+
+CREATE TABLE IF NOT EXISTS solvings (
+    xdid TEXT NOT NULL,
+    teamid TEXT NOT NULL,
+    date_checked TEXT,
+    correct INT,
+    nonblocks INT,
+    submitted INT,
+    PRIMARY KEY (xdid, teamid)
+);
+
+CREATE TABLE IF NOT EXISTS xdfiles (
+    path TEXT NOT NULL PRIMARY KEY,
+    xdid TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    sha1 TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS clues (
+    id INTEGER PRIMARY KEY,
+    xdid TEXT NOT NULL,
+    dirnum TEXT NOT NULL,  -- "A1"
+    clue TEXT NOT NULL,
+    answer TEXT NOT NULL   -- uppercase, "" if the .xd has none
+);
+CREATE INDEX IF NOT EXISTS clues_xdid ON clues (xdid);
+CREATE INDEX IF NOT EXISTS clues_answer ON clues (answer);
+
+-- new clues are indexed by save_rows, all at once; deleted ones are unindexed here
+CREATE VIRTUAL TABLE IF NOT EXISTS clues_fts USING fts5 (clue, content='clues', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS clues_ad AFTER DELETE ON clues BEGIN
+    INSERT INTO clues_fts (clues_fts, rowid, clue) VALUES ('delete', old.id, old.clue);
+END;
+
+CREATE TABLE IF NOT EXISTS answers (  -- every distinct answer ever imported
+    answer TEXT NOT NULL PRIMARY KEY,
+    length INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS answers_length ON answers (length, answer);
+
+CREATE TABLE IF NOT EXISTS answer_letters (  -- each letter of each of those
+    length INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    letter TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    PRIMARY KEY (length, pos, letter, answer)
+) WITHOUT ROWID;
+'''
+
+VERSION = 2  # PRAGMA user_version of a catalog with all of the above; older ones have no clues, so every file is read again
+
+LETTERS_BY_FREQUENCY = 'ETAOINSRHLDCUMFPGWYBVKXJQZ'  # in English, to look up the rarest letter of a pattern
+
+XDMETA_COLUMNS = 'xdid path size title author editor copyright date_published A1 D1'.split()
+
+
+def read_puzzle(path, contents):
+    'Return the xdmeta row and the clues rows (xdid, dirnum, clue, answer) for .xd *contents* read from *path*.'
+    meta, grid, clues = parse_xd(contents)
+    row = xdmeta_row(path, meta, grid, clues)
+    return row, [(row[0], dirnum, clue, answer.upper()) for dirnum, clue, answer in clues]
+
+
+def xdmeta_row(path, meta, grid, clues):
+    '''Return the xdmeta row for the parse_xd() *meta*, *grid* and *clues* of
+    *path*, as a Crossword would make it but without its guesses or clue list.'''
+    index = WordIndex(grid)
+    cells = [ch for row in grid for ch in row]
+    clued = {dirnum for dirnum, clue, answer in clues}  # only answers that have a clue, like Crossword.answer
+    first = {index.dirnum(wid): ''.join(cells[i] for i in index.cells(wid))
+                for wid in range(len(index)) if index.nums[wid] == 1}
+    return (Path(path).stem, str(Path(path).absolute()),
+            f'{index.ncols}x{index.nrows}',
+            meta.get('Title', ''),
+            meta.get('Author', ''),
+            meta.get('Editor', ''),
+            meta.get('Copyright', ''),
+            meta.get('Date', ''),
+            first.get('A1', '') if 'A1' in clued else '',
+            first.get('D1', '') if 'D1' in clued else '')
+
+
+def read_xd(path):
+    'Return (bytes, .xd text) of *path*, converting it first if a .puz.'
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if path.endswith('.puz'):
+        from .puz2xd import gen_xd
+        return data, '\n'.join(gen_xd(path))
+    return data, data.decode('utf-8')
+
+
+def import_job(job):
+    '''Read one (path, mtime, known sha1) for import_all, and return (path, mtime,
+    sha1, (xdmeta row, clues rows) or None if unchanged, error or None).'''
+    path, mtime, known_sha1 = job
+    try:
+        data, contents = read_xd(path)
+        sha1 = hashlib.sha1(data).hexdigest()
+        if sha1 == known_sha1:
+            return path, mtime, sha1, None, None
+        return path, mtime, sha1, read_puzzle(path, contents), None
+    except Exception as e:
+        return path, mtime, None, None, f'{type(e).__name__}: {e}'
+
+
+def import_all(jobs, processes=None):
+    'Run import_job for every job across *processes* processes (see run_pool).'
+    return run_pool(import_job, jobs, processes, maxchunk=256)
+
+
+def save_rows(conn, rows, clues, files, answers):
+    '''Upsert xdmeta *rows*, replace the clues of their puzzles with *clues*, and
+    record the xdfiles (path, xdid, mtime, sha1) they came from, in one
+    transaction.  *answers* is the set of answers already in the catalog, and is
+    updated.'''
+    new_answers = {answer for xdid, dirnum, clue, answer in clues if answer and answer not in answers}
+    answers.update(new_answers)
+    with conn:
+        conn.executemany(f'''INSERT INTO xdmeta ({", ".join(XDMETA_COLUMNS)}) VALUES ({", ".join("?"*len(XDMETA_COLUMNS))})
+                             ON CONFLICT (xdid) DO UPDATE SET {", ".join(f"{c}=excluded.{c}" for c in XDMETA_COLUMNS[1:])}''', rows)
+        conn.executemany('DELETE FROM clues WHERE xdid=?', [row[:1] for row in rows])
+        lastid = conn.execute('SELECT MAX(id) FROM clues').fetchone()[0] or 0
+        conn.executemany('INSERT INTO clues (xdid, dirnum, clue, answer) VALUES (?, ?, ?, ?)', clues)
+        conn.execute('INSERT INTO clues_fts (rowid, clue) SELECT id, clue FROM clues WHERE id>?', (lastid,))
+        conn.executemany('INSERT OR IGNORE INTO answers (answer, length) VALUES (?, ?)', [(a, len(a)) for a in new_answers])
+        conn.executemany('INSERT OR IGNORE INTO answer_letters (length, pos, letter, answer) VALUES (?, ?, ?, ?)',
+            [(len(a), i, ch, a) for a in new_answers for i, ch in enumerate(a)])
+        conn.executemany('INSERT OR REPLACE INTO xdfiles (path, xdid, mtime, sha1) VALUES (?, ?, ?, ?)', files)
+
+
+def answer_counts(conn):
+    'Return {answer: number of clues with it} for every answer in the catalog.'
+    return dict(conn.execute("SELECT answer, COUNT(*) FROM clues WHERE answer != '' GROUP BY answer"))
+
+
+def search_clues(conn, text, limit=100):
+    'Return (xdid, dirnum, clue, answer) for up to *limit* clues that contain the words of *text* in order, best matches first.'
+    phrase = '"' + text.replace('"', '""') + '"'
+    return conn.execute('''SELECT clues.xdid, clues.dirnum, clues.clue, clues.answer
+                           FROM clues_fts JOIN clues ON clues.id = clues_fts.rowid
+                           WHERE clues_fts MATCH ? ORDER BY rank LIMIT ?''', (phrase, limit)).fetchall()
+
+
+def match_answers(conn, pattern, limit=1000):
+    'Return up to *limit* distinct answers matching *pattern*, like "A?P?E", where "?", "." or "_" is any one letter; in order.'
+    pattern = re.sub(r'[?._]', '?', pattern.upper())
+    if not re.fullmatch(r'[A-Z0-9?]+', pattern):
+        raise ValueError(f'bad answer pattern {pattern!r}')
+    fixed = [(i, ch) for i, ch in enumerate(pattern) if ch != '?']
+    if not fixed:
+        return [a for a, in conn.execute('SELECT answer FROM answers WHERE length=? ORDER BY answer LIMIT ?', (len(pattern), limit))]
+
+    # look up the rarest letter in its position, and check the rest of the pattern on just those
+    pos, letter = max(fixed, key=lambda f: LETTERS_BY_FREQUENCY.find(f[1]))
+    return [a for a, in conn.execute('''SELECT answer FROM answer_letters WHERE length=? AND pos=? AND letter=? AND answer GLOB ?
+                                        ORDER BY answer LIMIT ?''', (len(pattern), pos, letter, pattern, limit))]
+
+
+def search_answers(conn, pattern, limit=100):
+    'Return (xdid, dirnum, clue, answer) for up to *limit* clues whose answers match *pattern*, as for match_answers().'
+    answers = match_answers(conn, pattern, limit)
+    return conn.execute(f'''SELECT xdid, dirnum, clue, answer FROM clues WHERE answer IN ({",".join("?"*len(answers))})
+                            ORDER BY answer, xdid LIMIT ?''', (*answers, limit)).fetchall()
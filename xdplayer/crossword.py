@@ -0,0 +1,530 @@
+import os
+import sys
+import getpass
+from pathlib import Path
+from array import array
+from collections import namedtuple, defaultdict, Counter
+
+from . import guesslog
+from .storage import open_store
+from .wordindex import WordIndex
+
+__all__ = ['Crossword', 'BoardClue', 'Cross', 'UNFILLED']
+
+UNFILLED = '.'
+
+BoardClue = namedtuple('BoardClue', 'dir num clue answer coords')
+Cross = namedtuple('Cross', 'across down')
+
+
+def parse_xd(contents):
+    '''Return (meta, solution, clues) of .xd *contents*: the header as a dict, the
+    solution as rows of cells (rebus cells expanded), and (dirnum, clue, answer)
+    for each clue line, answer "" if it has none.'''
+    metastr, gridstr, cluestr, *notestr = contents.split('\n\n\n')
+
+    meta = {}
+    for line in metastr.splitlines():
+        k, v = line.split(':', maxsplit=1)
+        meta[k.strip()] = v.strip()
+
+    rebus_soln = dict(r.split('=') for r in meta['Rebus'].split(',')) if 'Rebus' in meta else {}
+
+    solution = [
+        list(rebus_soln.get(ch, ch) for ch in line)
+            for line in gridstr.splitlines()
+    ]
+
+    clues = []
+    for line in cluestr.splitlines():
+        if line:
+            clue, _, answer = line.partition(' ~ ')
+            dirnum, clue = clue.split('. ', maxsplit=1)
+            clues.append((dirnum, clue, answer))
+    return meta, solution, clues
+
+
+class Crossword:
+    'A puzzle and its guesses, without any display.'
+    snapshot_every = 1000  # append a snapshot to the guess log after replaying this many rows
+    rebuschars = '123456789'  # symbols shown for rebus entries
+
+    def __init__(self, fn, store=None):
+        self.checkable = False
+        self.acrosses = []
+        self.downs = []
+        self.circled = []
+        self.rebus = {} # word represented : (display symbol, set((y1, x1), (y2, x2), ... , (yn, xn)))
+
+        # what a display needs to repaint
+        self.dirty_all = True
+        self.dirty = set()  # (x, y) cells
+        self.dirty_words = set()  # dirnums whose clue line shows a changed guess
+        self.stale = set()  # 'clues' (clue panel, notes and solvers) or just 'solvers'
+
+        if fn.endswith('.puz'):
+            self.fn = fn[:-4] + '.xd'
+            self.load_puz(fn)
+        else:
+            self.fn = fn
+            self.load()
+
+        self.filldir = 'A'
+        self.cursor_x = -1
+        self.cursor_y = 0
+        self.cursorRight(1)
+        self.lastpos = 0  # for incremental replay_guesses
+        self.guessino = None  # inode of the guess log, which changes when it is compacted
+        self.readonly = False  # guess log was marked done
+        self.store = store or open_store()  # of $TEAMDIR
+        self.journal = guesslog.Journal(self.guessfn)
+        self.journal.append = self.append_rows
+        self.sync = None  # SyncClient while attached to the sync daemon
+        self.nreplayed = 0  # rows replayed since the last snapshot
+
+        self.undos = []  # list of guess rows that have been written since last move
+        self.notes = defaultdict(list)
+        self.starting_note = 0
+
+    def load(self):
+        self.load_xd(open(self.fn, encoding='utf-8').read())
+
+    def load_puz(self, fn):
+        from .puz2xd import gen_xd
+        self.load_xd('\n'.join(gen_xd(fn)))
+
+    def load_xd(self, contents):
+        self.meta, self.solution, clues = parse_xd(contents)
+
+        self.index = WordIndex(self.solution)
+        self.clear()
+        self.nrows = len(self.grid)
+        self.ncols = len(self.grid[0])
+
+        self.guesser = defaultdict(dict)  # (x,y) -> guess row
+        self.guessercolors = defaultdict(str)
+
+        self.clues = {}  # 'A1' -> Clue
+        for dirnum, clue, answer in clues:
+            dir, num = dirnum[0], int(dirnum[1:])
+            if dir == 'A':
+                self.acrosses.append(dirnum)
+            else:
+                self.downs.append(dirnum)
+            self.clues[dirnum] = BoardClue(dir, num, clue, answer, [])  # final is board positions, filled in below
+
+        self.words = []  # word id -> BoardClue
+        for wid in range(len(self.index)):
+            clue = self.clues[self.index.dirnum(wid)]
+            clue.coords.extend(self.index.coords(wid))
+            self.words.append(clue)
+
+        self.clue_order = array('i', [-1]) * len(self.words)  # word id -> position in self.acrosses or self.downs
+        self.wids = {clue.dir+str(clue.num): wid for wid, clue in enumerate(self.words)}  # 'A1' -> word id
+        for dirnums in (self.acrosses, self.downs):
+            for i, dirnum in enumerate(dirnums):
+                if dirnum in self.wids:
+                    self.clue_order[self.wids[dirnum]] = i
+
+    def clear(self):
+        self.grid = [['#' if x == '#' else UNFILLED for x in row] for row in self.solution]
+        self.redraw()
+
+        # kept up to date by put()
+        self.nfilled = 0  # cells with a guess
+        self.ncorrect = 0  # cells with the right guess
+        self.user_nfilled = Counter()  # user -> cells with their guess
+        self.word_nfilled = array('i', [0]) * len(self.index)  # word id -> cells with a guess
+
+    def put(self, x, y, ch, row):
+        'Set cell (x, y) to *ch* from guess *row*, and update the counts.'
+        self.count(x, y, self.guesser.get((x, y)), -1)
+        self.grid[y][x] = ch
+        self.guesser[(x, y)] = row
+        self.count(x, y, row, 1)
+
+    def count(self, x, y, row, n):
+        ch = self.grid[y][x]
+        if ch in '.#':
+            return
+        self.nfilled += n
+        if ch.upper() == self.solution[y][x].upper():
+            self.ncorrect += n
+        self.user_nfilled[row.get('user', '') if row else ''] += n
+        for dir in 'AD':
+            wid = self.index.word_at(x, y, dir)
+            if wid >= 0:
+                self.word_nfilled[wid] += n
+
+    def is_word_complete(self, dirnum):
+        'Return True if every cell of word *dirnum* ("A1") has a guess.'
+        wid = self.wids.get(dirnum, -1)
+        return wid >= 0 and self.word_nfilled[wid] == self.index.lengths[wid]
+
+    def solve(self):
+        for y, row in enumerate(self.grid):
+            for x, ch in enumerate(row):
+                if ch == UNFILLED:
+                    self.setAt(x, y, self.solution[y][x], user='solver')
+
+    def grade(self):
+        'Return the number of correct tiles'
+        return self.ncorrect
+
+    @property
+    def guessfn(self):
+        return Path(os.getenv('TEAMDIR', '.'))/(self.xdid+'.xd-guesses.jsonl')
+
+    @property
+    def xdid(self):
+        return Path(self.fn).stem
+
+    @property
+    def acr_clues(self):
+        return {k:v for k, v in self.clues.items() if k[0] == 'A'}
+
+    @property
+    def down_clues(self):
+        return {k:v for k, v in self.clues.items() if k[0] == 'D'}
+
+    @property
+    def ncells(self):
+        return self.index.nopen
+
+    @property
+    def nsolved(self):
+        return self.nfilled
+
+    def mark_done(self):
+        self.journal.submit()
+        try:
+            self.store.submit(self.xdid)
+            self.readonly = True
+        except PermissionError:
+            return
+
+    def cell(self, r, c):
+        if r < 0 or c < 0 or r >= self.nrows or c >= self.ncols:
+            return '#'
+        return self.grid[r][c]
+
+    def iteranswers_full(self):
+        'Generate ("A" or "D", clue_num, answer, r, c) for each word in the grid, with its current guesses as answer.'
+        flat = [ch for row in self.grid for ch in row]
+        for wid, clue in enumerate(self.words):
+            c, r = clue.coords[0]
+            yield clue.dir, clue.num, ''.join(flat[i] for i in self.index.cells(wid)), r, c
+
+    def answer(self, dirnum):
+        'Return the solution of word *dirnum* ("A1"), or None if there is no such word.'
+        clue = self.clues.get(dirnum)
+        if clue and clue.coords:
+            return ''.join(self.solution[y][x] for x, y in clue.coords)
+
+    def words_at(self, x, y):
+        'Return Cross(across, down) BoardClues of the words through cell (x, y), or None for either.'
+        a, d = self.index.word_at(x, y, 'A'), self.index.word_at(x, y, 'D')
+        return Cross(self.words[a] if a >= 0 else None, self.words[d] if d >= 0 else None)
+
+    def is_cursor(self, y, x, down=False):
+        'Is the cell located in the current down cursor (down=true) or across cursor (down=False)?'
+        if (x, y) == (self.cursor_x, self.cursor_y):
+            return True
+        dir = 'D' if down else 'A'
+        wid = self.index.word_at(x, y, dir)
+        return wid >= 0 and wid == self.index.word_at(self.cursor_x, self.cursor_y, dir)
+
+    def charcolor(self, y, x, half=True):
+        'Return the curses color key for the character at pos y, x (to be used in half() or opt[key + "attr"]).'
+        ch = self.cell(y, x)
+        if (y, x) in self.circled:
+            return 'circled'
+
+        if ch == '#':
+            return 'block'
+        dcurs = self.is_cursor(y, x, down=True)
+        acurs = self.is_cursor(y, x, down=False)
+        if acurs and dcurs: return 'curacr' if self.filldir == 'A' else 'curdown' # cell is intersect cursor, colored depending on current filldir
+        if acurs: return 'acr' # cell is across cursor, but not intersect
+        if dcurs: return 'down' # cell is down cursor, but not intersect
+
+    @property
+    def curr_dirnum(self):
+        wid = self.index.word_at(self.cursor_x, self.cursor_y, self.filldir)
+        return self.index.dirnum(wid) if wid >= 0 else ''
+
+    def redraw(self):
+        'Repaint everything on the next draw().'
+        self.dirty_all = True
+
+    def touch(self, x, y):
+        'Repaint cell (x, y), the clue lines of the words through it, and the solver legend on the next draw().'
+        self.dirty.add((x, y))
+        for dir in 'AD':
+            wid = self.index.word_at(x, y, dir)
+            if wid >= 0:
+                self.dirty_words.add(self.index.dirnum(wid))
+        self.stale.add('solvers')
+
+    def cursorDown(self, n):
+        i = n
+        while self.cell(self.cursor_y+i, self.cursor_x) == '#' and self.cursor_y+i >= 0 and self.cursor_y+i < self.nrows-1:
+            i += n
+        if self.cell(self.cursor_y+i, self.cursor_x) == '#' or self.cursor_y+i < 0 or self.cursor_y+i >= self.nrows:
+            return
+        self.cursor_y += i
+        self.starting_note = 0
+
+    def cursorRight(self, n):
+        i = n
+        while self.cell(self.cursor_y, self.cursor_x+i) == '#' and self.cursor_x+i >= 0 and self.cursor_x+i < self.ncols:
+            i += n
+        if self.cell(self.cursor_y, self.cursor_x+i) == '#' or self.cursor_x+i < 0 or self.cursor_x+i >= self.ncols:
+            return
+        self.cursor_x += i
+        self.starting_note = 0
+
+    def cursorMove(self, n):
+        if self.filldir == 'A':
+            if self.cell(self.cursor_y, self.cursor_x+n) != '#':
+                self.cursorRight(n)
+        else:
+            if self.cell(self.cursor_y+n, self.cursor_x) != '#':
+                self.cursorDown(n)
+
+    def save(self, fn):
+        with open(fn, 'w') as fp:
+            for y, (k, v) in enumerate(self.meta.items()):
+                fp.write('%s: %s\n' % (k,v))
+            fp.write('\n\n')
+
+            for y, line in enumerate(self.grid):
+                fp.write(''.join(line)+'\n')
+            fp.write('\n\n')
+
+            for clue in self.acr_clues.values():
+                dirnum = f'{clue.dir}{clue.num}'
+                guess = ''.join([self.grid[r][c] for r, c in self.clues[dirnum][-1]])
+                fp.write(f'{dirnum}. {clue.clue} ~ {guess}\n')
+            fp.write('\n')
+
+            for clue in self.down_clues.values():
+                dirnum = f'{clue.dir}{clue.num}'
+                guess = ''.join([self.grid[r][c] for r, c in self.clues[dirnum][-1]])
+                fp.write(f'{dirnum}. {clue.clue} ~ {guess}\n')
+
+    def findCoords(self, dirnum, index=0):
+        'Return (y, x) grid coords for given *index* into answer at *dirnum*.'
+        coords = [(y, x)
+                for (y, x), clues in self.pos.items()
+                for clue in clues
+                if clue.dir == dirnum[0] and str(clue.num) == dirnum[1:]]
+        if dirnum[0] == 'A':
+            return sorted(coords)[index]
+        else:
+            return sorted(coords, key=lambda c: c[1])[index]
+
+    def setAtCursor(self, ch, user=None):
+        self.setAt(self.cursor_x, self.cursor_y, ch, user=user)
+
+    def setAt(self, cursor_x, cursor_y, ch, user=None):
+        self.update_rebus(ch, cursor_x, cursor_y)
+        if self.grid[cursor_y][cursor_x] == ch:
+            return
+
+        row = self.writeEntry(x=cursor_x, y=cursor_y, ch=ch, user=user)
+        prevrow = self.guesser[(cursor_x,cursor_y)]
+        if not prevrow:
+            prevrow = dict(xdid=self.xdid, x=cursor_x, y=cursor_y, ch=UNFILLED)
+        self.undos.append(prevrow)
+
+        # show it now; it is replayed again once the journal is flushed
+        self.put(cursor_x, cursor_y, ch, row)
+        self.add_guesser(row['user'])
+        self.touch(cursor_x, cursor_y)
+
+    def writeEntry(self, **data):
+        if not data.get('user', None):
+            data['user'] = os.getenv('USER', getpass.getuser())
+
+        if not data.get('xdid', None):
+            data['xdid'] = self.xdid
+
+        self.writeRows([data])
+        return data
+
+    def writeRows(self, rows):
+        if self.readonly:
+            raise PermissionError(f'{self.guessfn} is read-only')
+        self.journal.write(rows)
+
+    def reset_guesses(self):
+        'Forget all replayed guesses and notes, to replay the guess log from the start.'
+        self.clear()
+        self.lastpos = 0
+        self.nreplayed = 0
+        self.guesser = defaultdict(dict)
+        self.guessercolors = defaultdict(str)
+        self.rebus = {}
+        self.notes = defaultdict(list)
+
+    def attach(self, sync):
+        'Exchange rows with teammates through SyncClient *sync* instead of the guess log, from the lastpos replayed so far.'
+        self.sync = sync
+        self.journal.append = self.sync_append
+        sync.subscribe(self.xdid, self.lastpos, self.guessino)
+
+    def detach(self):
+        'Go back to appending to and replaying the guess log directly.'
+        self.sync = None
+        self.journal.append = self.append_rows
+
+    def append_rows(self, path, rows, sync=False):
+        self.store.append(self.xdid, rows, sync)
+
+    def sync_append(self, path, rows, sync=False):
+        if not (self.sync and self.sync.append(self.xdid, rows, sync)):
+            self.append_rows(path, rows, sync)  # the daemon went away
+
+    @property
+    def watched(self):
+        'Return (path, size, poll) for an EventLoop to watch for new rows.'
+        return self.store.watched(self)
+
+    def replay_guesses(self):
+        'Replay rows from teammates, and our own once flushed, from the sync daemon if attached, else from the guess log.'
+        if self.sync:
+            msgs = self.sync.receive(self.xdid)
+            if self.sync.closed:
+                self.detach()  # carry on from the guess log, which has everything after lastpos
+            elif any(m.get('reset') for m in msgs):
+                self.replay_stored()  # compacted; start over from the new log
+                self.sync.subscribe(self.xdid, self.lastpos, self.guessino)
+                return
+            else:
+                for m in msgs:
+                    self.readonly = m.get('readonly', self.readonly)
+                    if m.get('pos', 0) > self.lastpos:  # else already replayed from the file
+                        self.lastpos = m['pos']
+                        self.replay_rows(m['rows'])
+                return
+        self.replay_stored()
+
+    def replay_stored(self):
+        'Replay rows after lastpos from the store.'
+        self.store.replay(self)
+
+    def replay_rows(self, rows):
+        for d in rows:
+            if 'note' in d:
+                self.replay_note(d)
+                continue
+            self.replay_guess(d)
+
+        # our own rows still in the journal will be appended after all of these, so keep showing them
+        waiting = {(d['x'], d['y']): d for d in self.journal.rows if 'ch' in d}
+        for (x, y), d in waiting.items():
+            if self.guesser.get((x, y)) is not d:
+                self.replay_guess(d)
+
+        self.nreplayed += len(rows)
+        if self.nreplayed >= self.snapshot_every and not self.readonly:
+            try:
+                self.journal.flush()
+                self.store.snapshot(self)
+                self.nreplayed = 0
+            except PermissionError:
+                pass
+
+    @property
+    def rebus_chars(self):
+        'return set of rebus chars'
+        return {v[0]:k for k, v in self.rebus.items()}
+
+    def update_rebus(self, r, x, y):
+        'r (rebus string), x, y (positions in grid)'
+
+        r = r.upper()
+
+        # check self.grid[y][x] already has a rebus, remove it from self.rebus
+        oldch = self.grid[y][x].upper()
+        if oldch in self.rebus:
+            self.rebus[oldch][1].remove((x, y))
+            # if position set is empty, remove rebus index
+            if not self.rebus[oldch][1]:
+                del self.rebus[oldch]
+
+        if len(r) == 1:
+            return
+
+        if r not in self.rebus:
+            # find new rebus char
+            usedchars = set(self.rebus_chars.keys())
+            newchar = sorted(list(set(self.rebuschars) - usedchars))[0]
+            self.rebus[r] = (newchar, set())
+        self.rebus[r][1].add((x, y))
+
+
+    def replay_guess(self, d):
+        x, y, ch = d['x'], d['y'], d['ch']
+
+        self.update_rebus(ch, x, y)
+
+        self.put(x, y, ch, d)
+        self.touch(x, y)
+
+        self.add_guesser(d.get('user', ''))
+
+    def add_guesser(self, user):
+        if user and user not in self.guessercolors:
+            if len(self.guessercolors) >= 13:
+                self.guessercolors[user] = 'pcw'
+            else:
+                self.guessercolors[user] = 'pc%d' % (len(self.guessercolors)+1)
+
+    def snapshot(self):
+        'Return the state replayed from the guess log, to be saved as a snapshot row.'
+        return dict(xdid=self.xdid,
+                    guesses=[r for r in self.guesser.values() if r],
+                    users=list(self.guessercolors),
+                    rebus={word:[symbol, sorted(cells)] for word, (symbol, cells) in self.rebus.items()},
+                    notes=[d for notes in self.notes.values() for d in notes])
+
+    def restore(self, snap):
+        'Set guesses, guessers, rebus table and notes from a snapshot().'
+        for user in snap['users']:
+            self.add_guesser(user)
+        for d in snap['guesses']:
+            x, y = d['x'], d['y']
+            self.put(x, y, d['ch'], d)
+            self.touch(x, y)
+        self.rebus = {word:(symbol, set(map(tuple, cells))) for word, (symbol, cells) in snap['rebus'].items()}
+        for d in snap['notes']:
+            self.replay_note(d)
+
+    def compact_guesses(self):
+        'Rewrite the guess log as a single snapshot of its current state.'
+        self.journal.flush()
+        self.nreplayed = -sys.maxsize  # no snapshot while catching up, as the compacted log is one
+        try:
+            self.store.compact(self)
+        finally:
+            self.nreplayed = 0
+
+    def replay_note(self, d):
+        self.notes[d['dirnum']].append(d)
+        self.stale.add('clues')
+
+    # Returns the coordinates of the first square of the current + kth across guess
+    def seekAcross(self, k):
+        return self.seek('A', self.acrosses, k)
+
+    # Returns the coordinates of the first square of the current + kth down guess
+    def seekDown(self, k):
+        return self.seek('D', self.downs, k)
+
+    def seek(self, dir, dirnums, k):
+        wid = self.index.word_at(self.cursor_x, self.cursor_y, dir)
+        if wid < 0: return (self.cursor_x, self.cursor_y)
+        next_dirnum = dirnums[(self.clue_order[wid] + k) % len(dirnums)]
+        return self.clues[next_dirnum].coords[0]
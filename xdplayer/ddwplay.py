@@ -1,6 +1,30 @@
+'''
+Play .ddw animations (one JSON row per line, as drawn in VisiData's ddw editor)
+on a curses screen.
+
+Each .ddw is compiled into a flat timeline when loaded, and the timeline cached
+in ~/.cache/xdplayer (under $XDG_CACHE_HOME if set) until the .ddw changes:
+
+    header  b'XDDDWC1\n', source mtime in ns (int64), nstrings, nframes (uint32)
+    strings nstrings of: length (uint32), utf-8
+    frames  nframes of: end ms, nops (uint32), then nops of: dy, dx (int32), text, color (uint32 string numbers)
+'''
+
 from collections import defaultdict
+from pathlib import Path
+import hashlib
+import struct
+import bisect
 import json
 import time
+import os
+
+
+CACHE_MAGIC = b'XDDDWC1\n'
+CACHE_HEADER = struct.Struct('<8sqII')
+CACHE_STRING = struct.Struct('<I')
+CACHE_FRAME = struct.Struct('<II')
+CACHE_OP = struct.Struct('<iiII')
 
 
 class AttrDict(dict):
@@ -11,10 +35,15 @@ class AttrDict(dict):
 
 
 class Animation:
-    def __init__(self, fp):
+    def __init__(self, fp=None):
         self.frames = defaultdict(AttrDict)  # frame.id -> frame row
         self.groups = defaultdict(AttrDict)  # group.id -> group row
-        self.load_from(fp)
+        self.timeline = []
+        self.ends = []
+        self.total_ms = 0
+        self.attrs_for = None
+        if fp is not None:
+            self.load_from(fp)
 
     def iterdeep(self, rows, x=0, y=0, parents=None):
         'Walk rows deeply and generate (row, x, y, [ancestors]) for each row.'
@@ -27,7 +56,7 @@ class Animation:
                 yield from self.iterdeep(g.rows, x+r.x, y+r.y, newparents)
             else:
                 yield r, x+r.x, y+r.y, newparents
-                yield from self.iterdeep(r.rows or [], x+r.x, x+r.y, newparents)
+                yield from self.iterdeep(r.rows or [], x+r.x, y+r.y, newparents)
 
     def load_from(self, fp):
         for line in fp.readlines():
@@ -43,48 +72,168 @@ class Animation:
             else:
                 f.rows.append(r)
 
-        self.total_ms = 0
-        if self.frames:
-            self.total_ms = sum(f.duration_ms or 0 for f in self.frames.values())
+        self.compile()
 
-    def draw(self, scr, t, *args, x=0, y=0, loop=False, **kwargs):
+    def compile(self):
+        '''Flatten the frames once, into self.timeline: the (dy, dx, text, color) to
+        draw for each frame; and self.ends: the ms into the animation that each ends.'''
+        self.timeline = []
+        self.ends = []
+        ms = 0
+        for f in self.frames.values():
+            ms += int(f.duration_ms or 0)
+            self.ends.append(ms)
+            self.timeline.append([(dy, dx, r.text, r.color) for r, dx, dy, _ in self.iterdeep(f.rows) if r.text])
+        self.total_ms = ms
+        self.attrs_for = None  # (id, generation) of the scr.colors that self.attr_timeline is for
+
+    def frame_at(self, t, loop=False):
+        'Return (index of the frame to show *t* seconds in, seconds until the next one), or (None, None) if the animation is over.'
         ms = int(t*1000)
-        if loop:
+        if loop and self.total_ms:
             ms %= self.total_ms
-        for f in self.frames.values():
-            ms -= int(f.duration_ms or 0)
-            if ms < 0:
-                for r, dx, dy, _ in self.iterdeep(f.rows):
-                    scr.addstr(y+dy, x+dx, r.text, scr.colors[r.color])
-
-                return -ms/1000
-
-        if loop:
-            return -ms/1000
+        i = bisect.bisect_right(self.ends, ms)
+        if i >= len(self.ends):
+            return None, None
+        return i, (self.ends[i]-ms)/1000
+
+    def frame_ops(self, scr, t, *args, x=0, y=0, loop=False, **kwargs):
+        'Return ([(y, x, text, attr) to draw on *scr*], seconds until the next frame) for *t* seconds in, or (None, None) if over.'
+        i, nextt = self.frame_at(t, loop)
+        if i is None:
+            return None, None
+        colors = (id(scr.colors), getattr(scr.colors, 'generation', 0))
+        if self.attrs_for != colors:  # colors resolve to attrs once per ColorMaker (and its pairs), not once per glyph
+            self.attrs_for = colors
+            self.attr_timeline = [[(dy, dx, text, scr.colors[color]) for dy, dx, text, color in ops] for ops in self.timeline]
+        return [(y+dy, x+dx, text, attr) for dy, dx, text, attr in self.attr_timeline[i]], nextt
+
+    def draw(self, scr, t, *args, **kwargs):
+        'Draw the frame *t* seconds in on *scr*.  Return seconds until the next frame, or None if the animation is over.'
+        ops, nextt = self.frame_ops(scr, t, *args, **kwargs)
+        for y, x, text, attr in ops or []:
+            scr.addstr(y, x, text, attr)
+        return nextt
+
+
+def cache_path(path):
+    'Return the path of the compiled cache of the .ddw at *path*.'
+    cachedir = Path(os.getenv('XDG_CACHE_HOME') or Path.home()/'.cache')/'xdplayer'
+    key = hashlib.sha1(str(Path(path).absolute()).encode('utf-8')).hexdigest()[:12]
+    return cachedir/f'{Path(path).stem}-{key}.ddwc'
+
+
+def write_cache(anim, cpath, mtime_ns):
+    'Write the timeline of *anim*, compiled from a .ddw last modified at *mtime_ns*, to *cpath*, replacing it at once.'
+    strings = {}  # string -> its number
+    frames = [[(dy, dx, strings.setdefault(text, len(strings)), strings.setdefault(color, len(strings))) for dy, dx, text, color in ops]
+                for ops in anim.timeline]
+
+    blocks = [CACHE_HEADER.pack(CACHE_MAGIC, mtime_ns, len(strings), len(frames))]
+    for string in strings:
+        data = string.encode('utf-8')
+        blocks += [CACHE_STRING.pack(len(data)), data]
+    for end, ops in zip(anim.ends, frames):
+        blocks.append(CACHE_FRAME.pack(end, len(ops)))
+        blocks.extend(CACHE_OP.pack(*op) for op in ops)
+
+    os.makedirs(cpath.parent, exist_ok=True)
+    tmppath = f'{cpath}.tmp{os.getpid()}'
+    with open(tmppath, 'wb') as fp:
+        fp.writelines(blocks)
+    os.replace(tmppath, cpath)
+
+
+def read_cache(cpath, mtime_ns):
+    'Return the Animation cached in *cpath*, or None if there is none for a .ddw last modified at *mtime_ns*.'
+    try:
+        with open(cpath, 'rb') as fp:
+            data = fp.read()
+        magic, mtime, nstrings, nframes = CACHE_HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or mtime != mtime_ns:
+            return None
+
+        off = CACHE_HEADER.size
+        strings = []
+        for i in range(nstrings):
+            n, = CACHE_STRING.unpack_from(data, off)
+            off += CACHE_STRING.size
+            strings.append(data[off:off+n].decode('utf-8'))
+            off += n
+
+        anim = Animation()
+        for i in range(nframes):
+            end, nops = CACHE_FRAME.unpack_from(data, off)
+            off += CACHE_FRAME.size
+            anim.ends.append(end)
+            anim.timeline.append([(dy, dx, strings[text], strings[color]) for dy, dx, text, color in CACHE_OP.iter_unpack(data[off:off+nops*CACHE_OP.size])])
+            off += nops*CACHE_OP.size
+    except (OSError, struct.error, ValueError, IndexError):  # none, or not one we wrote
+        return None
+    anim.total_ms = anim.ends[-1] if anim.ends else 0
+    return anim
+
+
+def load_animation(path):
+    'Return the Animation in the .ddw at *path*, from its cache if that is up to date, else compiling it and caching that.'
+    mtime_ns = os.stat(path).st_mtime_ns
+    cpath = cache_path(path)
+    anim = read_cache(cpath, mtime_ns)
+    if anim is None:
+        with open(path) as fp:
+            anim = Animation(fp)
+        try:
+            write_cache(anim, cpath, mtime_ns)
+        except OSError:
+            pass  # compiled again next time
+        except (AttributeError, struct.error):
+            pass  # a text or color that isn't a string, or a position that isn't an int: it plays, but can't be cached
+    return anim
 
 
 class AnimationMgr:
     def __init__(self):
         self.library = {}  # animation name -> Animation
+        self.sources = {}  # animation name -> path of its .ddw, loaded into the library when first triggered
         self.active = []  # list of (start_time, Animation, args, kwargs)
 
     def trigger(self, name, *args, **kwargs):
-        self.active.append((time.time(), self.library[name], args, kwargs))
+        self.active.append((time.time(), self.get(name), args, kwargs))
+
+    def get(self, name):
+        'Return the Animation registered or loaded as *name*, loading it now if need be.'
+        if name not in self.library:
+            self.library[name] = load_animation(self.sources[name])
+        return self.library[name]
 
     def load(self, name, fp):
         self.library[name] = Animation(fp)
 
+    def register(self, name, path):
+        'Make the .ddw at *path* the animation *name*, to be loaded when first triggered.'
+        self.sources[name] = path
+        self.library.pop(name, None)
+
+    def register_dir(self, dirpath):
+        'Register every .ddw in *dirpath* by its name without the .ddw.'
+        for path in sorted(Path(dirpath).glob('*.ddw')):
+            self.register(path.stem, path)
+
     def draw(self, scr, now):
-        'Draw all active animations on *scr* at time *t*.  Return next t to be called at.'
+        'Draw all active animations on *scr* at time *t*.  Return next t to be called at, or None if nothing is animating.'
         times = []
-        done = []
+        ops = []
+        active = []
         for row in self.active:
             startt, anim, args, kwargs = row
-            nextt = anim.draw(scr, now-startt, *args, **kwargs)
-            if nextt is None:
-                done.append(row)
-            else:
+            frame, nextt = anim.frame_ops(scr, now-startt, *args, **kwargs)
+            if nextt is not None:
+                ops.extend(frame)
                 times.append(startt+nextt)
-        for row in done:
-            self.active.remove(row)
-        return min(times) if times else now
+                active.append(row)
+        self.active = active
+
+        # all in one pass, and what would be drawn over with the same again is drawn just the once, last
+        for y, x, text, attr in reversed(list(dict.fromkeys(reversed(ops)))):
+            scr.addstr(y, x, text, attr)
+        return min(times) if times else None
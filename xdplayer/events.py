@@ -0,0 +1,178 @@
+import os
+import struct
+import selectors
+import threading
+import time
+from collections import deque
+
+
+class StatWatcher:
+    '''Notice when a guess file grows past what has already been replayed, by
+    polling its size, and *poll*() if given, for changes the size may not show.'''
+    def __init__(self, interval=0.5):
+        self.interval = interval  # seconds between stat() calls
+        self.path = None
+        self.size = 0
+        self.poll = None
+
+    def watch(self, path, size, poll=None):
+        self.path = path
+        self.size = size
+        self.poll = poll
+
+    def changed(self):
+        try:
+            if os.stat(self.path).st_size != self.size:
+                return True
+        except (OSError, TypeError):
+            pass
+        return bool(self.poll and self.poll())
+
+
+# from <sys/inotify.h>
+IN_MODIFY, IN_ATTRIB, IN_DELETE_SELF, IN_MOVE_SELF, IN_IGNORED = 0x2, 0x4, 0x400, 0x800, 0x8000
+IN_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (of the name that follows)
+
+
+class InotifyWatcher:
+    '''Notice when a guess file is written, chmodded or replaced, as soon as it
+    happens, through Linux inotify.  Polls like StatWatcher while the file does
+    not exist.  Raises OSError or AttributeError where there is no inotify.'''
+    def __init__(self):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.wd = -1
+        self.path = None
+        self.polling = StatWatcher()
+
+    def fileno(self):
+        return self.fd
+
+    @property
+    def interval(self):
+        return None if self.wd >= 0 else self.polling.interval
+
+    def watch(self, path, size, poll=None):
+        self.polling.watch(path, size, poll)
+        if path != self.path and self.wd >= 0:
+            self.rm_watch(self.fd, self.wd)
+            self.wd = -1
+        self.path = path
+        if self.wd < 0:
+            self.wd = self.add_watch(self.fd, os.fsencode(path), IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    def changed(self):
+        'Return True if the file changed since the last call.'
+        if self.wd < 0:
+            return self.polling.changed()
+
+        changed = False
+        while True:
+            try:
+                buf = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            i = 0
+            while i < len(buf):
+                wd, mask, cookie, namelen = IN_EVENT.unpack_from(buf, i)
+                i += IN_EVENT.size + namelen
+                if wd == self.wd:
+                    changed = True
+                    if mask & (IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        self.wd = -1  # maybe replaced by compaction; watch whatever is at the path now
+
+        if self.wd < 0:
+            self.watch(self.path, self.polling.size, self.polling.poll)
+        return changed
+
+
+def default_watcher():
+    'Return an InotifyWatcher if this system has inotify, else a StatWatcher.'
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return StatWatcher()
+
+
+class EventLoop:
+    '''Block until there is something new to show: a key on *infd*, new guesses
+    from teammates, or a deadline.  Meanwhile, run the callbacks of work done in
+    the background by submit().'''
+    def __init__(self, infd=0, watcher=None):
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(infd, selectors.EVENT_READ, 'key')
+        self.watcher = watcher or default_watcher()
+        self.watchfd = None
+        self.register()
+        self.wakefds = None  # (read, write) ends of the pipe that background work wakes the selector with
+        self.finished = deque()  # (callback, result, exception) of background work, for wait() to call
+
+    def submit(self, func, *args, then=None):
+        '''Run *func*(*args*) in a thread of its own, and once it returns, have
+        wait() call *then*(result, None), or *then*(None, exception) if it
+        raised.  *func* must not touch anything the main thread uses.'''
+        if self.wakefds is None:
+            self.wakefds = os.pipe()
+            os.set_blocking(self.wakefds[0], False)
+            self.selector.register(self.wakefds[0], selectors.EVENT_READ, 'done')
+
+        def work():
+            try:
+                self.finished.append((then, func(*args), None))
+            except Exception as e:
+                self.finished.append((then, None, e))
+            os.write(self.wakefds[1], b'.')
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def run_finished(self):
+        'Call the callbacks of the background work that has finished.'
+        try:
+            os.read(self.wakefds[0], 4096)
+        except BlockingIOError:
+            pass
+        while self.finished:
+            then, result, exc = self.finished.popleft()
+            if then:
+                then(result, exc)
+
+    def register(self):
+        'Select on the fd of the watcher, which can change, as when a sync client falls back to the guess log.'
+        fd = self.watcher.fileno() if hasattr(self.watcher, 'fileno') else None
+        if fd != self.watchfd:
+            if self.watchfd is not None:
+                self.selector.unregister(self.watchfd)
+            if fd is not None:
+                self.selector.register(fd, selectors.EVENT_READ, 'guesses')
+            self.watchfd = fd
+
+    def watch(self, path, size=0, poll=None):
+        'Wake up when *path* is bigger than *size* bytes (or, where it has to be polled, when *poll*() returns True).'
+        self.watcher.watch(path, size, poll)
+
+    def changed(self):
+        'Return True if there are new guesses, without waiting.'
+        return self.watcher.changed()
+
+    def wait(self, deadline=None):
+        'Return "key", "guesses" or "timer" for whichever happens first; *deadline* is a time.time() value or None.'
+        while True:
+            self.register()
+            timeout = self.watcher.interval  # None when the watcher wakes the selector itself
+            if deadline is not None:
+                timeout = max(0, deadline-time.time() if timeout is None else min(timeout, deadline-time.time()))
+
+            ready = [key.data for key, events in self.selector.select(timeout)]
+            if 'done' in ready:
+                self.run_finished()
+            if 'key' in ready:
+                return 'key'
+            if self.watcher.changed():
+                return 'guesses'
+            if deadline is not None and time.time() >= deadline:
+                return 'timer'
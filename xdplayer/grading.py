@@ -0,0 +1,97 @@
+'''
+Grade the guesses of every team against the solved puzzles, into the solvings
+table of $XDDB.
+
+Each puzzle is replayed from a checkpoint of its state as of the last grading,
+kept in the grade_checkpoints table, so only rows appended since are read.
+Puzzles whose store progress (mtime, ctime, submitted) is the same as at the
+checkpoint are not opened at all.
+'''
+
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+from .crossword import Crossword
+from .storage import open_store, STORES
+from .pool import run_pool
+
+
+CHECKPOINT_SCHEMA = '''CREATE TABLE IF NOT EXISTS grade_checkpoints (
+    teamid TEXT NOT NULL,
+    xdid TEXT NOT NULL,
+    progress TEXT NOT NULL,  -- json of the storage.Progress that was graded
+    pos INTEGER NOT NULL,    -- Crossword.lastpos
+    ino INTEGER,             -- Crossword.guessino
+    state TEXT NOT NULL,     -- json of Crossword.snapshot()
+    PRIMARY KEY (xdid, teamid))'''
+
+
+def replay_from(xd, checkpoint=None):
+    'Replay the guesses of *xd* from *checkpoint* (pos, ino, state), or from the start.'
+    xd.snapshot_every = sys.maxsize  # only read the store
+    xd.reset_guesses()
+    if checkpoint:
+        pos, ino, state = checkpoint
+        xd.restore(state)
+        xd.lastpos, xd.guessino = pos, ino
+    xd.replay_stored()
+
+
+def find_jobs(conn, teamdirs, kind=None, everything=False):
+    '''Generate a grade_job for each puzzle of each of *teamdirs* whose progress in
+    its store (of *kind*, default $XDSTORE) changed since it was last graded, or
+    with *everything*, for every puzzle.  Puzzles not in xdmeta are reported and skipped.'''
+    kind = kind or os.getenv('XDSTORE') or 'jsonl'
+    conn.execute(CHECKPOINT_SCHEMA)
+    paths = dict(conn.execute('SELECT xdid, path FROM xdmeta'))
+    checkpoints = {(teamid, xdid): (progress, (pos, ino, state))
+        for teamid, xdid, progress, pos, ino, state in conn.execute('SELECT teamid, xdid, progress, pos, ino, state FROM grade_checkpoints')}
+
+    for teamdir in teamdirs:
+        teamid = Path(teamdir).resolve().name
+        if kind == 'sqlite' and not os.path.exists(os.path.join(teamdir, 'guesses.db')):
+            continue
+        store = STORES[kind](teamdir)  # not open_store(), which would be inherited by the workers
+        for xdid, progress in sorted(store.progress().items()):
+            progress = json.dumps(list(progress))
+            old, checkpoint = checkpoints.get((teamid, xdid), (None, None))
+            if old == progress and not everything:
+                continue
+            if xdid not in paths:
+                print(f'{teamdir}: {xdid} is not in xdmeta', file=sys.stderr)
+                continue
+            yield paths[xdid], str(teamdir), kind, teamid, progress, checkpoint
+        del store
+
+
+def grade_job(job):
+    '''Grade one (xdpath, teamdir, kind, teamid, progress, checkpoint) for grade_all, and
+    return (teamid, xdid, progress, result or None, error or None).'''
+    xdpath, teamdir, kind, teamid, progress, checkpoint = job
+    xdid = Path(xdpath).stem
+    try:
+        xd = Crossword(xdpath, store=open_store(kind, teamdir))
+        replay_from(xd, checkpoint and (checkpoint[0], checkpoint[1], json.loads(checkpoint[2])))
+        result = dict(correct=xd.grade(), nonblocks=xd.ncells, submitted=int(xd.readonly), nreplayed=xd.nreplayed,
+                      checkpoint=(xd.lastpos, xd.guessino, json.dumps(xd.snapshot())))
+        return teamid, xdid, progress, result, None
+    except Exception as e:
+        return teamid, xdid, progress, None, f'{type(e).__name__}: {e}'
+
+
+def grade_all(jobs, processes=None):
+    'Run grade_job for every job across *processes* processes (see run_pool).'
+    return run_pool(grade_job, jobs, processes, maxchunk=16)
+
+
+def save_results(conn, results):
+    'Write the solvings and checkpoints of successful grade_job *results* in one transaction.'
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        conn.executemany('''INSERT OR REPLACE INTO solvings (xdid, teamid, date_checked, correct, nonblocks, submitted) VALUES (?, ?, ?, ?, ?, ?)''',
+            [(xdid, teamid, now, r['correct'], r['nonblocks'], r['submitted']) for teamid, xdid, progress, r in results])
+        conn.executemany('''INSERT OR REPLACE INTO grade_checkpoints (teamid, xdid, progress, pos, ino, state) VALUES (?, ?, ?, ?, ?, ?)''',
+            [(teamid, xdid, progress, *r['checkpoint']) for teamid, xdid, progress, r in results])
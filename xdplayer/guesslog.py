@@ -0,0 +1,210 @@
+'''
+Low-level access to $TEAMDIR/<xdid>.xd-guesses.jsonl.
+
+Every guess, erase, undo and note is appended as one json line.  Now and then a
+snapshot line is appended as well:
+
+    {"snapshot": {"pos": <offset>, "guesses": [...], "users": [...], "rebus": {...}, "notes": [...]}}
+
+which holds the full state as of byte offset *pos*, so that replay can start
+from the last snapshot instead of from 0.  Lines between *pos* and the snapshot
+itself were written by other players meanwhile and are replayed after it.  Of
+the players replaying the same rows, only one appends each snapshot (see
+append_snapshot()).
+
+Compaction rewrites the whole file as a single snapshot.  It holds an exclusive
+flock on the old file while doing so, and appenders hold a shared one, so no
+line is lost; appenders that find the file was replaced under them try again.
+
+The player writes through a Journal, which batches rows into a single append.
+When it flushes is set by $XDFLUSH, a comma-separated list of any of:
+
+    <n>s    flush rows that have waited <n> seconds
+    <n>     flush once <n> rows are waiting
+    idle    flush whenever the player is waiting for a key
+
+(default "1s,32"); it also always flushes on quit and when switching puzzles.
+$XDFSYNC is "always" (fsync every batch), "submit" (only when the puzzle is
+completed; the default) or "never".
+'''
+
+import os
+import json
+import stat
+import time
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows; compaction is then only safe offline
+    fcntl = None
+
+
+SNAPSHOT_MARK = b'{"snapshot":'
+CHUNK = 65536
+
+
+def lock(fd, how):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX if how == 'ex' else fcntl.LOCK_SH)
+
+
+def append(path, rows, sync=False):
+    'Append *rows* (dicts) to *path* in a single O_APPEND write, and fsync if *sync*.'
+    data = ''.join(json.dumps(r) + '\n' for r in rows).encode('utf-8')
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            lock(fd, 'sh')
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:  # else compacted meanwhile
+                if data:
+                    os.write(fd, data)
+                if sync:
+                    os.fsync(fd)
+                return
+        finally:
+            os.close(fd)
+
+
+def parse_policy(policy):
+    'Return (secs, nrows, on_idle) for an $XDFLUSH string.'
+    secs, nrows, on_idle = None, None, False
+    for tok in policy.split(','):
+        tok = tok.strip()
+        if tok == 'idle':
+            on_idle = True
+        elif tok.endswith('s'):
+            secs = float(tok[:-1])
+        elif tok:
+            nrows = int(tok)
+    return secs, nrows, on_idle
+
+
+class Journal:
+    'Buffer rows for the guess log at *path* and append them in batches.'
+    def __init__(self, path, policy=None, fsync=None):
+        self.path = path
+        self.append = append  # or something else taking the same arguments, like a sync daemon client
+        self.secs, self.nrows, self.on_idle = parse_policy(policy or os.getenv('XDFLUSH', '1s,32'))
+        self.fsync = fsync or os.getenv('XDFSYNC', 'submit')
+        self.rows = []
+        self.firstt = 0  # when the oldest waiting row was written
+
+    def write(self, rows):
+        if not self.rows:
+            self.firstt = time.time()
+        self.rows.extend(rows)
+        if self.nrows and len(self.rows) >= self.nrows:
+            self.flush()
+
+    def deadline(self):
+        'Return the time.time() by which waiting rows should be flushed, or None.'
+        if self.rows and self.secs is not None:
+            return self.firstt + self.secs
+
+    def idle(self):
+        'Flush if the policy says to, now that the player is about to wait for a key.'
+        deadline = self.deadline()
+        if self.on_idle or (deadline is not None and time.time() >= deadline):
+            self.flush()
+
+    def flush(self, sync=False):
+        'Append all waiting rows in one write.  With *sync*, also fsync the log even if nothing was waiting.'
+        sync = sync or (self.rows and self.fsync == 'always')
+        if self.rows or (sync and os.path.exists(self.path)):
+            self.append(self.path, self.rows, sync=sync)
+            self.rows = []  # only once written, so a failed append can be retried
+
+    def submit(self):
+        'Flush before the log is marked read-only, durably unless fsync is "never".'
+        self.flush(sync=self.fsync != 'never')
+
+
+def snapshot_row(state, pos):
+    'Return the log row for snapshot *state* (a dict), which includes everything before offset *pos*.'
+    return dict(snapshot=dict(state, pos=pos))
+
+
+def append_snapshot(path, state, pos, every):
+    '''Append the snapshot row of *state*() as of offset *pos* to *path*, unless
+    the last snapshot there is fewer than *every* lines before *pos*, as when
+    another player replaying the same rows has just appended one.  The check and
+    the append are done under an exclusive flock, so of several players only
+    one appends.  Return whether the row was appended.'''
+    with open(path, 'ab+') as fp:
+        lock(fp.fileno(), 'ex')
+        if os.fstat(fp.fileno()).st_ino != os.stat(path).st_ino:
+            return False  # compacted meanwhile, into a snapshot
+        end, snap = last_snapshot(fp)
+        if snap is not None:
+            if end > pos:
+                return False
+            fp.seek(end)
+            if fp.read(pos-end).count(b'\n') < every:
+                return False
+        fp.write((json.dumps(snapshot_row(state(), pos)) + '\n').encode('utf-8'))
+        return True
+
+
+def find_snapshot(fp):
+    'Return the last complete snapshot in binary file *fp*, or None.'
+    return last_snapshot(fp)[1]
+
+
+def last_snapshot(fp):
+    'Return (offset after it, snapshot) for the last complete snapshot in binary file *fp*, or (0, None).'
+    fp.seek(0, os.SEEK_END)
+    pos = fp.tell()
+    tail = b''  # start of the previous chunk, in case a mark straddles chunks
+    while pos > 0:
+        n = min(CHUNK, pos)
+        pos -= n
+        fp.seek(pos)
+        buf = fp.read(n) + tail
+        i = len(buf)
+        while True:
+            i = buf.rfind(SNAPSHOT_MARK, 0, i)
+            if i < 0 or (i == 0 and pos > 0):
+                break
+            if i == 0 or buf[i-1:i] == b'\n':
+                fp.seek(pos+i)
+                line = fp.readline()
+                if line.endswith(b'\n'):
+                    try:
+                        return pos+i+len(line), json.loads(line)['snapshot']
+                    except ValueError:
+                        pass
+        tail = buf[:len(SNAPSHOT_MARK)]
+    return 0, None
+
+
+def read_rows(fp, pos, end=None, bad=None):
+    '''Return (rows, newpos) for the complete lines in binary file *fp* from offset *pos* (to *end*), skipping snapshots.
+    A line that is not json raises ValueError, unless *bad* is a list, which it is added to instead.'''
+    fp.seek(pos)
+    data = fp.read() if end is None else fp.read(max(0, end-pos))
+    end = data.rfind(b'\n')+1  # leave any half-written last line for next time
+    lines = [line for line in data[:end].splitlines() if line and not line.startswith(SNAPSHOT_MARK)]
+    if bad is None:
+        return [json.loads(line) for line in lines], pos+end
+    rows = []
+    for line in lines:
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            bad.append(line)
+    return rows, pos+end
+
+
+def compact(path, catchup, state):
+    '''Replace *path* with a single snapshot row of *state*().  *catchup*() is
+    called first with other writers locked out, to replay their last lines.'''
+    with open(path, 'rb') as fp:
+        lock(fp.fileno(), 'ex')
+        catchup()
+        st = os.fstat(fp.fileno())
+        tmp = f'{path}.compacting'
+        with open(tmp, 'w', encoding='utf-8') as out:
+            out.write(json.dumps(snapshot_row(state(), 0)) + '\n')
+        os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        os.utime(tmp, (st.st_atime, st.st_mtime))
+        os.replace(tmp, path)
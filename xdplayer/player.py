@@ -0,0 +1,850 @@
+from unittest import mock
+import copy
+import sys
+import textwrap
+import time
+import string
+import curses
+from pathlib import Path
+from collections import OrderedDict
+
+from .tui import *
+from .crossword import *
+from .ddwplay import AnimationMgr
+from .events import EventLoop
+from .syncd import SyncClient
+from .storage import open_store
+from .wordlist import WordList, wordlist_path, LETTERS
+from .ttymeter import frame_marker
+import visidata
+from visidata import clipdraw, EscapeException
+
+opt = OptionsObject(
+    fgbgattr = ['white on black', 'underline'],
+    fgattr = ['white'],
+    bgattr = ['black'],
+    gridattr = ['white'],
+    unsolvedattr = ['white'],
+    acrattr = ['210'],
+    downattr = ['74'],
+    arrowacrattr = ['black on white'],
+    arrowdownattr = ['black on white'],
+    curacrattr = ['175'],
+    curdownattr = ['189'],
+    blockattr = ['white'],
+    pc1attr = ['121 on black'],
+    pc2attr = ['153 on black'],
+    pc3attr = ['220 on black'],
+    pc4attr = ['13 on black'],
+    pc5attr = ['76 on black'],
+    pc6attr = ['177 on black'],
+    pc7attr = ['229 on black'],
+    pc8attr = ['166 on black'],
+    pc9attr = ['163 on black'],
+    pc10attr = ['80 on black'],
+    pc11attr = ['100 on black'],
+    pc12attr = ['56 on black'],
+    pc13attr = ['27 on black'],
+    circledattr = ['red'],
+    helpattr = ['bold 109', 'bold 108', ],
+    clueattr = ['7'],
+    filledclueattr = ['245', '7'],
+
+    sepch = list(' '+c+' ' for c in '·‧˙|.□-∙•╺ '),
+    topch = '▁_',
+    topattr = ['white', 'underline'],
+    botch = '▇⎴',
+    botattr = ['black on white'],
+    midblankch = '█',
+    leftblankch = '▌',
+#    rightblankch = '▐',
+#    rightch = '▎▌│',
+#    leftch = '▊▐│',
+#    vline = '│┃|┆┇┊┋',
+#    inside_vline = ' │|┆┃┆┇┊┋',
+    leftattr = ['', 'reverse'],
+    unsolved_char = '· .?□_▁-˙∙•╺‧',
+    rightarrow = '⇨→↪⇢',
+    downarrow = '⇩↓⇓⇣⬇',
+    dirarrow = '⇨→↪⇢',
+
+    hotkeys= False,
+)
+
+
+def half(colors, fg_coloropt, bg_coloropt):
+    'Return curses color code for {fg_coloropt} colored character on a {bg_coloropt} colored background.'
+    return colors['%s on %s' % (opt[fg_coloropt+'attr'][0], opt[bg_coloropt+'attr'][0])]
+
+def fill_colour(colornamestr, ch):
+    'Return the one colour that *ch* drawn in *colornamestr* (as for ColorMaker) fills its cell with, or None if it shows anything more.'
+    fgbg = [0, 0]
+    attrs = set()
+    isbg = False
+    for colorname in colornamestr.split(' '):
+        if colorname == 'on': isbg = True
+        elif hasattr(curses, 'A_'+colorname.upper()):
+            attrs.add(colorname)
+        elif colorname and not fgbg[isbg]:
+            fgbg[isbg] = int(colorname) if colorname.isdigit() else getattr(curses, 'COLOR_'+colorname.upper(), 0)
+    fg, bg = fgbg
+    if 'reverse' in attrs:
+        fg, bg = bg, fg
+        attrs.remove('reverse')
+    if attrs:
+        return None
+    if ch == ' ' or (ch == '▌' and fg == bg):
+        return bg
+
+
+class CrosswordView(Crossword):
+    'A Crossword that draws itself on a curses screen.'
+    clue_minw = 25  # screen columns kept for the clues
+    def __init__(self, fn, store=None):
+        super().__init__(fn, store)
+        self.drawn = {}  # state as of the last draw()
+        self.clue_rows = {}  # dirnum -> (screen row, number of lines)
+        self.clue_layout = {}  # screen row -> clue
+        self.attrs = {}  # key -> (curses attr, colour a blank in it shows), for draw_row
+        self.attrs_for = None  # (colors, their generation, options version) that self.attrs were resolved with
+        self.clue_scroll = {}  # 'A' or 'D' -> index of the first clue shown in that direction
+        self.move_grid(3, len(self.meta), 80, 25)
+
+    def move_grid(self, x, y, w, h):
+        'Lay out the grid with its top left at screen (*x*, *y*), and the clues to its right on a *w*x*h* screen.'
+        self.grid_left = x
+        self.grid_top = y
+        self.grid_bottom = self.grid_top + self.nrows
+        self.grid_right = self.grid_left + self.ncols*2
+        self.clue_left = min(self.grid_right, w-self.clue_minw+2)+3
+        self.clue_top = self.grid_top
+
+    def draw(self, scr):
+        'Repaint whatever changed since the last draw(), or everything after redraw().'
+        if not scr:
+            scr = mock.MagicMock(__bool__=mock.Mock(return_value=False))
+        # so that tests don't try to draw to the screen
+        if not scr.colors:
+            return
+
+        h, w = scr.getmaxyx()
+
+        meta = copy.copy(self.meta)
+        if 'Rebus' in meta:
+            del meta['Rebus']
+        if self.rebus:
+            meta['Rebus'] = ' '.join(sorted(f'{symbol}={word}' for word, (symbol, _) in self.rebus.items()))
+
+        self.move_grid(3, max(0, min(h-self.nrows-2, len(meta)+1)), w, h)
+
+        # scroll the grid to keep the cursor on screen
+        miny = max(0, min(self.cursor_y - h//2, self.nrows-h+2))
+        minx = max(-1, min(self.cursor_x - (w-self.clue_minw)//4, self.ncols-(w-self.clue_minw)//2))
+
+        cursor_across, cursor_down = self.words_at(self.cursor_x, self.cursor_y)
+        cursor_words = {f'{c.dir}{c.num}':c for c in (cursor_across, cursor_down) if c}
+
+        # anything that moves or restyles the whole grid needs a full repaint
+        view = (h, w, miny, minx, self.filldir, self.checkable, tuple(meta.items()))
+        if view != self.drawn.get('view'):
+            self.dirty_all = True
+
+        # the clue panel, notes and solvers follow the cursor's words
+        panels = (tuple(cursor_words), self.curr_dirnum, self.starting_note, self.max_solver_rows)
+        if panels != self.drawn.get('panels'):
+            self.stale.add('clues')
+
+        # cells that enter or leave the cursor's words change colour
+        prev = self.drawn.get('cursor')
+        if prev and prev[:2] != (self.cursor_x, self.cursor_y):
+            px, py, prev_words = prev
+            self.dirty.update([(px, py), (self.cursor_x, self.cursor_y)])
+            for dirnum in prev_words.keys() ^ cursor_words.keys():
+                self.dirty.update((prev_words.get(dirnum) or cursor_words[dirnum]).coords)
+
+        if self.dirty_all:
+            scr.erase()
+            scr.bkgd(' ', opt.fgbgattr)
+
+            # draw meta
+            y = 0
+            for k, v in meta.items():
+                if y >= self.grid_top-1:
+                    break
+                clipdraw(scr, y, 1, '%10s: %s' % (k, v), 0)
+                y += 1
+
+            # draw grid
+            nrows = min(self.nrows-miny, h-self.grid_top)
+            ncols = min(self.ncols-minx, (w-self.clue_minw-self.grid_left+1)//2+1)
+            for y in range(miny, miny+nrows):
+                self.draw_row(scr, y, range(minx, minx+ncols), miny, minx)
+
+            clipdraw(scr, self.grid_top-1, self.grid_left, opt.topch*(self.ncols*2+1), opt.topattr)
+            clipdraw(scr, self.grid_top+nrows, self.grid_left, opt.botch*(ncols*2-1), opt.botattr)
+        else:
+            # the half-block right of each cell takes the colour of its neighbour
+            rows = {}
+            for x, y in self.dirty | set((x-1, y) for x, y in self.dirty):
+                if miny <= y < self.nrows and minx <= x < self.ncols:
+                    rows.setdefault(y, []).append(x)
+            for y, xs in rows.items():
+                self.draw_row(scr, y, sorted(xs), miny, minx)
+
+        repaint_panels = self.dirty_all or 'clues' in self.stale
+        if not repaint_panels:
+            # redraw just the clue lines showing a changed guess, if they still fit
+            for dirnum in self.dirty_words:
+                if dirnum in self.clue_rows:
+                    cluey, nlines = self.clue_rows[dirnum]
+                    clue = self.clues[dirnum]
+                    if any(self.clue_layout.get(y) != clue for y in range(cluey, cluey+nlines)):
+                        repaint_panels = True  # partly covered by the other direction's clues
+                    elif self.draw_clue(scr, cluey, clue, cursor_words.get(dirnum), w, h) != nlines:
+                        repaint_panels = True
+
+        if repaint_panels:
+            if not self.dirty_all:
+                clear_area(scr, self.clue_top, h-2, self.clue_left-2)
+                clear_area(scr, self.grid_bottom+1, h-2, 0)
+
+            self.clue_layout = {}
+            self.clue_rows = {}
+            clueh = self.nrows//2-1
+            self.draw_clues(scr, self.clue_top, self.acr_clues, cursor_across, clueh)
+            self.draw_clues(scr, self.clue_top+clueh+2, self.down_clues, cursor_down, clueh)
+
+            self.draw_notes(scr)
+            self.draw_solvers(scr)
+        elif 'solvers' in self.stale:
+            for y in range(self.grid_bottom+1, min(self.grid_bottom+self.max_solver_rows+1, h-2)):
+                scr.addstr(y, self.grid_left, ' '*(self.clue_left-2-self.grid_left))
+            self.draw_solvers(scr)
+
+        self.drawn = dict(view=view, panels=panels, cursor=(self.cursor_x, self.cursor_y, cursor_words))
+        self.dirty_all = False
+        self.dirty.clear()
+        self.dirty_words.clear()
+        self.stale.clear()
+
+    def attr(self, scr, key):
+        '''Return (curses attr, the colour that a blank in it fills the cell with or
+        None) for *key*, resolving them only once until the options or the screen
+        colors change.  For separators, the colour is of the separator itself.'''
+        try:
+            return self.attrs[key]
+        except KeyError:
+            pass
+        kind, clr, fclr = key
+        if kind == 'reverse':  # a cell in the cursor's words
+            colornames = opt[clr+'attr'][0]
+            # a colour reversed, as a pair of its own, so the terminal needs no escapes to turn reverse on and off
+            colornames = f'black on {colornames}' if ' ' not in colornames else colornames + ' reverse'
+            a = (scr.colors[colornames], fill_colour(colornames, ' '))
+        elif kind == 'half':  # a separator between cells of colours *clr* and *fclr*
+            colornames = '%s on %s' % (opt[(clr or 'bg')+'attr'][0], opt[(fclr or 'bg')+'attr'][0])
+            a = (half(scr.colors, clr or 'bg', fclr or 'bg'), fill_colour(colornames, opt.leftblankch))
+        elif clr+'attr' in opt:
+            colornames = opt[clr+'attr'][0]
+            a = (scr.colors[colornames], fill_colour(colornames, ' '))
+        else:
+            a = (0, None)
+        self.attrs[key] = a
+        return a
+
+    def draw_row(self, scr, y, xs, miny, minx):
+        """Draw the characters of the cells *xs* (ascending) of row *y* and the
+        half-block separators to their right, for a grid scrolled to (minx, miny),
+        with one addstr per run of adjacent characters of the same attr.  A
+        separator that fills its cell with the background of the character
+        before it is drawn as a blank in that character's attr, to join its run."""
+        h, w = scr.getmaxyx()
+        scry = self.grid_top+y-miny
+        if scry > h-1:
+            return
+        colors = (id(scr.colors), getattr(scr.colors, 'generation', 0), opt.version)
+        if self.attrs_for != colors:
+            self.attrs = {}
+            self.attrs_for = colors
+
+        ch2 = opt.leftblankch  # printed second half
+        unsolved_char = opt.unsolved_char
+        rightarrow, downarrow = opt.rightarrow, opt.downarrow
+        row, solution = self.grid[y], self.solution[y]
+        runs = []  # [screen x, characters, attr]
+        def add(scrx, ch, attr):
+            if runs and runs[-1][2] == attr and runs[-1][0]+len(runs[-1][1]) == scrx:
+                runs[-1][1].append(ch)
+            else:
+                runs.append([scrx, [ch], attr])
+
+        nextclr = self.charcolor(y, xs[0]) if xs else None
+        prevx = None
+        for x in xs:
+            scrx = self.grid_left-1+(x-minx)*2
+            if scrx > w-self.clue_minw:
+                break
+
+            ch = row[x] if 0 <= x < self.ncols else '#'
+            clr = nextclr if prevx == x-1 else self.charcolor(y, x)
+            nextclr = self.charcolor(y, x+1)
+            ch1 = ch if len(ch) == 1 else self.rebus[ch][0] # printed character
+
+            if clr in ('acr', 'down', 'curacr', 'curdown'):
+                attr1, fill1 = self.attr(scr, ('reverse', clr, None))
+            elif ch != '#':
+                attr1, fill1 = self.attr(scr, ('option', self.guessercolors.get(self.guesser[(x,y)].get('user', ''), 'fgbg'), None))
+                if self.checkable and solution[x] != ch:
+                    attr1 |= curses.A_UNDERLINE
+                    fill1 = None
+                clr = None
+            else:
+                attr1, fill1 = self.attr(scr, ('option', clr, None))
+
+            if ch == UNFILLED:
+                ch1 = unsolved_char
+            elif ch == '#':
+                if self.filldir == 'A':
+                    ch1 = rightarrow
+                    attr1, fill1 = self.attr(scr, ('option', 'arrowacr', None))
+                else:
+                    ch1 = downarrow
+                    attr1, fill1 = self.attr(scr, ('option', 'arrowdown', None))
+
+            attr2, fill2 = self.attr(scr, ('half', clr, nextclr or 'bg'))  # colour of ch2
+
+            if x >= 0:  # don't show left corners
+                add(scrx, ch1, attr1)
+                if fill2 is not None and fill2 == fill1:
+                    add(scrx+1, ' ', attr1)
+                else:
+                    add(scrx+1, ch2, attr2)
+            else:
+                add(scrx+1, ch2, attr2)
+            prevx = x
+
+        for scrx, chars, attr in runs:
+            scr.addstr(scry, scrx, ''.join(chars), attr)
+
+    def draw_clues(self, scr, clue_top, clues, cursor_clue, n):
+        '''Draw clues in one direction, from the same one as last time if the cursor's
+        clue is still in full view, so that moving the cursor repaints only the
+        clues it leaves and enters; otherwise from two before the cursor's.'''
+        h, w = scr.getmaxyx()
+        dirnums = list(clues.values())
+        if not dirnums:
+            return 0
+        i = dirnums.index(cursor_clue) if cursor_clue else 0
+        first = self.clue_scroll.get(dirnums[0].dir, 0)
+        if not self.clue_shown(dirnums, first, i, clue_top, n, w, h):
+            first = max(i-2, 0)
+        self.clue_scroll[dirnums[0].dir] = first
+
+        y = 0  # number of clue lines drawn
+        for j, clue in enumerate(dirnums[first:]):
+            if y >= n and j > 2 or clue_top+y >= h-2:
+                return y
+            y += self.draw_clue(scr, clue_top+y, clue, cursor_clue, w, h)
+
+    def clue_shown(self, dirnums, first, i, clue_top, n, w, h):
+        'Return whether draw_clues() starting from clue *first* would show all of clue *i*.'
+        if not first <= i < len(dirnums):
+            return False
+        y = 0
+        for j, clue in enumerate(dirnums[first:i+1]):
+            if y >= n and j > 2 or clue_top+y >= h-2:
+                return False
+            y += len(self.wrap_clue(clue, w)[-1])
+        return clue_top+y <= h-2
+
+    def wrap_clue(self, clue, w):
+        'Return (dirnum, width of its column, width of the text, the lines of the clue and its guess) for a screen *w* wide.'
+        dirnum = f'{clue.dir}{clue.num}'
+        guess = ''.join([self.grid[c][r] for r, c in self.clues[dirnum][-1]])
+        dnw = len(dirnum)+2
+        maxw = max(min(w-self.clue_left-dnw-1, 40), 1)
+        return dirnum, dnw, maxw, textwrap.wrap(clue.clue + f' [{guess}]', width=maxw)
+
+    def draw_clue(self, scr, y, clue, cursor_clue, w, h):
+        'Draw one clue with its current guess at screen row *y*.  Return the number of lines it took.'
+        if cursor_clue == clue:
+            attr = (opt.acrattr if clue.dir == 'A' else opt.downattr) | curses.A_REVERSE
+            if self.filldir == clue.dir:
+                arrow = opt.rightarrow if self.filldir == 'A' else opt.downarrow
+                clipdraw(scr, y, self.clue_left-2, f'{arrow} ', (opt.acrattr if clue.dir == 'A' else opt.downattr))
+        elif self.is_word_complete(clue.dir+str(clue.num)):
+            attr = opt.filledclueattr
+        else:
+            attr = opt.clueattr
+
+        dirnum, dnw, maxw, lines = self.wrap_clue(clue, w)
+
+        # add a user coloured "*", for the most recent user
+        # who left a note
+        note = self.notes.get(dirnum, None)
+        if note:
+            note_attr = self.get_user_attr(note[-1]['user'])
+            clipdraw(scr, y, self.clue_left, "*", note_attr)
+
+        for j, line in enumerate(lines):
+            if y+j >= h-2:
+                break
+            prefix = f'{dirnum}. ' if j == 0 else ' '*dnw
+            line = prefix + line + ' '*(maxw-len(line))
+            self.clue_layout[y+j] = clue
+            clipdraw(scr, y+j, self.clue_left+1, line, attr)
+
+        self.clue_rows[dirnum] = (y, len(lines))
+        return len(lines)
+
+    def draw_solvers(self, scr):
+        y = 0
+        x = 0
+        colnames = []
+        nameattrs = [
+            ('%s (%d%%)' % (user, self.user_nfilled[user]*100/self.ncells), getattr(opt, color+'attr'))
+                for user, color in self.guessercolors.items()
+        ]
+
+        for name, attr in nameattrs:
+            colnames.append(name)
+            clipdraw(scr, self.grid_bottom+y+1, self.grid_left+x, name, attr)
+            y += 1
+            if y >= self.max_solver_rows:
+                y = 0
+                x += max(len(x) for x in colnames)+3
+                colnames = []
+
+    @property
+    def max_solver_rows(self):
+        return max(1, len(self.guessercolors)//5+1)
+
+    def get_user_attr(self, username):
+        return getattr(opt, self.guessercolors.get(username, 'fg')+'attr')
+
+    def draw_notes(self, scr):
+        h, w = scr.getmaxyx()
+        notes = self.notes.get(self.curr_dirnum, None)
+        if not notes: return
+        curr_y = self.grid_bottom+self.max_solver_rows+2
+
+        maxnamew = max(len(x['user']) for x in notes)
+        maxcluew = max(min(w-self.clue_left-1-1, 40), 1)
+        maxw = self.clue_left+maxcluew-20-maxnamew
+        if self.starting_note < 0:
+            self.starting_note = 0
+        if self.starting_note > len(notes)-2:
+            self.starting_note = len(notes)-2
+        for note in notes[self.starting_note:]:
+            localtime = time.strftime("%b %2d  %H:%M", time.localtime(note.get("time", time.time())))
+            username = f' {localtime} <{note["user"]}> '
+            attr = self.get_user_attr(note["user"])
+            clipdraw(scr, curr_y, self.grid_left, username, attr)
+            lines = textwrap.wrap(note['note'], width=maxw)
+            for j, line in enumerate(lines):
+                line = ' ' + line + ' '*(maxw-len(line)+1)
+                clipdraw(scr, curr_y, self.grid_left+17+maxnamew, line, attr)
+                curr_y += 1
+            if curr_y >= h-2:
+                break
+
+    def draw_hotkeys(self, scr):
+        self.hotkeys = {}
+        h, w = scr.getmaxyx()
+        for i, (k, v) in enumerate(opt.items()):
+            key = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMN"[i]
+            self.hotkeys[key] = k
+
+            y = self.grid_top+self.nrows+i+1
+            if y < h-1:
+                clipdraw(scr, y, 3, key, 0)
+                clipdraw(scr, y, 5, k, 0)
+                clipdraw(scr, y, 15, ' '.join(map(str, v)), 0)
+
+
+class CrosswordCache:
+    'Parse puzzles when first used, and keep only the *maxsize* most recently used.'
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.crosswords = OrderedDict()  # path -> Crossword
+        self.failed = {}  # path -> mtime (None if missing) when prefetch() could not parse it
+        self.pending = set()  # paths being parsed in the background
+
+    def get(self, path):
+        xd = self.crosswords.pop(path, None) or CrosswordView(path)
+        self.add(path, xd)
+        return xd
+
+    def add(self, path, xd):
+        self.crosswords[path] = xd
+        while len(self.crosswords) > self.maxsize:
+            self.crosswords.popitem(last=False)
+
+    def prefetch(self, path, events=None):
+        '''Parse *path* ahead of its first use, in the background if given an
+        EventLoop to *events*.  Any error is left for get() to raise, and *path*
+        is not prefetched again until its mtime changes.'''
+        if path in self.crosswords or path in self.pending:
+            return
+        try:
+            mtime = Path(path).stat().st_mtime
+        except OSError:
+            mtime = None
+        if path in self.failed and self.failed[path] == mtime:
+            return
+
+        def done(xd, exc):
+            self.pending.discard(path)
+            if exc:
+                self.failed[path] = mtime
+            else:
+                self.failed.pop(path, None)
+                if path not in self.crosswords:  # else get() parsed it meanwhile
+                    self.add(path, xd)
+
+        if events is None:
+            try:
+                done(CrosswordView(path), None)
+            except Exception as e:
+                done(None, e)
+        else:
+            # the store is opened here, as its sqlite connection cannot be shared across threads
+            self.pending.add(path)
+            events.submit(CrosswordView, path, open_store(), then=done)
+
+
+class CrosswordPlayer:
+    def __init__(self, crossword_paths, sync=None):
+        from collections import deque
+        self.sync = sync  # SyncClient, or None to use the guess logs directly
+        self.statuses = []
+        self.crossword_paths = deque(crossword_paths)
+        self.crosswords = CrosswordCache()
+        self.n = 0
+        self.xd = None
+        self.startt = time.time()
+        self.lastpos = 0
+        self.animmgr = AnimationMgr()
+        self.animmgr.register_dir(Path(__file__).parent/'ddw')  # loaded when first triggered
+        self.completed = False
+        self.lastkey = ''
+        self.nextt = None  # when the next animation frame is due
+        self.recolored = False  # whether the last frame had to repaint for color pairs given other colors
+        self.bottom = None  # what the bottom two lines showed as of the last frame
+        try:
+            self.words = WordList(wordlist_path())
+        except (OSError, ValueError):
+            self.words = None  # no hints until xdimport.py writes one
+        self.next_crossword()
+
+
+    def next_crossword(self):
+        if self.xd:
+            self.xd.journal.flush()
+            self.xd.detach()
+
+        for i in range(len(self.crossword_paths)):
+            path = self.crossword_paths[0]
+            self.crossword_paths.rotate(-1)
+            try:
+                self.xd = self.crosswords.get(path)
+                break
+            except Exception as e:
+                if i == len(self.crossword_paths)-1:
+                    raise
+                self.status(f'skipped {path}: {e}')
+
+        self.xd.reset_guesses()
+        self.xd.replay_guesses()
+        if self.sync and not self.sync.closed:
+            self.xd.attach(self.sync)
+
+    def status(self, s):
+        self.statuses.append(s)
+
+    def hint(self, xd):
+        'Show the answers in the word list that fit the current word, as guessed so far.'
+        dirnum = xd.curr_dirnum
+        if not dirnum:
+            self.status('no word here to hint')
+        elif not self.words:
+            self.status(f'no word list in {wordlist_path()}; run xdimport.py')
+        else:
+            cells = [xd.grid[y][x] for x, y in xd.clues[dirnum].coords]
+            pattern = ''.join(ch if ch in LETTERS else '?' for ch in cells)
+            self.status(f'{dirnum} {pattern}: ' + (' '.join(self.words.match(cells)) or 'no matches'))
+
+    def prefetch(self, events=None):
+        'Parse the next puzzle, so ^N is instant.  Called while waiting for input, which *events* can keep taking meanwhile.'
+        self.crosswords.prefetch(self.crossword_paths[0], events)
+
+    def next_deadline(self):
+        'Return the time.time() at which the screen next needs redrawing, if nothing else happens first.'
+        # the clock blinks its colon at every 5th second and 1s after
+        s = int(time.time()-self.startt)+1
+        while s % 5 not in (0, 1):
+            s += 1
+        return min(t for t in (self.startt+s, self.nextt, self.xd.journal.deadline()) if t)
+
+    def play_one(self, scr, xd):
+        h, w = scr.getmaxyx()
+        generation = getattr(scr.colors, 'generation', 0)
+        if opt.hotkeys:
+            xd.redraw()  # the options overlay goes over everything
+        erased = xd.dirty_all  # draw() is about to start from a blank screen
+        try:
+            xd.draw(scr)
+        except Exception:
+            self.next_crossword()  # which repaints everything
+            erased = True
+
+        solvedamt = '%d/%d' % (xd.nsolved, xd.ncells)
+
+        # draw time on bottom
+        secs = time.time()-self.startt
+        timestr = '% 2d' % (secs//3600) if secs > 3600 else '  '
+        timestr += ' ' if int(secs) % 5 == 0 else ':'
+        timestr += '%02d' % ((secs % 3600)//60)
+
+        h, w = scr.getmaxyx()
+
+        if h < xd.nrows+4 or w < xd.ncols+40:
+            botline = [timestr, solvedamt] + [f'terminal is {w}x{h}; need {2*xd.ncols+20}x{xd.nrows+4}']
+        else:
+            botline = [timestr, solvedamt] + list("Tab direction | ^Q quit | ^N next puzzle | ^Z undo | ^Y note | ^R rebus | ^W hint".split(' | '))
+
+        # the bottom two lines are redrawn only when they change, or an animation may have drawn over them
+        bottom = (h, w, xd.clue_left, self.statuses[-1] if self.statuses else None, opt.sepch.join(botline), opt.version)
+        if erased or bottom != self.bottom or self.animmgr.active:
+            clear_area(scr, h-2, h, 0)
+            if self.statuses:
+                clipdraw(scr, h-2, xd.clue_left, self.statuses[-1], 0)
+            clipdraw(scr, h-1, 4, opt.sepch.join(botline), opt.helpattr)
+            self.bottom = bottom
+
+        if opt.hotkeys:
+            xd.draw_hotkeys(scr)
+            clipdraw(scr, 1, w-20, f'{h}x{w}', 0)
+
+        self.nextt = self.animmgr.draw(scr, time.time())
+
+        # if crossword is complete, check correct cell count
+        if xd.nsolved == xd.ncells:
+            correct = xd.grade()
+
+            if correct == xd.ncells:
+                if not self.completed:
+                    xd.mark_done()
+                    self.animmgr.trigger('completed', loop=True, x=1, y=h-3)
+                    self.status('puzzle complete! nicely done')
+                    self.completed = True
+            else:
+                self.xd.checkable=True
+                self.status(f'no cigar! {xd.ncells - correct} are wrong')
+        else:
+            self.xd.checkable=False
+
+        if getattr(scr.colors, 'generation', 0) != generation:
+            # color pairs already on screen were given other colors: repaint it all, right away,
+            # unless this is that repaint, and the screen has more colors than the terminal has pairs
+            xd.redraw()
+            if not self.recolored:
+                self.nextt = time.time()
+            self.recolored = True
+        else:
+            self.recolored = False
+
+        # send the frame in one go; getkeystroke() then has nothing left to refresh
+        scr.noutrefresh()
+        scr.doupdate()
+
+        k = scr.getkeystroke()
+        self.lastkey = k
+        if k == '^Q': return True
+        if not k: return False
+        if k == 'KEY_RESIZE': h, w = scr.getmaxyx()
+        if k == '^L': scr.clear(); xd.redraw()
+        if k == '^N':
+            self.next_crossword()  # erases and repaints, but only sends what differs
+            self.statuses=[]
+        if k == '^R':
+            clipdraw(scr, h-2, 1, 'rebus:', opt.fgattr)
+            self.bottom = None
+            scr.timeout(-1)
+            r = editline(scr, h-2, 8, w-1)
+            xd.setAtCursor(r.upper())
+
+        if k == '^Y':
+            if self.xd.curr_dirnum:
+                try:
+                    clipdraw(scr, h-2, 1, 'note: ', opt.fgattr)
+                    self.bottom = None
+                    scr.timeout(-1)
+                    note = editline(scr, h-2, 7, w-8)
+                    self.xd.writeEntry(dirnum=self.xd.curr_dirnum, note=note, time=time.time())
+                    self.xd.journal.flush()  # notes are only shown once replayed
+                except Exception as e:
+                    self.status(str(e))
+                except EscapeException:
+                    pass
+            else:
+                clipdraw(scr, h-2, 1, 'couldn\'t find a clue here! try changing direction', opt.fgattr)
+                self.bottom = None
+                scr.timeout(-1)
+                scr.getkeystroke()
+
+        if opt.hotkeys:
+            clipdraw(scr, 0, w-20, k, 0)
+            clipdraw(scr, 0, w-5, str(self.n), 0)
+        self.n += 1
+
+        if k == 'KEY_MOUSE':
+            devid, x, y, z, bstate = curses.getmouse()
+            if xd.grid_top <= y < xd.grid_bottom and xd.grid_left <= x < xd.grid_right:
+                x = (x-xd.grid_left)//2
+                y = y-xd.grid_top
+                if xd.grid[y][x] != '#':
+                    xd.cursor_x = x
+                    xd.cursor_y = y
+            elif y in xd.clue_layout:
+                xd.cursor_x, xd.cursor_y = xd.clue_layout[y][-1][0]
+            else:
+                self.status(f'{bstate}({y},{x})')
+        elif k in ['KEY_NPAGE', '^F']:
+            xd.starting_note += 1
+        elif k in ['KEY_PPAGE', '^B']:
+            xd.starting_note -= 1
+        elif k == 'KEY_HOME':
+            xd.starting_note = 0
+        elif k == 'KEY_END':
+            xd.starting_note = len(xd.notes[xd.curr_dirnum])-2
+        elif k == 'KEY_DOWN': xd.cursorDown(+1); xd.undos.clear()
+        elif k == 'KEY_UP': xd.cursorDown(-1); xd.undos.clear()
+        elif k == 'KEY_LEFT': xd.cursorRight(-1); xd.undos.clear()
+        elif k == 'KEY_RIGHT': xd.cursorRight(+1); xd.undos.clear()
+        elif k == 'KEY_SRIGHT':
+            if xd.filldir == 'A':
+                xd.cursor_x, xd.cursor_y = xd.seekAcross(1)
+            else:
+                xd.cursor_x, xd.cursor_y = xd.seekDown(1)
+            xd.undos.clear()
+        elif k == 'KEY_SLEFT':
+            if xd.filldir == 'A':
+                xd.cursor_x, xd.cursor_y = xd.seekAcross(-1)
+            else:
+                xd.cursor_x, xd.cursor_y = xd.seekDown(-1)
+            xd.undos.clear()
+        elif k == '^I': xd.filldir = 'A' if xd.filldir == 'D' else 'D'
+        elif k == '^W': self.hint(xd)
+        #elif k == '^S': xd.mark_done(); self.status('puzzle submitted!')
+        elif k == '^X':
+            opt.hotkeys = not opt.hotkeys
+            xd.redraw()
+            return
+        elif k == '^Z':
+            if not xd.undos:
+                self.status('nothing to undo')
+                return
+            rows = xd.undos[::-1]
+            xd.undos.clear()
+            xd.writeRows(rows)
+            for r in rows:
+                xd.replay_guess(r)
+            xd.cursor_x = rows[-1]['x']
+            xd.cursor_y = rows[-1]['y']
+
+        elif k == 'KEY_BACKSPACE':  # back up and erase
+            xd.cursorMove(-1)
+            xd.setAtCursor(UNFILLED)
+        elif k == ' ':  # erase and advance
+            xd.setAtCursor(UNFILLED)
+            xd.cursorMove(+1)
+        elif k == 'KEY_DC':  # erase in place
+            xd.setAtCursor(UNFILLED)
+        elif k == 'KEY_F(2)':  # solve puzzle
+            xd.solve()
+        elif k == '@':  # circle letter
+            coord = (xd.cursor_y, xd.cursor_x)
+            if coord in xd.circled:
+                xd.circled.remove(coord)
+            else:
+                xd.circled.append(coord)
+            xd.touch(xd.cursor_x, xd.cursor_y)
+        elif k in xd.rebus_chars:
+            xd.setAtCursor(xd.rebus_chars[k])
+        elif opt.hotkeys and k in xd.hotkeys:
+            opt.cycle(xd.hotkeys[k])
+            xd.redraw()
+        elif k.upper() in string.ascii_uppercase:
+            xd.setAtCursor(k.upper())
+            xd.cursorMove(+1)
+
+
+def editline(scr, y, x, w):
+    'Edit a line of input at (*y*, *x*), with the terminal cursor where it is typed.'
+    scr.leaveok(False)
+    try:
+        return visidata.vd.editline(scr, y, x, w)
+    finally:
+        scr.leaveok(True)
+
+
+def init_curses(scr):
+    curses.use_default_colors()
+    curses.raw()
+    curses.meta(1)
+    curses.curs_set(0)
+    scr.leaveok(True)  # the cursor is hidden, so don't send it anywhere after each frame
+    curses.mousemask(-1)
+
+
+class ScrWrapper:
+    def __init__(self, scr):
+        self.scr = scr
+    def __getattr__(self, k):
+        return getattr(self.scr, k)
+
+def main_player(scr, *args):
+    init_curses(scr)
+    scr = ScrWrapper(scr)
+    scr.colors = ColorMaker(scr.scr)
+    scr.getkeystroke = lambda x=scr: getkeystroke(scr)
+    opt.scr = scr
+
+    mark_frame = frame_marker()  # if a TtyMeter is counting our output
+    def doupdate():
+        curses.doupdate()
+        if mark_frame:
+            mark_frame()
+    scr.doupdate = doupdate
+
+    sync = SyncClient.connect() if open_store().name == 'jsonl' else None  # None if xdsyncd is not running
+    plyr = CrosswordPlayer(args, sync)
+    events = EventLoop(sys.stdin.fileno(), sync)
+    try:
+        while True:
+            scr.timeout(0)  # only read keys that the event loop says are waiting
+            changed = False
+            try:
+                if plyr.play_one(scr, plyr.xd):
+                    break
+
+                # sleep until a key, new guesses, or the next clock/animation frame/journal flush;
+                # after a key, go around again first in case curses has more buffered
+                events.watch(*plyr.xd.watched)
+                if plyr.lastkey:
+                    changed = events.changed()
+                else:
+                    plyr.xd.journal.idle()
+                    plyr.prefetch(events)
+                    changed = events.wait(plyr.next_deadline()) == 'guesses'
+            except PermissionError as e:
+                plyr.status('puzzle submitted! submitted puzzles cannot be changed')
+
+            if changed:
+                plyr.xd.replay_guesses()  # from other player(s), and our own once flushed
+    finally:
+        try:
+            plyr.xd.journal.flush()
+        except PermissionError:
+            pass
@@ -0,0 +1,23 @@
+'''
+Run one function over many jobs in a pool of processes, for the batch tools
+(catalog imports, grading, .puz conversion) whose jobs are independent.
+'''
+
+import os
+
+
+def run_pool(func, jobs, processes=None, maxchunk=64):
+    '''Run *func* for every job across *processes* processes (default one per
+    core), and generate the results in whatever order they finish.  Each
+    process is sent up to *maxchunk* jobs at a time.  With one process or one
+    job, everything runs in this process.'''
+    jobs = list(jobs)
+    if processes == 1 or len(jobs) < 2:
+        yield from map(func, jobs)
+        return
+
+    import multiprocessing
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, min(maxchunk, len(jobs) // (4*processes)))
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(func, jobs, chunksize)
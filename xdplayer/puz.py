@@ -1,6 +1,9 @@
 ﻿import functools
+import array
+import mmap
 import operator
 import math
+import os
 import string
 import struct
 import sys
@@ -95,25 +98,57 @@ Extensions = enum(
 )
 
 
-def read(filename):
+def read(filename, validate=True, mapped=False):
     """
     Read a .puz file and return the Puzzle object.
     throws PuzzleFormatError if there's any problem with the file format.
+    validate=False skips the checksums; call Puzzle.validate() later if needed.
+    mapped=True memory-maps the file instead of reading it; the map stays
+    open for as long as the Puzzle refers to it.
     """
     with open(filename, 'rb') as f:
-        return load(f.read())
+        if mapped and os.fstat(f.fileno()).st_size:
+            return load(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), validate=validate)
+        return load(f.read(), validate=validate)
 
 
-def load(data):
+def load(data, validate=True):
     """
     Read .puz file data and return the Puzzle object.
     throws PuzzleFormatError if there's any problem with the file format.
+    validate=False skips the checksums; call Puzzle.validate() later if needed.
     """
     puz = Puzzle()
-    puz.load(data)
+    puz.load(data, validate=validate)
     return puz
 
 
+def scan(dirname):
+    """
+    Generate (filename, meta, error) for the .puz files in *dirname*, where
+    *meta* is a dict of the width, height, title, author and copyright of the
+    puzzle and whether its solution is locked, or None if the file could not
+    be read, and *error* is then the exception.  Each file is memory-mapped and
+    only its header and those strings are parsed, so the rest is never read.
+    """
+    for fn in sorted(os.listdir(dirname)):
+        if not fn.endswith('.puz'):
+            continue
+        fn = os.path.join(dirname, fn)
+        try:
+            with open(fn, 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    raise PuzzleFormatError('empty file')
+                p = Puzzle()
+                p.load_meta(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            meta = dict(width=p.width, height=p.height, title=p.title, author=p.author,
+                        copyright=p.copyright, locked=p.is_solution_locked())
+        except (OSError, PuzzleFormatError) as e:
+            yield fn, None, e
+        else:
+            yield fn, meta, None
+
+
 class PuzzleFormatError(Exception):
     """
     Indicates a format error in the .puz file. May be thrown due to
@@ -123,9 +158,52 @@ class PuzzleFormatError(Exception):
         self.message = message
 
 
+class Decoded:
+    """
+    Puzzle string attribute that load() leaves as a view into the file data,
+    decoded the first time it is read.  With *split*, the view holds that
+    many nul-separated strings, and the attribute is a list of them.
+    """
+    def __init__(self, split=False):
+        self.split = split
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.raw = '_raw_' + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        d = obj.__dict__
+        if self.name not in d:
+            raw = d.pop(self.raw)
+            if self.split:
+                raw, n = raw
+                d[self.name] = str(raw, ENCODING).split('\0')[:n] if n else []
+            else:
+                d[self.name] = str(raw, ENCODING)
+        return d[self.name]
+
+    def __set__(self, obj, value):
+        obj.__dict__.pop(self.raw, None)
+        obj.__dict__[self.name] = value
+
+    def set_raw(self, obj, raw):
+        obj.__dict__.pop(self.name, None)
+        obj.__dict__[self.raw] = raw
+
+
 class Puzzle:
     """Represents a puzzle
     """
+    title = Decoded()
+    author = Decoded()
+    copyright = Decoded()
+    fill = Decoded()
+    solution = Decoded()
+    clues = Decoded(split=True)
+    notes = Decoded()
+
     def __init__(self):
         """Initializes a blank puzzle
         """
@@ -153,9 +231,62 @@ class Puzzle:
         self.solution_state = SolutionState.Unlocked
         self.helpers = {}  # add-ons like Rebus and Markup
 
-    def load(self, data):
+    def load(self, data, validate=True):
+        """
+        Parse .puz *data* (bytes, bytearray or mmap).  The strings are left as
+        views into *data* until used.
+        """
+        s = PuzzleBuffer(data)
+        numclues, cksum_gbl, cksum_hdr, cksum_magic = self._load_header(s)
+        cls = type(self)
+        cls.solution.set_raw(self, s.read(self.width * self.height))
+        cls.fill.set_raw(self, s.read(self.width * self.height))
+
+        cls.title.set_raw(self, s.read_raw_string())
+        cls.author.set_raw(self, s.read_raw_string())
+        cls.copyright.set_raw(self, s.read_raw_string())
+
+        cls.clues.set_raw(self, (s.read_raw_strings(numclues), numclues))
+        cls.notes.set_raw(self, s.read_raw_string())
+
+        ext_cksum = {}
+        while s.can_unpack(EXTENSION_HEADER_FORMAT):
+            code, length, cksum = s.unpack(EXTENSION_HEADER_FORMAT)
+            ext_cksum[code] = cksum
+            # extension data is represented as a null-terminated string,
+            # but since the data can contain nulls we can't use read_string
+            self.extensions[code] = bytes(s.read(length))
+            s.read(1)  # extensions have a trailing byte
+            # save the codes in order for round-tripping
+            self._extensions_order.append(code)
+
+        # sometimes there's some extra garbage at
+        # the end of the file, usually \r\n
+        if s.can_read():
+            self.postscript = bytes(s.read_to_end())
+
+        self._file_cksums = (cksum_gbl, cksum_hdr, cksum_magic, ext_cksum)
+        if validate:
+            self.validate()
+
+    def load_meta(self, data):
+        """
+        Parse only the header, title, author and copyright of .puz *data*, as
+        decoded strings, for scan().  The solution, fill, clues and notes are not
+        read, and the Puzzle can't be used for anything else.
+        """
         s = PuzzleBuffer(data)
+        self._load_header(s)
+        s.read(2 * self.width * self.height)  # solution and fill
+        self.title = str(s.read_raw_string(), ENCODING)
+        self.author = str(s.read_raw_string(), ENCODING)
+        self.copyright = str(s.read_raw_string(), ENCODING)
 
+    def _load_header(self, s):
+        """
+        Read the preamble and header from PuzzleBuffer *s*, and return
+        (number of clues, global, header and magic checksums).
+        """
         # advance to start - files may contain some data before the
         # start of the puzzle use the ACROSS&DOWN magic string as a waypoint
         # save the preamble for round-tripping
@@ -164,7 +295,7 @@ class Puzzle:
                                     "puzzle. Are you sure you didn't intend "
                                     "to use read?")
 
-        self.preamble = s.data[:s.pos]
+        self.preamble = bytes(s.view[:s.pos])
 
         puzzle_data = s.unpack(HEADER_FORMAT)
         cksum_gbl = puzzle_data[0]
@@ -183,32 +314,14 @@ class Puzzle:
         self.solution_state = puzzle_data[12]
 
         self.version = self.fileversion[:3]
-        self.solution = s.read(self.width * self.height).decode(ENCODING)
-        self.fill = s.read(self.width * self.height).decode(ENCODING)
-
-        self.title = s.read_string()
-        self.author = s.read_string()
-        self.copyright = s.read_string()
-
-        self.clues = [s.read_string() for i in range(0, numclues)]
-        self.notes = s.read_string()
-
-        ext_cksum = {}
-        while s.can_unpack(EXTENSION_HEADER_FORMAT):
-            code, length, cksum = s.unpack(EXTENSION_HEADER_FORMAT)
-            ext_cksum[code] = cksum
-            # extension data is represented as a null-terminated string,
-            # but since the data can contain nulls we can't use read_string
-            self.extensions[code] = s.read(length)
-            s.read(1)  # extensions have a trailing byte
-            # save the codes in order for round-tripping
-            self._extensions_order.append(code)
-
-        # sometimes there's some extra garbage at
-        # the end of the file, usually \r\n
-        if s.can_read():
-            self.postscript = s.read_to_end()
+        return numclues, cksum_gbl, cksum_hdr, cksum_magic
 
+    def validate(self):
+        """
+        Check the checksums read by load() against the puzzle contents.
+        throws PuzzleFormatError if any does not match.
+        """
+        cksum_gbl, cksum_hdr, cksum_magic, ext_cksum = self._file_cksums
         if cksum_gbl != self.global_cksum():
             raise PuzzleFormatError('global checksum does not match')
         if cksum_hdr != self.header_cksum():
@@ -319,6 +432,16 @@ class Puzzle:
 
         return True
 
+    def recover_key(self, processes=1):
+        """
+        Return a key for unlock_solution, found by trying every 4-digit key,
+        or None if none fits.  The checksum is only 16 bits, so now and then
+        more than one key fits; this returns the lowest.
+        """
+        keys = find_keys(self.solution, self.width, self.height,
+                         self.scrambled_cksum, processes=processes)
+        return keys[0] if keys else None
+
     def lock_solution(self, key):
         if not self.is_solution_locked():
             # set the scrambled bit and cksum
@@ -394,44 +517,65 @@ class Puzzle:
 class PuzzleBuffer:
     """PuzzleBuffer class
     wraps a data buffer ('' or []) and provides .puz-specific methods for
-    reading and writing data
+    reading and writing data.  Reads return memoryviews into the buffer,
+    not copies.
     """
     def __init__(self, data=None):
         self.data = data or []
         self.pos = 0
+        self.end = len(self.data)
+        self.view = memoryview(self.data) if data else None
 
     def can_read(self, n_bytes=1):
-        return self.pos + n_bytes <= len(self.data)
+        return self.pos + n_bytes <= self.end
 
     def length(self):
-        return len(self.data)
+        return self.end
 
     def read(self, n_bytes):
         start = self.pos
         self.pos += n_bytes
-        return self.data[start:self.pos]
+        return self.view[start:self.pos]
 
     def read_to_end(self):
         start = self.pos
         self.pos = self.length()
-        return self.data[start:self.pos]
+        return self.view[start:self.pos]
 
     def read_string(self):
         return self.read_until(b'\0')
 
     def read_until(self, c):
+        return str(self.read_raw_until(c), ENCODING)
+
+    def read_raw_string(self):
+        return self.read_raw_until(b'\0')
+
+    def read_raw_until(self, c):
         start = self.pos
         self.seek_to(c, 1)  # read past
-        return str(self.data[start:self.pos-1], ENCODING)
+        return self.view[start:self.pos-1]
+
+    def read_raw_strings(self, n):
+        'Like read_raw_string, but for *n* strings, still separated by their nuls.'
+        start = pos = self.pos
+        find = self.data.find
+        for i in range(n):
+            pos = find(b'\0', pos, self.end) + 1
+            if not pos:
+                self.pos = self.length()
+                return self.view[start:self.pos-1]
+        self.pos = pos
+        return self.view[start:max(start, pos-1)]
 
     def seek_to(self, s, offset=0):
-        try:
-            self.pos = self.data.index(s, self.pos) + offset
-            return True
-        except ValueError:
+        i = self.data.find(s, self.pos, self.end)
+        if i < 0:
             # s not found, advance to end
             self.pos = self.length()
             return False
+        self.pos = i + offset
+        return True
 
     def write(self, s):
         self.data.append(s)
@@ -449,7 +593,7 @@ class PuzzleBuffer:
     def unpack(self, struct_format):
         start = self.pos
         try:
-            res = struct.unpack_from(struct_format, self.data, self.pos)
+            res = struct.unpack_from(struct_format, self.view, self.pos)
             self.pos += struct.calcsize(struct_format)
             return res
         except struct.error:
@@ -596,18 +740,32 @@ class Markup:
 
 
 # helper functions for cksums and scrambling
+
+def ror16():
+    """Return every 16-bit cksum right-shifted one with wrap-around, as an
+    array('H') built when first needed.  each step depends on the previous one
+    (the add drops its carry), so it can't be vectorized; a lookup per byte is
+    the cheapest way to do it in Python."""
+    global _ror16
+    if _ror16 is None:
+        _ror16 = array.array('H', bytes(0x20000))
+        _ror16[0::2] = array.array('H', range(0x8000))  # even: the low bit falls off
+        _ror16[1::2] = array.array('H', range(0x8000, 0x10000))  # odd: it wraps to the top
+    return _ror16
+
+_ror16 = None
+
+
 def data_cksum(data, cksum=0):
-    for b in data:
-        if isinstance(b, bytes):
-            b = ord(b)
-        # right-shift one with wrap-around
-        lowbit = (cksum & 0x0001)
-        cksum = (cksum >> 1)
-        if lowbit:
-            cksum = (cksum | 0x8000)
+    """Return the cksum of *data*, continuing from *cksum*.  *data* is bytes,
+    or an iterable of bytes chunks (or of ints)."""
+    ror = ror16()
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = b''.join(bytes((chunk,)) if isinstance(chunk, int) else chunk for chunk in data)
 
-        # then add in the data and clear any carried bit past 16
-        cksum = (cksum + b) & 0xffff
+    for b in data:
+        # rotate, then add in the data and clear any carried bit past 16
+        cksum = ror[cksum] + b & 0xffff
 
     return cksum
 
@@ -658,6 +816,101 @@ def unscramble_string(s, key):
     return s
 
 
+def find_keys(scrambled, width, height, cksum, keys=range(1000, 10000), processes=1):
+    """
+    Return the keys among *keys* that unscramble the *scrambled* solution
+    into one with scrambled_cksum *cksum*, trying them all at once.  With
+    *processes* > 1, the keys are split across that many processes, which
+    only pays for itself on big grids.
+
+    Each round of unscramble_string is an unshuffle and a cut, which only
+    depend on one key digit, and an unshift by all four.  The unshifts are
+    deferred: a code byte per letter counts how often it was unshifted by
+    each digit, so the cuts for the last digits are shared between keys and
+    each key is finished with a few translate()s.  The checksums of all keys
+    are then computed side by side, one 24-bit lane per key of a big int.
+    """
+    letters = square(scrambled, width, height).replace(BLACKSQUARE, '')
+    if not letters or letters.strip(string.ascii_uppercase):
+        return []  # rebus or garbage; unscramble_string would fail too
+
+    keys = sorted(set(keys))
+    if processes > 1:
+        import multiprocessing
+        parts = [(letters, cksum, keys[i::processes]) for i in range(processes)]
+        with multiprocessing.Pool(processes) as pool:
+            return sorted(k for part in pool.map(_find_keys_part, parts) for k in part)
+    return _find_keys_part((letters, cksum, keys))
+
+
+_FROM_ASCII = bytes.maketrans(string.ascii_uppercase.encode(ENCODING), bytes(range(26)))
+_TO_ASCII = bytes(ord('A') + v % 26 for v in range(256))
+
+# code = n0 + 5*n1 + 25*n2 for a letter unshifted n_j times by key digit j
+# in the first three rounds (n3 is the rest); _UNSHIFTS[j] maps code -> n_j
+_UNSHIFTS = [
+    int.from_bytes(bytes(max(0, n) for n in ns), 'little')
+    for ns in zip(*[(c % 5, c // 5 % 5, c // 25 % 5, 3 - c % 5 - c // 5 % 5 - c // 25 % 5) for c in range(256)])
+]
+
+
+def _find_keys_part(args):
+    letters, cksum, keys = args
+    wanted = set(keys)
+    n = len(letters)
+    per_pos = lambda f: int.from_bytes(bytes(f(i) for i in range(n)), 'little')
+    count = per_pos(lambda i: (1, 5, 25, 0)[i % 4])
+    last = [per_pos(lambda i: int(i % 4 == j)) for j in range(4)]  # the unshift of the last round
+    bias = per_pos(lambda i: 52)  # keeps every letter - unshifts >= 0
+
+    # a round of unscramble_string without the unshift is an unshuffle,
+    # which each node does once, and a cut by the digit, which its children do
+    unshuffle = lambda s: s[1::2] + s[::2]
+    cut = lambda u, k: u[n-k:] + u[:n-k]
+
+    def counted(u, k):
+        return unshuffle((int.from_bytes(cut(u, k), 'little') + count).to_bytes(n, 'little'))
+
+    # unscramble_string uses the key digits last to first
+    tried = []
+    unscrambled = []
+    u0, v0 = unshuffle(letters.encode(ENCODING).translate(_FROM_ASCII)), bytes(n)
+    for d3 in range(10):
+        u1, v1 = unshuffle(cut(u0, d3)), counted(v0, d3)
+        for d2 in range(10):
+            u2, v2 = unshuffle(cut(u1, d2)), counted(v1, d2)
+            for d1 in range(10):
+                u3, v3 = unshuffle(cut(u2, d1)), counted(v2, d1)
+                unshifts = d1*_UNSHIFTS[1] + d2*_UNSHIFTS[2] + d3*_UNSHIFTS[3]
+                unshift_last = bias - d1*last[1] - d2*last[2] - d3*last[3]
+                for d0 in range(10):
+                    key = d0*1000 + d1*100 + d2*10 + d3
+                    if key in wanted:
+                        table = (unshifts + d0*_UNSHIFTS[0]).to_bytes(256, 'little')
+                        v = int.from_bytes(u3[n-d0:] + u3[:n-d0], 'little') - int.from_bytes((v3[n-d0:] + v3[:n-d0]).translate(table), 'little')
+                        tried.append(key)
+                        unscrambled.append((v + unshift_last - d0*last[0]).to_bytes(n, 'little').translate(_TO_ASCII))
+
+    # data_cksum of every unscrambled string at once, in 24-bit lanes
+    data = b''.join(unscrambled)
+    lanes = lambda v: int.from_bytes(v.to_bytes(3, 'little') * len(tried), 'little')
+    low15, low1, low16 = lanes(0x7fff), lanes(1), lanes(0xffff)
+    buf = bytearray(3 * len(tried))
+    c = 0
+    for i in range(n):
+        buf[::3] = data[i::n]
+        c = ((c >> 1) & low15 | (c & low1) << 15) + int.from_bytes(buf, 'little') & low16
+
+    c = (c ^ lanes(cksum)).to_bytes(3 * len(tried), 'little')
+    found = []
+    i = c.find(bytes(3))
+    while i >= 0:
+        if i % 3 == 0:
+            found.append(tried[i // 3])
+        i = c.find(bytes(3), i + 1)
+    return sorted(found)
+
+
 def scrambled_cksum(scrambled, width, height):
     data = square(scrambled, width, height).replace(BLACKSQUARE, '')
     return data_cksum(data.encode(ENCODING))
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
+import os
 import sys
-from .puz import read as puz_read
+import hashlib
+from .puz import read as puz_read, PuzzleFormatError
+from .pool import run_pool
 
 BLOCK = '#'
 
-def gen_xd(puzfn, clear=True):
-    p = puz_read(puzfn)
+def gen_xd(puzfn, clear=True, validate=True):
+    p = puz_read(puzfn, validate=validate)
+    if p.is_solution_locked() and not clear:
+        key = p.recover_key()
+        if key is None or not p.unlock_solution(key):
+            raise PuzzleFormatError('solution is locked and no key fits')
 
     yield 'Title: ' + p.title.strip()
     yield 'Author: ' + p.author.strip()
@@ -54,6 +61,44 @@ def gen_xd(puzfn, clear=True):
         yield f'D{k}. {v}'
 
 
+def convert(puzfn, xdfn, clear=False, validate=True, mode='mtime', known_hash=None):
+    '''Write the .xd for *puzfn* to *xdfn*, unless it is up to date: by *mode*
+    "mtime", *xdfn* is newer than *puzfn*; by "hash", *known_hash* is the sha1
+    of *puzfn* (as returned before).  Return ("converted" or "skipped", sha1 or None).'''
+    sha1 = None
+    if mode == 'hash':
+        with open(puzfn, 'rb') as fp:
+            sha1 = hashlib.sha1(fp.read()).hexdigest()
+    if os.path.exists(xdfn):
+        if mode == 'mtime' and os.stat(xdfn).st_mtime >= os.stat(puzfn).st_mtime:
+            return 'skipped', None
+        if mode == 'hash' and sha1 == known_hash:
+            return 'skipped', sha1
+
+    contents = '\n'.join(gen_xd(puzfn, clear=clear, validate=validate)) + '\n'
+    tmp = xdfn + '.converting'
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        fp.write(contents)
+    os.replace(tmp, xdfn)  # so an interrupted run never leaves a partial .xd that looks up to date
+    return 'converted', sha1
+
+
+def convert_job(job):
+    '''convert() one (puzfn, xdfn, kwargs) for convert_all, and return
+    (puzfn, xdfn, status, sha1 or error message).'''
+    puzfn, xdfn, kwargs = job
+    try:
+        status, sha1 = convert(puzfn, xdfn, **kwargs)
+        return puzfn, xdfn, status, sha1
+    except Exception as e:
+        return puzfn, xdfn, 'failed', f'{type(e).__name__}: {getattr(e, "message", "") or e}'
+
+
+def convert_all(jobs, processes=None):
+    'Run convert_job for every job across *processes* processes (see run_pool).'
+    return run_pool(convert_job, jobs, processes, maxchunk=64)
+
+
 if __name__ == '__main__':
     for line in gen_xd(sys.argv[1], clear=True):
         print(line)
@@ -0,0 +1,270 @@
+'''
+Where a team's guesses are kept, chosen by $XDSTORE:
+
+    jsonl   one $TEAMDIR/<xdid>.xd-guesses.jsonl per puzzle, read-only once
+            submitted (the default; see guesslog)
+    sqlite  $TEAMDIR/guesses.db, in WAL mode, with every guess and note in
+            the entries table and the progress of every puzzle in the
+            puzzles table, so launchers and graders need one query instead of
+            a stat or replay per puzzle
+
+Both keep the same rows.  A Crossword replays from its store with
+store.replay(xd), which advances xd.lastpos: a byte offset for jsonl, an entry
+id for sqlite.
+'''
+
+import os
+import json
+import stat
+import time
+import contextlib
+from pathlib import Path
+from collections import namedtuple
+
+from . import guesslog
+
+# like the os.stat() of a guess log: time of the last guess; time of the
+# submission, or the last guess if not submitted; whether submitted
+Progress = namedtuple('Progress', 'mtime ctime submitted')
+
+_stores = {}  # (kind, teamdir) -> store
+
+MAX_VARIABLES = 500  # xdids bound per query, well under any SQLITE_MAX_VARIABLE_NUMBER (999 before 3.32)
+
+
+def open_store(kind=None, teamdir=None):
+    'Return the store of *kind* (default $XDSTORE, else "jsonl") for *teamdir* (default $TEAMDIR), opened once per process.'
+    kind = kind or os.getenv('XDSTORE') or 'jsonl'
+    teamdir = str(teamdir or os.getenv('TEAMDIR', '.'))
+    if (kind, teamdir) not in _stores:
+        if kind not in STORES:
+            raise ValueError(f'unknown $XDSTORE {kind!r}; use one of {", ".join(STORES)}')
+        _stores[(kind, teamdir)] = STORES[kind](teamdir)
+    return _stores[(kind, teamdir)]
+
+
+class JsonlStore:
+    'One guess log per puzzle, marked submitted by making it read-only.'
+    name = 'jsonl'
+
+    def __init__(self, teamdir):
+        self.teamdir = Path(teamdir)
+
+    def path(self, xdid):
+        return self.teamdir/(xdid+'.xd-guesses.jsonl')
+
+    def append(self, xdid, rows, sync=False):
+        guesslog.append(self.path(xdid), rows, sync=sync)
+
+    def watched(self, xd):
+        'Return (path, size, poll) for an EventLoop to watch for rows after those *xd* has replayed.'
+        return self.path(xd.xdid), xd.lastpos, None
+
+    def replay(self, xd):
+        path = self.path(xd.xdid)
+        if not os.path.exists(path):
+            return
+
+        with open(path, 'rb') as fp:
+            st = os.fstat(fp.fileno())
+            xd.readonly = not st.st_mode & stat.S_IWUSR
+            if xd.guessino != st.st_ino or st.st_size < xd.lastpos:
+                # compacted since we last looked
+                if xd.lastpos:
+                    xd.reset_guesses()
+                xd.guessino = st.st_ino
+
+            if xd.lastpos == 0:
+                snap = guesslog.find_snapshot(fp)
+                if snap:
+                    xd.restore(snap)
+                    xd.lastpos = snap['pos']
+
+            rows, xd.lastpos = guesslog.read_rows(fp, xd.lastpos)
+
+        xd.replay_rows(rows)
+
+        if not os.path.exists(path):
+            Path(path).touch(0o777)
+
+    def snapshot(self, xd):
+        guesslog.append_snapshot(self.path(xd.xdid), xd.snapshot, xd.lastpos, xd.snapshot_every)
+
+    def compact(self, xd):
+        guesslog.compact(self.path(xd.xdid), xd.replay_stored, xd.snapshot)
+
+    def submit(self, xdid):
+        path = self.path(xdid)
+        os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    def progress(self, xdids=None):
+        'Return {xdid: Progress} for *xdids* (default every puzzle with guesses).'
+        if xdids is None:
+            suffix = '.xd-guesses.jsonl'
+            with os.scandir(self.teamdir) as it:
+                stats = {e.name[:-len(suffix)]: e.stat() for e in it if e.name.endswith(suffix)}
+        else:
+            stats = {}
+            for xdid in xdids:
+                try:
+                    stats[xdid] = os.stat(self.path(xdid))
+                except FileNotFoundError:
+                    pass
+        return {xdid: Progress(st.st_mtime, st.st_ctime, not st.st_mode & stat.S_IWUSR) for xdid, st in stats.items()}
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (   -- every guess and note, as in a guess log
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused, even after compaction deletes the last ones
+    xdid TEXT NOT NULL,
+    kind TEXT NOT NULL,                -- "guess" or "note"
+    user TEXT,
+    t REAL NOT NULL,
+    data TEXT NOT NULL                 -- the row, as json
+);
+CREATE INDEX IF NOT EXISTS entries_xdid ON entries (xdid, id);
+
+CREATE TABLE IF NOT EXISTS puzzles (   -- one per puzzle with entries
+    xdid TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    modified REAL NOT NULL,
+    submitted REAL,                    -- NULL until submitted
+    compacted INTEGER NOT NULL DEFAULT 0  -- entries up to this id were deleted, having been snapshotted
+);
+CREATE INDEX IF NOT EXISTS puzzles_modified ON puzzles (modified);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    xdid TEXT PRIMARY KEY,
+    pos INTEGER NOT NULL,              -- includes the entries up to this id
+    state TEXT NOT NULL
+);
+'''
+
+
+class SqliteStore:
+    '$TEAMDIR/guesses.db, shared by every player through WAL mode.'
+    name = 'sqlite'
+
+    def __init__(self, teamdir):
+        import sqlite3
+        self.path = Path(teamdir)/'guesses.db'
+        created = not self.path.exists()
+        self.conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)  # transactions are explicit
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')  # FULL for appends with sync
+        self.conn.execute('PRAGMA journal_size_limit=0')  # truncate the WAL on checkpoints, so its size changes with every commit
+        self.conn.executescript(SCHEMA)
+        if created:
+            try:
+                os.chmod(self.path, 0o666)  # for the whole team, like the guess logs
+            except PermissionError:
+                pass
+        self.walsizes = {}  # xdid -> size of the WAL when last replayed
+        self.versions = {}  # xdid -> PRAGMA data_version when last replayed
+
+    @contextlib.contextmanager
+    def transaction(self):
+        'Hold the write lock and commit at the end, unless already within a transaction.'
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def append(self, xdid, rows, sync=False):
+        if not rows:
+            return
+        now = time.time()
+        if sync:
+            self.conn.execute('PRAGMA synchronous=FULL')
+        try:
+            with self.transaction() as conn:
+                r = conn.execute('SELECT submitted FROM puzzles WHERE xdid=?', (xdid,)).fetchone()
+                if r and r[0] is not None:
+                    raise PermissionError(f'{xdid} was submitted')
+                conn.executemany('INSERT INTO entries (xdid, kind, user, t, data) VALUES (?, ?, ?, ?, ?)',
+                    [(xdid, 'note' if 'note' in row else 'guess', row.get('user'), now, json.dumps(row)) for row in rows])
+                conn.execute('''INSERT INTO puzzles (xdid, started, modified) VALUES (?, ?, ?)
+                                ON CONFLICT (xdid) DO UPDATE SET modified=excluded.modified''', (xdid, now, now))
+        finally:
+            if sync:
+                self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    def walsize(self):
+        try:
+            return os.stat(f'{self.path}-wal').st_size
+        except FileNotFoundError:
+            return 0
+
+    def data_version(self):
+        'Return a number that changes whenever another connection commits to the db.'
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def watched(self, xd):
+        '''Return (path, size, poll) for an EventLoop to watch for rows after those
+        *xd* has replayed.  When the WAL has to be polled, a commit can leave its
+        size as it was (after a checkpoint restarts it), so poll() also checks
+        the data_version.'''
+        version = self.versions.get(xd.xdid)
+        return f'{self.path}-wal', self.walsizes.get(xd.xdid, 0), lambda: self.data_version() != version
+
+    def replay(self, xd):
+        self.walsizes[xd.xdid] = self.walsize()  # before reading, so later commits are noticed
+        self.versions[xd.xdid] = self.data_version()
+        r = self.conn.execute('SELECT submitted, compacted FROM puzzles WHERE xdid=?', (xd.xdid,)).fetchone()
+        if not r:
+            return
+        submitted, compacted = r
+        xd.readonly = submitted is not None
+        if 0 < xd.lastpos < compacted:  # some we had not replayed were deleted
+            xd.reset_guesses()
+
+        if xd.lastpos == 0:
+            r = self.conn.execute('SELECT pos, state FROM snapshots WHERE xdid=?', (xd.xdid,)).fetchone()
+            if r:
+                xd.restore(json.loads(r[1]))
+                xd.lastpos = r[0]
+
+        entries = self.conn.execute('SELECT id, data FROM entries WHERE xdid=? AND id>? ORDER BY id', (xd.xdid, xd.lastpos)).fetchall()
+        if entries:
+            xd.lastpos = entries[-1][0]
+        xd.replay_rows([json.loads(data) for id, data in entries])
+
+    def snapshot(self, xd):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO snapshots (xdid, pos, state) VALUES (?, ?, ?)', (xd.xdid, xd.lastpos, json.dumps(xd.snapshot())))
+
+    def compact(self, xd):
+        'Delete the entries of *xd* that are in a new snapshot.'
+        with self.transaction() as conn:
+            xd.replay_stored()  # no one can append meanwhile
+            conn.execute('INSERT OR REPLACE INTO snapshots (xdid, pos, state) VALUES (?, ?, ?)', (xd.xdid, xd.lastpos, json.dumps(xd.snapshot())))
+            conn.execute('DELETE FROM entries WHERE xdid=? AND id<=?', (xd.xdid, xd.lastpos))
+            conn.execute('UPDATE puzzles SET compacted=? WHERE xdid=?', (xd.lastpos, xd.xdid))
+
+    def submit(self, xdid):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('''INSERT INTO puzzles (xdid, started, modified, submitted) VALUES (?, ?, ?, ?)
+                            ON CONFLICT (xdid) DO UPDATE SET submitted=COALESCE(submitted, excluded.submitted)''', (xdid, now, now, now))
+
+    def progress(self, xdids=None):
+        'Return {xdid: Progress} for *xdids* (default every puzzle with guesses).'
+        query = 'SELECT xdid, modified, COALESCE(submitted, modified), submitted IS NOT NULL FROM puzzles'
+        if xdids is None:
+            results = self.conn.execute(query)
+        else:
+            xdids = list(xdids)
+            results = []
+            for i in range(0, len(xdids), MAX_VARIABLES):
+                chunk = xdids[i:i+MAX_VARIABLES]
+                results += self.conn.execute(query + f' WHERE xdid IN ({",".join("?"*len(chunk))})', chunk)
+        return {xdid: Progress(mtime, ctime, bool(submitted)) for xdid, mtime, ctime, submitted in results}
+
+
+STORES = dict(jsonl=JsonlStore, sqlite=SqliteStore)
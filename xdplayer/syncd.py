@@ -0,0 +1,436 @@
+'''
+An optional daemon that relays guesses between the players on one machine, so
+they need not all append to and watch $TEAMDIR/<xdid>.xd-guesses.jsonl.
+
+The daemon is the only appender for the players connected to it, and sends
+every row that reaches a guess log (from its players, or appended by anyone
+else, like xdinject.py or a player in file mode) to every player subscribed to
+that puzzle, along with the offset just past it.  So a player keeps the same
+lastpos as in file mode, and goes back to the guess log if the daemon goes away.
+
+The protocol is one json object per line, each way:
+
+    {"sub": <xdid>, "pos": <offset>, "ino": <inode>}  subscribe, having replayed the log up to <offset>
+    {"xdid": <xdid>, "rows": [...]}                   append rows to the log
+        with "sync": true, also fsync it
+        with "ack": <n>, reply {"ack": <n>} once written
+
+    {"xdid": <xdid>, "rows": [...], "pos": <offset>}  rows appended to the log, up to <offset>
+    {"xdid": <xdid>, "reset": true}                   the log was compacted; replay it from the file and subscribe again
+    {"xdid": <xdid>, "readonly": true}                the log was marked done
+
+Both ends find the daemon at $XDSYNC, either the path of a Unix socket or
+<host>:<port>, by default $TEAMDIR/.xdsync.sock.
+'''
+
+import os
+import sys
+import json
+import stat
+import time
+import socket
+from pathlib import Path
+
+from . import guesslog
+from .events import default_watcher
+
+
+LINE_LIMIT = 1 << 20  # longest message line
+BACKLOG = 1024  # connections waiting to be accepted, when a whole class starts at once
+MAX_BUFFER = 1 << 20  # bytes waiting for a subscriber, past which it is dropped as too slow
+
+
+def address():
+    return os.getenv('XDSYNC') or str(Path(os.getenv('TEAMDIR', '.'))/'.xdsync.sock')
+
+
+def parse_address(addr):
+    'Return (host, port) for "<host>:<port>", else the Unix socket path *addr*.'
+    host, sep, port = addr.rpartition(':')
+    if sep and port.isdigit() and '/' not in addr:
+        return host or 'localhost', int(port)
+    return addr
+
+
+class SyncClient:
+    '''A player's connection to the daemon.  Also stands in for the EventLoop
+    watcher: it wakes the loop when the daemon sends something, and once the
+    daemon is gone, watches the guess log like default_watcher() would.'''
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = b''
+        self.msgs = []  # received but not yet taken by receive()
+        self.closed = False
+        self.nacks = 0  # last ack asked for
+        self.acked = 0  # last ack received
+        self.watching = (None, 0, None)
+        self.fallback = None
+
+    @classmethod
+    def connect(cls, addr=None, timeout=5):
+        'Return a SyncClient connected to the daemon at *addr* (default from $XDSYNC), or None if it is not running.'
+        addr = parse_address(addr or address())
+        try:
+            if isinstance(addr, tuple):
+                sock = socket.create_connection(addr, timeout)
+            else:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(timeout)
+                sock.connect(addr)
+        except OSError:
+            return None
+        sock.settimeout(None)
+        return cls(sock)
+
+    def close(self):
+        self.fallback = default_watcher()  # before closing, so its fd is a new one for the EventLoop
+        if self.watching[0]:
+            self.fallback.watch(*self.watching)
+        self.sock.close()
+        self.closed = True
+
+    def fileno(self):
+        if self.closed:
+            return self.fallback.fileno() if hasattr(self.fallback, 'fileno') else None
+        return self.sock.fileno()
+
+    @property
+    def interval(self):
+        if self.closed:
+            return self.fallback.interval
+        return 0 if self.msgs else None
+
+    def watch(self, path, size, poll=None):
+        self.watching = (path, size, poll)
+        if self.closed:
+            self.fallback.watch(path, size, poll)
+
+    def changed(self):
+        'Return True if the daemon sent something, or went away, since the last receive().'
+        if self.closed:
+            return self.fallback.changed()
+        return self.read(0) or bool(self.msgs)
+
+    def read(self, timeout):
+        'Read whatever the daemon has sent, waiting up to *timeout* seconds for the first of it.  Return True if it went away.'
+        data = None
+        try:
+            if timeout > 0:
+                self.sock.settimeout(timeout)
+                data = self.sock.recv(guesslog.CHUNK)
+                self.sock.settimeout(0)  # else MSG_DONTWAIT still waits out the timeout
+            else:
+                data = self.sock.recv(guesslog.CHUNK, socket.MSG_DONTWAIT)
+            while data:
+                self.buf += data
+                data = self.sock.recv(guesslog.CHUNK, socket.MSG_DONTWAIT)
+        except (BlockingIOError, socket.timeout):
+            pass
+        except OSError:
+            data = b''
+        finally:
+            if not self.closed:
+                self.sock.settimeout(None)
+
+        *lines, self.buf = self.buf.split(b'\n')
+        for line in lines:
+            msg = json.loads(line)
+            if 'ack' in msg:
+                self.acked = msg['ack']
+            else:
+                self.msgs.append(msg)
+
+        if data == b'':
+            self.close()
+            return True
+        return False
+
+    def send(self, msg):
+        'Send *msg* to the daemon.  Return False if it has gone away.'
+        if self.closed or self.read(0):
+            return False
+        try:
+            self.sock.sendall(json.dumps(msg).encode('utf-8') + b'\n')
+            return True
+        except OSError:
+            self.close()
+            return False
+
+    def subscribe(self, xdid, pos, ino):
+        'Get the rows of *xdid* after offset *pos* of the guess log with inode *ino*, and every row after them, instead of any other puzzle.'
+        self.msgs = []
+        return self.send(dict(sub=xdid, pos=pos, ino=ino))
+
+    def append(self, xdid, rows, sync=False, timeout=10):
+        '''Have the daemon append *rows* to the guess log of *xdid*.  With
+        *sync*, wait until they are written and fsynced.  Return False if the
+        daemon is gone (or did not answer in time), so they should be appended
+        to the guess log directly.'''
+        msg = dict(xdid=xdid, rows=rows)
+        if sync:
+            self.nacks += 1
+            msg.update(sync=True, ack=self.nacks)
+        if not self.send(msg):
+            return False
+        deadline = time.time() + timeout
+        while sync and self.acked < self.nacks:
+            if self.read(deadline-time.time()) or time.time() >= deadline:
+                return False
+        return True
+
+    def receive(self, xdid):
+        'Return the messages for *xdid* sent since the last call.'
+        self.changed()
+        msgs, self.msgs = self.msgs, []
+        return [m for m in msgs if m.get('xdid') == xdid]
+
+
+def tail_end(fp, size):
+    'Return the offset just past the last complete line of binary file *fp*, which is *size* bytes; 0 if it has none.'
+    pos = size
+    while pos > 0:
+        n = min(guesslog.CHUNK, pos)
+        pos -= n
+        fp.seek(pos)
+        i = fp.read(n).rfind(b'\n')
+        if i >= 0:
+            return pos+i+1
+    return 0
+
+
+class Topic:
+    """The guess log of one puzzle, and the connections subscribed to it.
+
+    Reading, appending and fsyncing the log can block, so they are done by
+    the methods without async, in the event loop's executor, one at a time per
+    topic (see run()); the async ones send what those return."""
+    def __init__(self, xdid, path):
+        import asyncio
+        self.xdid = xdid
+        self.path = path
+        self.subscribers = set()  # StreamWriters
+        self.ino = None  # of the log, or None before it exists
+        self.size = 0
+        self.end = 0  # offset up to which rows have been sent
+        self.readonly = False
+        self.lock = asyncio.Lock()
+        self.pending = 0  # run() calls not yet done
+        self.queue = []  # (rows, sync, future) waiting to be appended
+        self.flushing = False  # whether flush() is running
+        self.error = None  # last error logged, so it is logged once
+
+    def send(self, msg, writers=None):
+        line = json.dumps(msg).encode('utf-8') + b'\n'
+        for w in list(self.subscribers if writers is None else writers):
+            if w.transport.get_write_buffer_size() > MAX_BUFFER:
+                print(f'{self.xdid}: dropped a subscriber that fell behind', file=sys.stderr)
+                self.subscribers.discard(w)
+                w.close()
+            else:
+                w.write(line)
+
+    async def run(self, func, *args):
+        'Return *func*(*args*), run in the executor after any other run() for this topic.'
+        import asyncio
+        self.pending += 1
+        try:
+            async with self.lock:
+                return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+        finally:
+            self.pending -= 1
+
+    def start(self):
+        'Start from the end of the log as it is now.'
+        try:
+            with open(self.path, 'rb') as fp:
+                st = os.fstat(fp.fileno())
+                self.ino, self.size, self.readonly = st.st_ino, st.st_size, not st.st_mode & stat.S_IWUSR
+                self.end = tail_end(fp, st.st_size)
+        except FileNotFoundError:
+            pass
+
+    def read(self):
+        'Return the messages for subscribers about rows appended to the log since last time, and whether it was compacted or marked done.'
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        msgs = []
+        readonly = not st.st_mode & stat.S_IWUSR
+        if readonly != self.readonly:
+            self.readonly = readonly
+            if readonly:
+                msgs.append(dict(xdid=self.xdid, readonly=True))
+        if st.st_ino == self.ino and st.st_size == self.size:
+            return msgs
+
+        bad = []
+        with open(self.path, 'rb') as fp:
+            st = os.fstat(fp.fileno())
+            if st.st_ino != self.ino or st.st_size < self.end:
+                if self.ino is not None:  # else it was just created, and is read from 0
+                    self.ino, self.size, self.end = st.st_ino, st.st_size, tail_end(fp, st.st_size)
+                    return msgs + [dict(xdid=self.xdid, reset=True)]
+                self.ino = st.st_ino
+            self.size = st.st_size
+            rows, end = guesslog.read_rows(fp, self.end, st.st_size, bad)
+        if bad:
+            print(f'{self.xdid}: skipped {len(bad)} malformed line(s) of {self.path}', file=sys.stderr)
+        if end > self.end:
+            self.end = end
+            msgs.append(dict(xdid=self.xdid, rows=rows, pos=end))
+        return msgs
+
+    def catch_up(self, pos, ino):
+        'Return (messages for all subscribers, messages for a new one that has replayed the log with inode *ino* up to *pos*).'
+        msgs = self.read()
+        if self.ino is None:
+            return msgs, []
+        if ino != self.ino or pos > self.end:
+            return msgs, [dict(xdid=self.xdid, reset=True)]
+        if pos < self.end:
+            with open(self.path, 'rb') as fp:
+                rows, end = guesslog.read_rows(fp, pos, self.end, [])
+            return msgs, [dict(xdid=self.xdid, rows=rows, pos=end)]
+        return msgs, []
+
+    def write(self, rows, sync):
+        'Append *rows* to the log, unless it is marked done, and return the messages for subscribers from before and after.'
+        msgs = self.read()
+        if self.readonly:
+            return msgs
+        try:
+            guesslog.append(self.path, rows, sync=sync)
+        except PermissionError:
+            self.readonly = True
+            return msgs + [dict(xdid=self.xdid, readonly=True)]
+        return msgs + self.read()
+
+    async def poll(self):
+        'Send any rows appended to the log since last time, and tell subscribers if it was compacted or marked done.'
+        try:
+            msgs = await self.run(self.read)
+        except Exception as e:  # logged, so that one bad log doesn't stop the others
+            if repr(e) != self.error:
+                print(f'{self.xdid}: {e!r}', file=sys.stderr)
+                self.error = repr(e)
+            return
+        self.error = None
+        for msg in msgs:
+            self.send(msg)
+
+    async def subscribe(self, writer, pos, ino):
+        msgs, catchup = await self.run(self.catch_up, pos, ino)
+        for msg in msgs:
+            self.send(msg)
+        for msg in catchup:
+            self.send(msg, [writer])
+        self.subscribers.add(writer)
+
+    async def append(self, rows, sync=False):
+        'Append *rows* to the log, together with any others waiting, and return once they are written.'
+        import asyncio
+        done = asyncio.get_event_loop().create_future()
+        self.queue.append((rows, sync, done))
+        if not self.flushing:
+            self.flushing = True
+            asyncio.ensure_future(self.flush())
+        await done
+
+    async def flush(self):
+        'Write what is waiting in the queue, in one append (and one fsync) for everything queued meanwhile.'
+        try:
+            while self.queue:
+                batch, self.queue = self.queue, []
+                try:
+                    msgs = await self.run(self.write, [r for rows, sync, done in batch for r in rows], any(sync for rows, sync, done in batch))
+                except Exception as e:
+                    for rows, sync, done in batch:
+                        done.set_exception(e)
+                    continue
+                for msg in msgs:
+                    self.send(msg)
+                for rows, sync, done in batch:
+                    done.set_result(None)
+        finally:
+            self.flushing = False
+
+
+class SyncServer:
+    'Relay rows between the players of the puzzles in *teamdir* (default $TEAMDIR), and persist them to the guess logs.'
+    def __init__(self, teamdir=None, poll=0.25):
+        self.teamdir = Path(teamdir or os.getenv('TEAMDIR', '.'))
+        self.poll_secs = poll  # how often to look for rows appended by others
+        self.topics = {}  # xdid -> Topic, while it has subscribers or something to do
+
+    async def topic(self, xdid):
+        if not isinstance(xdid, str) or not xdid or '/' in xdid or xdid.startswith('.'):
+            raise ValueError(f'bad xdid {xdid!r}')
+        if xdid not in self.topics:
+            topic = self.topics[xdid] = Topic(xdid, self.teamdir/(xdid+'.xd-guesses.jsonl'))
+            await topic.run(topic.start)
+        return self.topics[xdid]
+
+    def release(self, topic, writer=None):
+        'Unsubscribe *writer* from *topic*, and forget the topic once nothing uses it.'
+        topic.subscribers.discard(writer)
+        if not topic.subscribers and not topic.pending and not topic.queue and self.topics.get(topic.xdid) is topic:
+            del self.topics[topic.xdid]
+
+    async def handle(self, reader, writer):
+        topic = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                if 'sub' in msg:
+                    if topic:
+                        self.release(topic, writer)
+                    topic = await self.topic(msg['sub'])
+                    await topic.subscribe(writer, msg.get('pos', 0), msg.get('ino'))
+                elif 'rows' in msg:
+                    t = await self.topic(msg['xdid'])
+                    try:
+                        await t.append(msg['rows'], sync=msg.get('sync', False))
+                    finally:
+                        self.release(t)
+                    if 'ack' in msg:
+                        writer.write(json.dumps(dict(ack=msg['ack'])).encode('utf-8') + b'\n')
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            print(f'dropped a client: {e!r}', file=sys.stderr)
+        finally:
+            if topic:
+                self.release(topic, writer)
+            writer.close()
+
+    async def poll_forever(self):
+        import asyncio
+        while True:
+            await asyncio.sleep(self.poll_secs)
+            # all at once, so one slow log doesn't hold up the others; a topic
+            # busy writing is skipped, as its write() reads the log anyway
+            topics = [t for t in self.topics.values() if not t.lock.locked()]
+            await asyncio.gather(*(t.poll() for t in topics))
+            for topic in topics:
+                self.release(topic)  # if its subscribers were all dropped
+
+    async def serve(self, addr=None):
+        'Listen at *addr* (default from $XDSYNC) until cancelled.'
+        import asyncio
+        addr = parse_address(addr or address())
+        if isinstance(addr, tuple):
+            server = await asyncio.start_server(self.handle, *addr, limit=LINE_LIMIT, backlog=BACKLOG)
+        else:
+            if os.path.exists(addr):
+                client = SyncClient.connect(addr)
+                if client:
+                    client.sock.close()
+                    raise OSError(f'{addr}: already being served')
+                os.unlink(addr)  # left by a daemon that died
+            server = await asyncio.start_unix_server(self.handle, addr, limit=LINE_LIMIT, backlog=BACKLOG)
+            os.chmod(addr, 0o777)  # for the whole team, like $TEAMDIR
+        print(f'serving {self.teamdir} on {addr}', file=sys.stderr, flush=True)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.poll_forever())
@@ -0,0 +1,126 @@
+'''
+Count the bytes a curses program sends to its terminal, frame by frame, as they
+would go over an ssh connection.
+
+TtyMeter runs a command in a pseudo-terminal and reads everything it writes
+there.  It passes the command a pipe in $XDTTYMETER_FD, and the player writes a
+byte to it after each frame has gone out (see frame_marker()), so the bytes read
+from the terminal up to each marker are that frame's.
+'''
+
+import os
+import pty
+import fcntl
+import struct
+import select
+import termios
+
+
+FD_ENV = 'XDTTYMETER_FD'
+GRACE = 0.01  # seconds for the last of a frame to come through the pty after its marker
+
+
+def frame_marker():
+    'Return a function to call after each frame is written to the terminal, to tell the TtyMeter running us; or None if none is.'
+    fd = os.getenv(FD_ENV)
+    if not fd:
+        return None
+    fd = int(fd)
+    def mark():
+        try:
+            os.write(fd, b'.')
+        except OSError:  # not metered any more
+            pass
+    return mark
+
+
+def set_size(fd, rows, cols):
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack('HHHH', rows, cols, 0, 0))
+
+
+def get_size(fd):
+    'Return (rows, columns) of the terminal on *fd*.'
+    rows, cols, _, _ = struct.unpack('HHHH', fcntl.ioctl(fd, termios.TIOCGWINSZ, bytes(8)))
+    return rows, cols
+
+
+class TtyMeter:
+    'Run *argv* in a pseudo-terminal of *size* (rows, columns) with *env* added, counting the bytes of each frame it draws.'
+    def __init__(self, argv, size=(25, 80), env=None):
+        markr, markw = os.pipe()
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            os.close(markr)
+            os.set_inheritable(markw, True)
+            set_size(0, *size)
+            os.environ.update(env or {})
+            os.environ[FD_ENV] = str(markw)
+            os.execvp(argv[0], argv)
+        os.close(markw)
+        self.markfd = markr
+        self.frames = []  # bytes sent for each frame
+        self.pending = 0  # bytes sent since the last frame
+        self.total = 0
+        self.output = None  # fd to copy the output to, if any
+        self.running = True
+
+    def send(self, data):
+        'Type *data* into the program.'
+        os.write(self.fd, data)
+
+    def read_output(self, timeout):
+        'Read what the program has sent, waiting up to *timeout* seconds for the first of it.'
+        while self.running and select.select([self.fd], [], [], timeout)[0]:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError:  # EIO once the program has exited
+                data = b''
+            if not data:
+                self.running = False
+                break
+            self.pending += len(data)
+            self.total += len(data)
+            if self.output is not None:
+                os.write(self.output, data)
+            timeout = 0
+
+    def poll(self, timeout, infd=None):
+        '''Wait up to *timeout* seconds for the program to send something, and count
+        it; pass along anything to read from *infd* meanwhile.  Return False once
+        the program has exited.'''
+        fds = [self.fd, self.markfd] + ([infd] if infd is not None else [])
+        r, _, _ = select.select(fds, [], [], timeout)
+        if infd in r:
+            data = os.read(infd, 4096)
+            if data:
+                self.send(data)
+        if self.fd in r:
+            self.read_output(0)
+        if self.markfd in r:
+            marks = os.read(self.markfd, 4096)
+            self.read_output(GRACE)  # the frame may be a moment behind its marker
+            self.frames.append(self.pending)
+            self.frames.extend([0] * (len(marks)-1))  # frames with nothing to send
+            self.pending = 0
+        return self.running
+
+    def quiet(self, secs=0.2):
+        'Count everything the program sends until it has sent nothing for *secs*; return the number of bytes.'
+        before = self.total
+        while self.running:
+            n, nframes = self.total, len(self.frames)
+            self.poll(secs)
+            if self.total == n and len(self.frames) == nframes:
+                break
+        return self.total - before
+
+    def close(self):
+        'Stop the program and wait for it.'
+        if self.running:
+            try:
+                os.kill(self.pid, 15)
+            except ProcessLookupError:
+                pass
+        os.waitpid(self.pid, 0)
+        os.close(self.fd)
+        os.close(self.markfd)
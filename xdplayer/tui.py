@@ -1,4 +1,4 @@
-import functools
+import collections
 import curses
 
 def getkeystroke(scr):
@@ -14,39 +14,91 @@ def getkeystroke(scr):
         k = ord(k)
     return curses.keyname(k).decode('utf-8')
 
+def clear_area(scr, y1, y2, x):
+    'Clear screen rows *y1* up to *y2*, from column *x* to the right edge.'
+    h, w = scr.getmaxyx()
+    for y in range(max(y1, 0), min(y2, h)):
+        if x < w:
+            scr.move(y, x)
+            scr.clrtoeol()
+
 class ColorMaker:
-    def __init__(self, scr):
-        self.attrs = {}
-        self.color_attrs = {}
-        self.scr = scr
+    """Resolve color names like "white on 235 bold" to curses attrs, with a color
+    pair for each (fg, bg).  Attrs can only hold so many pairs; once all are
+    taken, the least recently used one is given the new colors, and .generation
+    goes up so that anything that kept attrs knows to resolve them again and
+    repaint what it drew with them."""
+    maxnames = 1024  # color names to remember resolving
 
+    def __init__(self, scr, npairs=None):
+        self.scr = scr
+        # pair 0 is the terminal's own colors, and can't be changed
+        self.npairs = npairs or min(getattr(curses, 'COLOR_PAIRS', 256)-1, curses.A_COLOR >> 8)
+        self.pairs = collections.OrderedDict()  # (fg, bg) -> pair number, least recently used first
+        self.fgbg = {}  # pair number -> (fg, bg)
+        self.free = []  # pair numbers given back after init_pair failed
+        self.names = {}  # color names -> (attr, (fg, bg) or None)
+        self.counts = collections.Counter()  # hits, misses, allocated, evicted, failed
+        self.generation = 0
 
     def get_color(self, fg, bg):
-        if not self.color_attrs:
-            self.color_attrs[''] = curses.color_pair(0)
-
-        if not self.color_attrs.get((fg,bg), None):
-            try:
-                c = len(self.color_attrs)
-                curses.init_pair(c, fg, bg)
-                self.color_attrs[(fg,bg)] = curses.color_pair(c)
-            except curses.error as e:
-                pass # curses.init_pair gives a curses error on Windows
-        return self.color_attrs[(fg,bg)]
+        'Return the attr of the color pair for *fg* on *bg*, making one if need be.'
+        k = (fg, bg)
+        if k in self.pairs:
+            self.pairs.move_to_end(k)
+            return curses.color_pair(self.pairs[k])
+
+        if self.free:
+            n = self.free.pop()
+        elif len(self.fgbg) < self.npairs:
+            n = len(self.fgbg)+1
+        else:
+            old, n = self.pairs.popitem(last=False)
+            del self.fgbg[n]
+            self.names = {name: v for name, v in self.names.items() if v[1] != old}
+            self.counts['evicted'] += 1
+            self.generation += 1
+
+        try:
+            curses.init_pair(n, fg, bg)
+        except (curses.error, ValueError):  # on Windows, or a color the terminal doesn't have
+            self.free.append(n)
+            self.counts['failed'] += 1
+            return 0
+        self.counts['allocated'] += 1
+        self.pairs[k] = n
+        self.fgbg[n] = k
+        return curses.color_pair(n)
 
     def __getitem__(self, colornamestr):
-        return self._colornames_to_cattr(colornamestr)
+        r = self.names.get(colornamestr)
+        if r is None:
+            self.counts['misses'] += 1
+            if len(self.names) >= self.maxnames:
+                self.names.clear()
+            r = self.names[colornamestr] = self._resolve(colornamestr)
+        else:
+            self.counts['hits'] += 1
+            if r[1] is not None:
+                self.pairs.move_to_end(r[1])
+        return r[0]
 
     def to_name(self, attr):
-        for k, v in self.color_attrs.items():
-            if v == attr:
-                return k
-        return 'unknown'
+        'Return the (fg, bg) of the color pair in *attr*, "" if the default pair, or "unknown".'
+        n = curses.pair_number(attr)
+        if n == 0:
+            return ''
+        return self.fgbg.get(n, 'unknown')
+
+    def stats(self):
+        'Return a dict of the pairs in use and available, and counts of names resolved, pairs allocated and so on.'
+        return dict(pairs=len(self.pairs), npairs=self.npairs, names=len(self.names), generation=self.generation,
+                    **{k: self.counts[k] for k in 'hits misses allocated evicted failed'.split()})
 
-    @functools.lru_cache
-    def _colornames_to_cattr(self, colornamestr):
+    def _resolve(self, colornamestr):
+        'Return (attr, (fg, bg) of its pair or None) for *colornamestr*.'
         if not colornamestr:
-            return 0
+            return 0, None
         fgbg = [0,0]
         attr = 0  # other attrs
         bg = False
@@ -59,11 +111,14 @@ class ColorMaker:
                     fgbg[bg] = int(colorname)
                 else:
                     fgbg[bg] = getattr(curses, 'COLOR_'+colorname.upper(), 0)
-        return attr | self.get_color(*fgbg)
+        cattr = self.get_color(*fgbg)
+        return attr | cattr, (tuple(fgbg) if cattr else None)
 
 
 class OptionsObject(dict):
     'Augment a dict with more convenient .attr syntax.  not-present keys return None.'
+    version = 0  # counts changes, for caches of resolved attrs
+
     def __init__(self, **kwargs):
         kw = {}
         for k, v in kwargs.items():
@@ -101,3 +156,4 @@ class OptionsObject(dict):
 
     def cycle(self, k):
         self[k] = self[k][1:] + [self[k][0]]
+        self.version += 1
@@ -1,41 +1,45 @@
 #!/usr/bin/env python3
 
 import os
-import stat
 
 from visidata import SqliteQuerySheet, Path, Column, date
 
+from .storage import open_store
+
 class vdLauncher(SqliteQuerySheet):
     'Load puzzles started, but not submitted by teamid.'
+    progress = {}  # xdid -> storage.Progress, as of the last load
+
+    def iterload(self):
+        vdLauncher.progress = open_store().progress()  # for every puzzle at once, instead of a stat per row
+        yield from super().iterload()
 
     @classmethod
     def stat_guesses(cls, fn):
-        'Return Path($TEAMDIR/{fn.stem}.xd.guesses.jsonl'
-        xdid = Path(fn).stem
-        p = Path(os.getenv('TEAMDIR', '.'))/(xdid+'.xd-guesses.jsonl')
-        return p.stat()
+        'Return the storage.Progress of the guesses for puzzle *fn*, or None.'
+        return cls.progress.get(Path(fn).stem)
 
     @classmethod
     def is_submitted(cls, fn):
-        'Return True if exists and is readonly.'
+        'Return True if exists and was submitted.'
         g = cls.stat_guesses(fn)
         if not g:
             return False
-        return not (cls.stat_guesses(fn).st_mode & stat.S_IWUSR)
+        return g.submitted
 
     @classmethod
     def modtime(cls, fn):
         g = cls.stat_guesses(fn)
         if not g:
             return None
-        return g.st_mtime
+        return g.mtime
 
     @classmethod
     def solve_hours(cls, fn):
         g = cls.stat_guesses(fn)
         if not g:
             return None
-        return (g.st_ctime - g.st_mtime)/3600
+        return (g.ctime - g.mtime)/3600
 
     query = '''SELECT
             solvings.teamid,
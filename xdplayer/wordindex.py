@@ -0,0 +1,78 @@
+'''
+Which words each cell of a grid is in, and which cells each word has, in
+flat arrays.
+
+Cells are numbered y*ncols+x.  Words are numbered in clue-number order,
+across before down for the same number, which is also the order of the
+clues in an .xd file.
+'''
+
+from array import array
+
+
+class WordIndex:
+    'Index of the words (2 or more cells between blocks) of *grid*, a list of rows with "#" for blocks.'
+    def __init__(self, grid):
+        self.nrows = nrows = len(grid)
+        self.ncols = ncols = len(grid[0]) if grid else 0
+        open_ = bytes(ch != '#' for row in grid for ch in row)
+
+        self.nopen = sum(open_)  # cells that are not blocks
+        self.across = array('i', [-1]) * len(open_)  # cell -> word, or -1
+        self.down = array('i', [-1]) * len(open_)
+        self.dirs = []  # word -> 'A' or 'D'
+        self.nums = array('i')  # word -> clue number
+        self.starts = array('i')  # word -> first cell
+        self.lengths = array('i')  # word -> number of cells
+
+        num = 0
+        for i, is_open in enumerate(open_):
+            if not is_open:
+                continue
+            y, x = divmod(i, ncols)
+            across = (x == 0 or not open_[i-1]) and self._add(open_, i, 'A', num+1, 1, ncols-x)
+            down = (y == 0 or not open_[i-ncols]) and self._add(open_, i, 'D', num+1, ncols, nrows-y)
+            if across or down:
+                num += 1
+
+    def _add(self, open_, start, dir, num, step, maxlen):
+        if step == 1:
+            end = open_.find(0, start, start+maxlen)
+            n = (end if end >= 0 else start+maxlen) - start
+        else:
+            n = 1
+            while n < maxlen and open_[start+n*step]:
+                n += 1
+        if n < 2:
+            return False
+
+        wid = len(self.dirs)
+        cells = self.across if dir == 'A' else self.down
+        cells[start:start+n*step:step] = array('i', [wid]) * n
+        self.dirs.append(dir)
+        self.nums.append(num)
+        self.starts.append(start)
+        self.lengths.append(n)
+        return True
+
+    def __len__(self):
+        return len(self.dirs)
+
+    def word_at(self, x, y, dir):
+        'Return the *dir* ("A" or "D") word through cell (x, y), or -1.'
+        if 0 <= x < self.ncols and 0 <= y < self.nrows:
+            return (self.across if dir == 'A' else self.down)[y*self.ncols+x]
+        return -1
+
+    def dirnum(self, wid):
+        return f'{self.dirs[wid]}{self.nums[wid]}'
+
+    def cells(self, wid):
+        'Return the cell numbers of word *wid*, in order.'
+        step = 1 if self.dirs[wid] == 'A' else self.ncols
+        start = self.starts[wid]
+        return range(start, start+self.lengths[wid]*step, step)
+
+    def coords(self, wid):
+        'Return the (x, y) of each cell of word *wid*, in order.'
+        return [divmod(i, self.ncols)[::-1] for i in self.cells(wid)]
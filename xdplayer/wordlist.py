@@ -0,0 +1,131 @@
+'''
+A list of answers for looking up words by pattern, like "A.P.E", written once
+by xdimport.py and memory-mapped by every player.
+
+The file has, for each word length, the words of that length in fixed-width
+records, commonest first, and then a bitset for each (position, letter) of the
+words with that letter in that position.  A lookup ANDs the bitsets of the
+letters it knows, so it reads a few bytes per word of that length instead of
+the words themselves, and only the pages it needs are ever loaded.
+
+    header  b'XDWORDS1', maxlen (uint32)
+    then for each length 0..maxlen: count, offset of words, offset of bitsets (uint64 each)
+    words   count records of length bytes
+    bitsets length*26 bitsets of (count+7)//8 bytes, bit i for word i, little-endian
+'''
+
+import os
+import mmap
+import struct
+import string
+from pathlib import Path
+from collections import defaultdict
+
+
+MAGIC = b'XDWORDS1'
+HEADER = struct.Struct('<8sI')
+ENTRY = struct.Struct('<QQQ')
+LETTERS = frozenset(string.ascii_uppercase)
+
+
+def wordlist_path():
+    'Return $XDWORDS, else the .words file next to $XDDB.'
+    return os.getenv('XDWORDS') or str(Path(os.getenv('XDDB', 'xd.db')).with_suffix('.words'))
+
+
+def first_bits(m, limit):
+    'Return the positions of the lowest *limit* bits set in int *m*.'
+    r = []
+    while m and len(r) < limit:
+        low = m & -m
+        r.append(low.bit_length()-1)
+        m ^= low
+    return r
+
+
+def write_wordlist(path, counts):
+    '''Write the words of *counts* ({word: times used}) that are all A-Z to *path*,
+    commonest first, replacing it at once so players mapping the old one are not disturbed.'''
+    bylen = defaultdict(list)
+    for word, n in counts.items():
+        if word and LETTERS.issuperset(word):
+            bylen[len(word)].append((-n, word))
+    maxlen = max(bylen, default=0)
+
+    blocks = []
+    entries = []
+    offset = HEADER.size + ENTRY.size*(maxlen+1)
+    for length in range(maxlen+1):
+        words = [word for n, word in sorted(bylen.get(length, []))]
+        nbytes = (len(words)+7)//8
+        bitsets = [bytearray(nbytes) for i in range(length*26)]
+        for i, word in enumerate(words):
+            byte, bit = i >> 3, 1 << (i & 7)
+            for pos, ch in enumerate(word):
+                bitsets[pos*26 + ord(ch)-65][byte] |= bit
+        wordsdata = ''.join(words).encode('ascii')
+        entries.append((len(words), offset, offset+len(wordsdata)))
+        blocks.append(wordsdata)
+        blocks.extend(bitsets)
+        offset += len(wordsdata) + nbytes*len(bitsets)
+
+    tmppath = f'{path}.tmp{os.getpid()}'
+    with open(tmppath, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, maxlen))
+        for entry in entries:
+            fp.write(ENTRY.pack(*entry))
+        fp.writelines(blocks)
+    os.replace(tmppath, path)
+
+
+class WordList:
+    'The word list in *path*, memory-mapped.'
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, maxlen = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a word list')
+        self.lengths = [ENTRY.unpack_from(self.mm, HEADER.size + ENTRY.size*n) for n in range(maxlen+1)]  # (count, words offset, bitsets offset)
+
+    def __len__(self):
+        return sum(count for count, wordsoff, bitsoff in self.lengths)
+
+    def count(self, length):
+        'Return the number of words of *length*.'
+        return self.lengths[length][0] if length < len(self.lengths) else 0
+
+    def bitset(self, length, pos, letter):
+        'Return the bitset of the words of *length* with *letter* (0 for A to 25 for Z) at *pos*, as an int; 0 if there are no words that long.'
+        if length >= len(self.lengths):
+            return 0
+        count, wordsoff, bitsoff = self.lengths[length]
+        nbytes = (count+7)//8
+        off = bitsoff + (pos*26 + letter)*nbytes
+        return int.from_bytes(self.mm[off:off+nbytes], 'little')
+
+    def word(self, length, i):
+        'Return word *i* of *length*.'
+        wordsoff = self.lengths[length][1]
+        return self.mm[wordsoff+i*length:wordsoff+(i+1)*length].decode('ascii')
+
+    def match(self, pattern, limit=20):
+        'Return up to *limit* words matching *pattern* (a string or list of cells), commonest first; anything but A-Z matches any letter.'
+        length = len(pattern)
+        if not self.count(length):
+            return []
+
+        m = None
+        for pos, ch in enumerate(pattern):
+            if ch in LETTERS:
+                bits = self.bitset(length, pos, ord(ch)-65)
+                m = bits if m is None else m & bits
+                if not m:
+                    return []
+
+        indexes = range(min(self.count(length), limit)) if m is None else first_bits(m, limit)
+        return [self.word(length, i) for i in indexes]
+
+    def close(self):
+        self.mm.close()